@@ -6,42 +6,111 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+
+def rate_limits_from_env(prefix):
+    # e.g. GPT4O_RPM=500 GPT4O_TPM=30000, unset means unlimited
+    limits = {
+        "requests_per_minute": os.getenv(f"{prefix}_RPM"),
+        "tokens_per_minute": os.getenv(f"{prefix}_TPM"),
+    }
+    return {key: int(value) for key, value in limits.items() if value}
+
+
+def prices_from_env(prefix, input_price=None, output_price=None):
+    # USD per million prompt / completion tokens, list prices unless overridden,
+    # e.g. GPT4O_INPUT_PRICE=1.25 GPT4O_OUTPUT_PRICE=5
+    prices = {
+        "input": os.getenv(f"{prefix}_INPUT_PRICE", input_price),
+        "output": os.getenv(f"{prefix}_OUTPUT_PRICE", output_price),
+    }
+    return {key: float(value) for key, value in prices.items() if value is not None}
+
+
+def api_base_from_env(name):
+    # replicas of a self-hosted deployment are comma separated,
+    # e.g. QWEN2_API_BASE_URL=http://node1:8000/v1,http://node2:8000/v1
+    value = os.getenv(name)
+    if not value or "," not in value:
+        return value
+    return [url.strip() for url in value.split(",") if url.strip()]
+
+
+def http_client_from_env():
+    # pool and timeout settings of the HTTP client shared per api_base,
+    # e.g. HTTP_MAX_CONNECTIONS=128 HTTP_READ_TIMEOUT=120 HTTP2=1
+    settings = {
+        "max_connections": os.getenv("HTTP_MAX_CONNECTIONS"),
+        "max_keepalive_connections": os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS"),
+        "keepalive_expiry": os.getenv("HTTP_KEEPALIVE_EXPIRY"),
+        "connect_timeout": os.getenv("HTTP_CONNECT_TIMEOUT"),
+        "read_timeout": os.getenv("HTTP_READ_TIMEOUT"),
+    }
+    settings = {key: float(value) for key, value in settings.items() if value}
+    for key in ("max_connections", "max_keepalive_connections"):
+        if key in settings:
+            settings[key] = int(settings[key])
+    if os.getenv("HTTP2"):
+        settings["http2"] = os.getenv("HTTP2").lower() in ("1", "true", "yes")
+    return settings
+
+
+# defaults for every model, a model config may override them with "http_client"
+HTTP_CLIENT_CONFIG = http_client_from_env()
+
 MODEL_CONFIGS = {
     "qwen2": {
         "model_name": "Qwen2.5-72B-Instruct",
-        "api_base": os.getenv("QWEN2_API_BASE_URL"),
+        "api_base": api_base_from_env("QWEN2_API_BASE_URL"),
+        "rate_limits": rate_limits_from_env("QWEN2"),
+        "prices": prices_from_env("QWEN2"),
     },
     "minicpm": {
         "model_name": "openbmb/MiniCPM-V-2_6",
-        "api_base": os.getenv("MINICPM_API_BASE_URL"),
+        "api_base": api_base_from_env("MINICPM_API_BASE_URL"),
+        "rate_limits": rate_limits_from_env("MINICPM"),
+        "prices": prices_from_env("MINICPM"),
     },
     "phi35": {
         "model_name": "Phi-3.5-vision-instruct",
-        "api_base": os.getenv("PHI35_API_BASE_URL"),
+        "api_base": api_base_from_env("PHI35_API_BASE_URL"),
+        "rate_limits": rate_limits_from_env("PHI35"),
+        "prices": prices_from_env("PHI35"),
     },
     "mllama": {
         "model_name": "Llama-3.2-11B-Vision-Instruct",
-        "api_base": os.getenv("MLAMA_API_BASE_URL"),
+        "api_base": api_base_from_env("MLAMA_API_BASE_URL"),
+        "rate_limits": rate_limits_from_env("MLAMA"),
+        "prices": prices_from_env("MLAMA"),
     },
     "pixtral": {
         "model_name": "Pixtral-12B-2409",
-        "api_base": os.getenv("PIXTRAL_API_BASE_URL"),
+        "api_base": api_base_from_env("PIXTRAL_API_BASE_URL"),
+        "rate_limits": rate_limits_from_env("PIXTRAL"),
+        "prices": prices_from_env("PIXTRAL"),
     },
     "gpt4v": {
         "model_name": "gpt-4o-2024-11-20",
         "api_base": os.getenv("GPT4V_API_BASE_URL"),
+        "rate_limits": rate_limits_from_env("GPT4V"),
+        "prices": prices_from_env("GPT4V", 2.50, 10.00),
     },
     "gpt4o": {
         "model_name": "gpt-4o-2024-11-20",
         "api_base": os.getenv("GPT4O_API_BASE_URL"),
+        "rate_limits": rate_limits_from_env("GPT4O"),
+        "prices": prices_from_env("GPT4O", 2.50, 10.00),
     },
     "gpt-o3-mini": {
         "model_name": "o3-mini",
         "api_base": os.getenv("GPT_O3_MINI_API_BASE_URL"),
+        "rate_limits": rate_limits_from_env("GPT_O3_MINI"),
+        "prices": prices_from_env("GPT_O3_MINI", 1.10, 4.40),
     },
     "dsv3": {
         "model_name": "deepseek-chat",
         "api_base": os.getenv("DSV3_API_BASE_URL", "https://api.deepseek.com/v1"),
+        "rate_limits": rate_limits_from_env("DSV3"),
+        "prices": prices_from_env("DSV3", 0.27, 1.10),
     },
     "flash2v": {
         "model_name": "gemini-2.0-flash",
@@ -49,6 +118,8 @@ MODEL_CONFIGS = {
             "FLASH2V_API_BASE_URL",
             "https://generativelanguage.googleapis.com/v1beta/openai",
         ),
+        "rate_limits": rate_limits_from_env("FLASH2V"),
+        "prices": prices_from_env("FLASH2V", 0.10, 0.40),
     },
     "flash2": {
         "model_name": "gemini-2.0-flash",
@@ -56,14 +127,20 @@ MODEL_CONFIGS = {
             "FLASH2_API_BASE_URL",
             "https://generativelanguage.googleapis.com/v1beta/openai",
         ),
+        "rate_limits": rate_limits_from_env("FLASH2"),
+        "prices": prices_from_env("FLASH2", 0.10, 0.40),
     },
     "claude35": {
         "model_name": "claude-3-5-sonnet-20241022",
         "api_base": os.getenv("CLAUDE35_API_BASE_URL", "https://api.anthropic.com/v1"),
+        "rate_limits": rate_limits_from_env("CLAUDE35"),
+        "prices": prices_from_env("CLAUDE35", 3.00, 15.00),
     },
     "claude37": {
         "model_name": "claude-3-7-sonnet-20250219",
         "api_base": os.getenv("CLAUDE37_API_BASE_URL", "https://api.anthropic.com/v1"),
+        "rate_limits": rate_limits_from_env("CLAUDE37"),
+        "prices": prices_from_env("CLAUDE37", 3.00, 15.00),
     },
     "mistral-large": {
         "model_name": "mistral-large-latest",
@@ -71,9 +148,13 @@ MODEL_CONFIGS = {
             "MISTRAL_LARGE_API_BASE_URL",
             "https://api.mistral.ai/v1",
         ),
+        "rate_limits": rate_limits_from_env("MISTRAL_LARGE"),
+        "prices": prices_from_env("MISTRAL_LARGE", 2.00, 6.00),
     },
     "gemma3-27b": {
         "model_name": "google/gemma-3-27b-it",
-        "api_base": os.getenv("GEMMA3_27B_API_BASE_URL"),
+        "api_base": api_base_from_env("GEMMA3_27B_API_BASE_URL"),
+        "rate_limits": rate_limits_from_env("GEMMA3_27B"),
+        "prices": prices_from_env("GEMMA3_27B"),
     },
 }
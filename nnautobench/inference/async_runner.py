@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import itertools
+import logging
+import time
+import weakref
+
+from tqdm import tqdm
+
+from nnautobench.inference.postprocess import log_stage_summary
+from nnautobench.inference.postprocess import score_prediction
+from nnautobench.inference.postprocess import StageStats
+
+logger = logging.getLogger(__name__)
+
+# one semaphore per provider endpoint and event loop, shared by every predictor
+# hitting that endpoint
+_provider_semaphores = weakref.WeakKeyDictionary()
+
+
+def get_provider_semaphore(api_base, max_concurrency):
+    semaphores = _provider_semaphores.setdefault(asyncio.get_running_loop(), {})
+    if api_base not in semaphores:
+        semaphores[api_base] = asyncio.Semaphore(max_concurrency)
+    return semaphores[api_base]
+
+
+async def _run_predictions(
+    predictor,
+    tasks,
+    max_concurrency,
+    on_result,
+    total,
+    pool,
+    postprocess_workers,
+):
+    semaphore = get_provider_semaphore(predictor.model.api_base, max_concurrency)
+    # answers queued for the process pool, rows waiting here hold no API slot
+    scoring_slots = asyncio.Semaphore(2 * max(postprocess_workers, 1))
+    api_stage = StageStats("api", max_concurrency)
+    score_stage = StageStats("postprocess", postprocess_workers)
+    loop = asyncio.get_running_loop()
+
+    async def run_task(task):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                prediction = await predictor.apredict_row(**task)
+            finally:
+                api_stage.record(time.perf_counter() - start)
+        if pool is None:
+            return predictor.build_result(**prediction)
+        async with scoring_slots:
+            scores = await loop.run_in_executor(
+                pool,
+                score_prediction,
+                *predictor.score_args(prediction),
+            )
+        score_stage.record(scores["seconds"])
+        return predictor.build_result(**prediction, scores=scores)
+
+    tasks = iter(tasks)
+    pending = set()
+    try:
+        with tqdm(total=total, desc="Processing images") as progress:
+            while True:
+                for task in itertools.islice(
+                    tasks,
+                    2 * max_concurrency - len(pending),
+                ):
+                    pending.add(asyncio.ensure_future(run_task(task)))
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(
+                    pending,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for future in done:
+                    progress.update()
+                    try:
+                        on_result(future.result())
+                    except Exception as exc:
+                        logger.error(
+                            f"Image generated an exception: {exc}",
+                            exc_info=True,
+                        )
+    finally:
+        for future in pending:
+            future.cancel()
+    log_stage_summary([api_stage, score_stage] if pool is not None else [api_stage])
+
+
+def run_predictions_async(
+    predictor,
+    tasks,
+    max_concurrency,
+    on_result,
+    total=None,
+    postprocess_workers=0,
+):
+    """Run ``predictor.aprocess_single_image`` for every task on an event loop.
+
+    At most ``max_concurrency`` rows are in flight per provider ``api_base``,
+    ``tasks`` is consumed lazily with a bounded window of pending rows, and
+    ``on_result`` is called with each result as soon as it completes.
+
+    With ``postprocess_workers``, answers are parsed and scored in a process
+    pool instead of on the event loop, at most ``2 * postprocess_workers`` at
+    a time.
+    """
+    pool = (
+        concurrent.futures.ProcessPoolExecutor(max_workers=postprocess_workers)
+        if postprocess_workers
+        else None
+    )
+    try:
+        asyncio.run(
+            _run_predictions(
+                predictor,
+                tasks,
+                max_concurrency,
+                on_result,
+                total,
+                pool,
+                postprocess_workers,
+            ),
+        )
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import random
+import time
+
+from openai.types.chat import ChatCompletion
+from tqdm import tqdm
+
+from nnautobench.utils.common_utils import get_row_key
+from nnautobench.utils.mock_transport import count_mock_tokens
+from nnautobench.utils.mock_transport import mock_logprobs
+from nnautobench.utils.prompt_utils import parse_fields
+from nnautobench.utils.token_budget import estimate_prompt_tokens
+
+logger = logging.getLogger(__name__)
+
+BATCH_URL = "/v1/chat/completions"
+
+# these methods send a second request per row, which a batch file cannot carry
+UNBATCHABLE_CONF_SCORE_METHODS = ("prob", "yes_no")
+
+
+def _task_custom_id(task):
+    return get_row_key(task["image_path"], task["keys"], task["ctx"])
+
+
+def check_batchable(conf_score_method):
+    if conf_score_method in UNBATCHABLE_CONF_SCORE_METHODS:
+        raise ValueError(
+            f"conf_score_method {conf_score_method} needs a second request per row "
+            "and cannot run in batch mode, use consistency or logprob",
+        )
+
+
+def export_batch_requests(predictor, tasks, path):
+    """Write the prediction request of every task as provider batch JSONL.
+
+    Each line carries the task's row key as ``custom_id``, so the returned
+    results can be matched back to the input rows in any order.
+    """
+    check_batchable(predictor.conf_score_method)
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    seen = set()
+    with open(path, "w", encoding="utf-8") as f:
+        for task in tqdm(tasks, desc="Exporting batch requests"):
+            custom_id = _task_custom_id(task)
+            if custom_id in seen:
+                logger.warning(f"Skipping duplicate row {task['image_path']}")
+                continue
+            seen.add(custom_id)
+            messages, _ = predictor.prepare_messages(
+                task["image_path"],
+                task["few_shot"],
+                task["ctx"],
+                task["input_text"],
+                task["keys"],
+                task["layout"],
+            )
+            request = {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": BATCH_URL,
+                "body": predictor.model.batch_request_body(
+                    messages,
+                    predictor.conf_score_method,
+                ),
+            }
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+    return len(seen)
+
+
+def load_batch_results(path):
+    """Map ``custom_id`` to the ``ChatCompletion`` of every successful line."""
+    responses = {}
+    failed = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get("response") or {}
+            if result.get("error") or response.get("status_code") != 200:
+                failed += 1
+                logger.error(
+                    f"Batch request {result.get('custom_id')} failed: "
+                    f"{result.get('error') or response.get('body')}",
+                )
+                continue
+            responses[result["custom_id"]] = ChatCompletion.model_validate(
+                response["body"],
+            )
+    logger.info(f"Loaded {len(responses)} batch results, {failed} failed")
+    return responses
+
+
+def ingest_batch_results(predictor, tasks, responses, on_result):
+    """Score batch responses through the same pipeline as live predictions.
+
+    Returns the number of tasks that had no successful response.
+    """
+    check_batchable(predictor.conf_score_method)
+    missing = 0
+    for task in tqdm(tasks, desc="Ingesting batch results"):
+        response = responses.get(_task_custom_id(task))
+        if response is None:
+            missing += 1
+            continue
+        try:
+            on_result(predictor.process_batch_response(response, **task))
+        except Exception as exc:
+            logger.error(f"Error processing {task['image_path']}: {exc}")
+    if missing:
+        logger.warning(f"{missing} rows have no batch result")
+    return missing
+
+
+def write_fake_batch_results(request_path, tasks, output_path):
+    """Answer a batch request file offline by replaying the annotations.
+
+    Stands in for a provider so the export / ingest loop can run without
+    network access. Responses carry logprobs when requested and token usage
+    like the mock transport's, so confidence scores and spend are covered.
+    """
+    rng = random.Random()
+    answers = {}
+    for task in tasks:
+        fields = task["annotation"].get("fields", {})
+        answers[_task_custom_id(task)] = {
+            field: fields.get(field, {"value": ""})
+            for field in parse_fields(task["keys"])
+        }
+
+    written = 0
+    with open(request_path, encoding="utf-8") as requests, open(
+        output_path,
+        "w",
+        encoding="utf-8",
+    ) as results:
+        for line in requests:
+            request = json.loads(line)
+            custom_id = request["custom_id"]
+            if custom_id not in answers:
+                result = {
+                    "id": f"batch_req_{written}",
+                    "custom_id": custom_id,
+                    "response": None,
+                    "error": {"code": "not_found", "message": "Unknown row"},
+                }
+            else:
+                content = json.dumps(answers[custom_id], ensure_ascii=False)
+                body = request["body"]
+                choices = []
+                for i in range(body.get("n") or 1):
+                    choice = {
+                        "index": i,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": content},
+                    }
+                    if body.get("logprobs"):
+                        choice["logprobs"] = mock_logprobs(
+                            content,
+                            body.get("top_logprobs") or 1,
+                            rng,
+                        )
+                    choices.append(choice)
+                prompt_tokens = estimate_prompt_tokens(body["messages"])
+                completion_tokens = count_mock_tokens(content) * len(choices)
+                result = {
+                    "id": f"batch_req_{written}",
+                    "custom_id": custom_id,
+                    "response": {
+                        "status_code": 200,
+                        "request_id": f"fake-{custom_id}",
+                        "body": {
+                            "id": f"chatcmpl-{custom_id}",
+                            "object": "chat.completion",
+                            "created": int(time.time()),
+                            "model": body["model"],
+                            "choices": choices,
+                            "usage": {
+                                "prompt_tokens": prompt_tokens,
+                                "completion_tokens": completion_tokens,
+                                "total_tokens": prompt_tokens + completion_tokens,
+                            },
+                        },
+                    },
+                    "error": None,
+                }
+            results.write(json.dumps(result, ensure_ascii=False) + "\n")
+            written += 1
+    return written
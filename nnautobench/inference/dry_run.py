@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import heapq
+import json
+import logging
+import sys
+import time
+
+from tqdm import tqdm
+
+from nnautobench.utils.image_utils import get_image_payload_bytes
+from nnautobench.utils.request_stats import collect_request_stats
+from nnautobench.utils.request_stats import time_phase
+from nnautobench.utils.token_budget import estimate_prompt_tokens
+
+logger = logging.getLogger(__name__)
+
+# rows listed at the end of a dry run, to spot oversized prompts
+LARGEST_PROMPTS = 5
+
+
+def peak_memory_bytes():
+    # resource is Unix-only, peak memory is not reported on Windows
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _stats(values):
+    values = sorted(values)
+    if not values:
+        return {"total": 0, "mean": None, "p95": None, "max": None}
+    return {
+        "total": sum(values),
+        "mean": sum(values) / len(values),
+        "p95": values[int(0.95 * (len(values) - 1))],
+        "max": values[-1],
+    }
+
+
+def run_dry_run(predictor, tasks, total=None, prices=None):
+    """Build the prediction request of every task without sending it.
+
+    Goes through few-shot selection, ``create_prompt`` and image encoding
+    exactly as a run would, then serializes the request body. Returns the
+    estimated prompt tokens and payload bytes of the requests, how fast they
+    were built and the peak memory of the process.
+    """
+    rows = []
+    failed = 0
+    for task in tqdm(tasks, total=total, desc="Building prompts"):
+        try:
+            with collect_request_stats() as stats:
+                with time_phase("prompt_build"):
+                    messages, _ = predictor.prepare_messages(
+                        task["image_path"],
+                        task["few_shot"],
+                        task["ctx"],
+                        task["input_text"],
+                        task["keys"],
+                        task["layout"],
+                    )
+            start = time.perf_counter()
+            body = predictor.model.batch_request_body(
+                messages,
+                predictor.conf_score_method,
+            )
+            payload_bytes = len(json.dumps(body, ensure_ascii=False).encode())
+            serialize_seconds = time.perf_counter() - start
+        except Exception as exc:
+            failed += 1
+            logger.error(f"Could not build the prompt of {task['image_path']}: {exc}")
+            continue
+        rows.append(
+            {
+                "image_path": task["image_path"],
+                "prompt_tokens": estimate_prompt_tokens(messages),
+                "payload_bytes": payload_bytes,
+                "image_bytes": get_image_payload_bytes(messages),
+                "build_seconds": stats["timings"]["prompt_build"],
+                "encode_seconds": stats["timings"]["encode"],
+                "serialize_seconds": serialize_seconds,
+            },
+        )
+    seconds = {
+        phase: sum(row[f"{phase}_seconds"] for row in rows)
+        for phase in ("build", "encode", "serialize")
+    }
+    # the token estimate is left out, a real run only prepares and sends
+    prepare_seconds = sum(seconds.values())
+
+    prompt_tokens = _stats(row["prompt_tokens"] for row in rows)
+    payload_bytes = _stats(row["payload_bytes"] for row in rows)
+    summary = {
+        "rows": len(rows),
+        "failed_rows": failed,
+        "prompts_per_second": (
+            len(rows) / prepare_seconds if prepare_seconds > 0 else None
+        ),
+        **{f"{phase}_seconds": value for phase, value in seconds.items()},
+        **{f"prompt_tokens_{key}": value for key, value in prompt_tokens.items()},
+        **{f"payload_bytes_{key}": value for key, value in payload_bytes.items()},
+        "image_bytes_total": sum(row["image_bytes"] for row in rows),
+        "peak_memory_bytes": peak_memory_bytes(),
+        "estimated_prompt_cost_usd": (
+            prompt_tokens["total"] * prices.get("input", 0.0) / 1e6 if prices else None
+        ),
+    }
+    _log_dry_run(
+        summary,
+        heapq.nlargest(LARGEST_PROMPTS, rows, key=lambda row: row["prompt_tokens"]),
+    )
+    return summary
+
+
+def _log_dry_run(summary, largest_rows):
+    logger.info(
+        f"Dry run: {summary['rows']} prompts built "
+        f"({summary['prompts_per_second'] or 0:.1f}/s: "
+        f"{summary['build_seconds']:.2f}s building prompts, "
+        f"{summary['encode_seconds']:.2f}s encoding images, "
+        f"{summary['serialize_seconds']:.2f}s serializing requests), "
+        f"{summary['failed_rows']} failed",
+    )
+    if not summary["rows"]:
+        return
+    logger.info(
+        f"Estimated prompt tokens: {summary['prompt_tokens_total']} total, "
+        f"mean {summary['prompt_tokens_mean']:.0f}, "
+        f"p95 {summary['prompt_tokens_p95']}, max {summary['prompt_tokens_max']}",
+    )
+    logger.info(
+        f"Request payload: {summary['payload_bytes_total'] / 1024**2:.1f} MB total, "
+        f"mean {summary['payload_bytes_mean'] / 1024:.1f} KB, "
+        f"p95 {summary['payload_bytes_p95'] / 1024:.1f} KB, "
+        f"max {summary['payload_bytes_max'] / 1024:.1f} KB "
+        f"({summary['image_bytes_total'] / 1024**2:.1f} MB of images)",
+    )
+    if summary["estimated_prompt_cost_usd"] is not None:
+        logger.info(
+            f"Estimated prompt cost: ${summary['estimated_prompt_cost_usd']:.4f} "
+            f"for the first request of every row",
+        )
+    if summary["peak_memory_bytes"] is not None:
+        logger.info(f"Peak memory: {summary['peak_memory_bytes'] / 1024**2:.0f} MB")
+    logger.info("Largest prompts:")
+    for row in largest_rows:
+        logger.info(
+            f"  {row['prompt_tokens']:>8} tokens {row['payload_bytes'] / 1024:9.1f} KB "
+            f"{row['image_path']}",
+        )
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+
+from nnautobench.utils.conf_score_prompts import (
+    compute_conf_score_approval_and_precision,
+)
+from nnautobench.utils.metrics import calculate_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def score_prediction(post_process, content, annotation, keys, conf_score):
+    """Parse a model answer and score it against the annotation.
+
+    The CPU-bound part of a row: JSON repair, field metrics and confidence
+    approval. Only takes picklable arguments so it can run in a process pool.
+    """
+    start = time.perf_counter()
+    try:
+        preds, is_parsable = post_process(content)
+    except json.JSONDecodeError:
+        preds = {}
+        is_parsable = False
+    parsed = time.perf_counter()
+    metrics = calculate_metrics(annotation, preds, keys)
+    metrics["pred"] = preds
+
+    correct_approved = incorrect_approved = None
+    if conf_score is not None:
+        # normalized in place to floats, returned since a pool worker's copy is lost
+        (
+            correct_approved,
+            incorrect_approved,
+        ) = compute_conf_score_approval_and_precision(
+            conf_score,
+            annotation,
+            preds,
+        )
+    return {
+        "is_parsable": is_parsable,
+        "metrics": metrics,
+        "correct_approved": correct_approved,
+        "incorrect_approved": incorrect_approved,
+        "conf_score": conf_score,
+        "seconds": time.perf_counter() - start,
+        "parse_seconds": parsed - start,
+    }
+
+
+class StageStats:
+    """Busy time of one pipeline stage, to report how saturated its workers are."""
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.items += 1
+            self.busy += seconds
+
+    def summary(self):
+        elapsed = time.perf_counter() - self._start
+        return {
+            "name": self.name,
+            "workers": self.workers,
+            "items": self.items,
+            "avg_seconds": self.busy / self.items if self.items else 0.0,
+            "utilization": (
+                self.busy / (self.workers * elapsed) if elapsed > 0 else 0.0
+            ),
+        }
+
+
+def log_stage_summary(stages):
+    for stage in stages:
+        summary = stage.summary()
+        logger.info(
+            f"Stage {summary['name']}: {summary['items']} rows on "
+            f"{summary['workers']} workers, {summary['avg_seconds'] * 1000:.1f}ms "
+            f"per row, utilization {summary['utilization']:.2%}",
+        )
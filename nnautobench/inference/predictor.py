@@ -1,35 +1,79 @@
 from __future__ import annotations
 
-import ast
-import json
+import asyncio
 import logging
+import os
 from time import time
 
-from nnautobench.utils.conf_score_prompts import (
-    compute_conf_score_approval_and_precision,
-)
-from nnautobench.utils.metrics import calculate_metrics
+from nnautobench.inference.postprocess import score_prediction
+from nnautobench.inference.shared_prompts import prompt_family
+from nnautobench.utils.common_utils import get_row_key
+from nnautobench.utils.image_utils import get_image_payload_bytes
 from nnautobench.utils.prompt_utils import get_prompt_string
+from nnautobench.utils.prompt_utils import parse_fields
+from nnautobench.utils.request_stats import collect_request_stats
+from nnautobench.utils.request_stats import PHASES
+from nnautobench.utils.request_stats import row_context
+from nnautobench.utils.request_stats import time_phase
 
 logger = logging.getLogger(__name__)
 
 
+def _original_image_bytes(image_path, ctx):
+    image_paths = [image_path] if isinstance(image_path, str) else list(image_path)
+    image_paths += [example["image_path"] for example in ctx]
+    return sum(os.path.getsize(path) for path in image_paths)
+
+
 class Predictor:
-    def __init__(self, model, conf_score_method="prob"):
+    def __init__(self, model, conf_score_method="prob", prompt_cache=None):
         self.model = model
         self.conf_score_method = conf_score_method
+        # optional SharedPromptCache when several models run on the same rows
+        self.prompt_cache = prompt_cache
 
-    def process_single_image(
+    def prepare_messages(
         self,
         image_path,
-        annotation,
         few_shot=0,
         ctx=[],
         input_text=None,
         keys=None,
         layout="vision_default",
     ):
+        if self.prompt_cache is None:
+            return self._build_messages(
+                image_path,
+                few_shot,
+                ctx,
+                input_text,
+                keys,
+                layout,
+            )
+        messages, actual_few_shot = self.prompt_cache.get_or_build(
+            prompt_family(type(self.model)),
+            get_row_key(image_path, keys, ctx),
+            lambda: self._build_messages(
+                image_path,
+                few_shot,
+                ctx,
+                input_text,
+                keys,
+                layout,
+            ),
+        )
+        # confidence requests append to the list they are given
+        return list(messages), actual_few_shot
 
+    def _build_messages(
+        self,
+        image_path,
+        few_shot=0,
+        ctx=[],
+        input_text=None,
+        keys=None,
+        layout="vision_default",
+    ):
         if isinstance(image_path, str):
             image_paths = [image_path]
         else:
@@ -52,56 +96,72 @@ class Predictor:
             else:
                 actual_few_shot = 0
 
-        if actual_few_shot == 0:
-            messages = self.model.create_prompt(
-                keys,
-                descriptions={},
-                image_paths=image_paths,
-                ctx=[],
-                input_text=input_text,
-                layout=layout,
-            )
-        else:
-            messages = self.model.create_prompt(
-                keys,
-                descriptions={},
-                image_paths=image_paths,
-                ctx=ctx[:actual_few_shot],
-                input_text=input_text,
-                layout=layout,
-            )
+        messages = self.model.create_prompt(
+            keys,
+            descriptions={},
+            image_paths=image_paths,
+            ctx=ctx[:actual_few_shot],
+            input_text=input_text,
+            layout=layout,
+        )
+        return messages, actual_few_shot
 
-        start_time = time()
-        content, usage, conf_score = self.model.predict(
-            messages,
-            self.conf_score_method,
+    def score_args(self, prediction):
+        """Arguments of ``score_prediction`` for a row returned by ``predict_row``."""
+        return (
+            type(self.model).post_process,
+            prediction["content"],
+            prediction["annotation"],
+            prediction["keys"],
+            prediction["conf_score"],
+        )
+
+    def build_result(
+        self,
+        image_path,
+        annotation,
+        ctx,
+        keys,
+        layout,
+        messages,
+        actual_few_shot,
+        content,
+        usage,
+        conf_score,
+        time_taken,
+        stats=None,
+        scores=None,
+    ):
+        if scores is None:
+            try:
+                scores = score_prediction(
+                    self.model.post_process,
+                    content,
+                    annotation,
+                    keys,
+                    conf_score,
+                )
+            except Exception as e:
+                print(e)
+                print("image path", image_path)
+                raise
+
+        stats = dict(stats or {})
+        timings = dict(stats.pop("timings", None) or dict.fromkeys(PHASES, 0.0))
+        timings["parse"] += scores["parse_seconds"]
+        timings["score"] += scores["seconds"] - scores["parse_seconds"]
+
+        # only vision prompts carry images, text prompts report zero
+        image_bytes_sent = get_image_payload_bytes(messages)
+        image_bytes_original = (
+            _original_image_bytes(image_path, ctx[:actual_few_shot])
+            if image_bytes_sent
+            else 0
         )
-        end_time = time()
-        try:
-            preds, is_parsable = self.model.post_process(content)
-
-        except json.JSONDecodeError:
-            preds = {}
-            is_parsable = False
-        except Exception as e:
-            print(e)
-            print("image path", image_path)
-            raise
-        metrics = calculate_metrics(annotation, preds, keys)
-        metrics["pred"] = preds
-
-        if conf_score is not None:
-            (
-                correct_approved,
-                incorrect_approved,
-            ) = compute_conf_score_approval_and_precision(
-                conf_score,
-                annotation,
-                preds,
-            )
 
         return {
-            "time_taken": end_time - start_time,
+            "row_key": get_row_key(image_path, keys, ctx),
+            "time_taken": time_taken,
             "usage": usage,
             "path": image_path,
             "layout": layout,
@@ -113,11 +173,202 @@ class Predictor:
             "ctx_1_accepted": ctx[0]["accepted"] if actual_few_shot > 0 else {},
             "content": content,
             "actual_few_shot": actual_few_shot,
-            "parsing_accuracy": int(is_parsable),
-            "predicted_field_conf_scores": conf_score,
-            "total_fields": len(ast.literal_eval(keys)),
-            "queried_labels": ast.literal_eval(keys),
-            "correct_approved": correct_approved,
-            "incorrect_approved": incorrect_approved,
-            **metrics,
+            "parsing_accuracy": int(scores["is_parsable"]),
+            "predicted_field_conf_scores": scores["conf_score"],
+            "total_fields": len(parse_fields(keys)),
+            "queried_labels": list(parse_fields(keys)),
+            "correct_approved": scores["correct_approved"],
+            "incorrect_approved": scores["incorrect_approved"],
+            "image_bytes_original": image_bytes_original,
+            "image_bytes_sent": image_bytes_sent,
+            **scores["metrics"],
+            # seconds spent in each phase of the row, see request_stats.PHASES
+            "timings": timings,
+            # answered at least in part from the response cache, so its
+            # timings say nothing about the model
+            "cached": "cached_requests" in stats,
+            # stats recorded by the model while answering this row
+            **stats,
         }
+
+    def _timed_prepare_messages(self, *args):
+        with time_phase("prompt_build"):
+            return self.prepare_messages(*args)
+
+    def predict_row(
+        self,
+        image_path,
+        annotation,
+        few_shot=0,
+        ctx=[],
+        input_text=None,
+        keys=None,
+        layout="vision_default",
+    ):
+        """Network stage of a row: the model's answer, not parsed or scored yet.
+
+        Returns the keyword arguments of ``build_result``.
+        """
+        with row_context(
+            annotation=annotation,
+            keys=keys,
+        ), collect_request_stats() as stats:
+            messages, actual_few_shot = self._timed_prepare_messages(
+                image_path,
+                few_shot,
+                ctx,
+                input_text,
+                keys,
+                layout,
+            )
+
+            start_time = time()
+            content, usage, conf_score = self.model.predict(
+                messages,
+                self.conf_score_method,
+            )
+            end_time = time()
+        return dict(
+            image_path=image_path,
+            annotation=annotation,
+            ctx=ctx,
+            keys=keys,
+            layout=layout,
+            messages=messages,
+            actual_few_shot=actual_few_shot,
+            content=content,
+            usage=usage,
+            conf_score=conf_score,
+            time_taken=end_time - start_time,
+            stats=stats,
+        )
+
+    async def apredict_row(
+        self,
+        image_path,
+        annotation,
+        few_shot=0,
+        ctx=[],
+        input_text=None,
+        keys=None,
+        layout="vision_default",
+    ):
+        with row_context(
+            annotation=annotation,
+            keys=keys,
+        ), collect_request_stats() as stats:
+            # image reads and encoding would block every request in flight;
+            # to_thread runs in a copy of the context, so the phase timings
+            # still go to this row's stats
+            messages, actual_few_shot = await asyncio.to_thread(
+                self._timed_prepare_messages,
+                image_path,
+                few_shot,
+                ctx,
+                input_text,
+                keys,
+                layout,
+            )
+
+            start_time = time()
+            content, usage, conf_score = await self.model.apredict(
+                messages,
+                self.conf_score_method,
+            )
+            end_time = time()
+        return dict(
+            image_path=image_path,
+            annotation=annotation,
+            ctx=ctx,
+            keys=keys,
+            layout=layout,
+            messages=messages,
+            actual_few_shot=actual_few_shot,
+            content=content,
+            usage=usage,
+            conf_score=conf_score,
+            time_taken=end_time - start_time,
+            stats=stats,
+        )
+
+    def process_single_image(
+        self,
+        image_path,
+        annotation,
+        few_shot=0,
+        ctx=[],
+        input_text=None,
+        keys=None,
+        layout="vision_default",
+    ):
+        prediction = self.predict_row(
+            image_path,
+            annotation,
+            few_shot,
+            ctx,
+            input_text,
+            keys,
+            layout,
+        )
+        return self.build_result(**prediction)
+
+    async def aprocess_single_image(
+        self,
+        image_path,
+        annotation,
+        few_shot=0,
+        ctx=[],
+        input_text=None,
+        keys=None,
+        layout="vision_default",
+    ):
+        prediction = await self.apredict_row(
+            image_path,
+            annotation,
+            few_shot,
+            ctx,
+            input_text,
+            keys,
+            layout,
+        )
+        return self.build_result(**prediction)
+
+    def process_batch_response(
+        self,
+        response,
+        image_path,
+        annotation,
+        few_shot=0,
+        ctx=[],
+        input_text=None,
+        keys=None,
+        layout="vision_default",
+    ):
+        # a response returned by a provider batch API, so there is no latency
+        messages, actual_few_shot = self.prepare_messages(
+            image_path,
+            few_shot,
+            ctx,
+            input_text,
+            keys,
+            layout,
+        )
+        content, usage, conf_score = self.model.score_choices(
+            messages,
+            response.choices,
+            response.usage.dict(),
+            self.conf_score_method,
+        )
+        return self.build_result(
+            image_path,
+            annotation,
+            ctx,
+            keys,
+            layout,
+            messages,
+            actual_few_shot,
+            content,
+            usage,
+            conf_score,
+            None,
+        )
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import threading
+
+
+def prompt_family(model_class):
+    """Models whose classes share a ``create_prompt`` build identical messages."""
+    return model_class.create_prompt.__qualname__
+
+
+class _SharedPrompt:
+    def __init__(self, remaining):
+        self.remaining = remaining
+        self.value = None
+        self.ready = threading.Event()
+
+
+class SharedPromptCache:
+    """Messages built once per prompt family and row, shared by concurrent runs.
+
+    ``family_sizes`` maps a prompt family to the number of models using it;
+    an entry is dropped as soon as every one of them has taken it, so memory
+    only holds rows that some models have reached and others have not.
+    """
+
+    def __init__(self, family_sizes):
+        self.family_sizes = family_sizes
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get_or_build(self, family, row_key, build):
+        key = (family, row_key)
+        with self._lock:
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                entry = _SharedPrompt(self.family_sizes.get(family, 1))
+                self._entries[key] = entry
+                self.misses += 1
+            else:
+                self.hits += 1
+            entry.remaining -= 1
+            if entry.remaining <= 0:
+                del self._entries[key]
+
+        if owner:
+            try:
+                entry.value = build()
+            finally:
+                entry.ready.set()
+            return entry.value
+        entry.ready.wait()
+        # the owner failed to build it, so every model reports its own error
+        return entry.value if entry.value is not None else build()
+
+    def summary(self):
+        return {"hits": self.hits, "misses": self.misses}
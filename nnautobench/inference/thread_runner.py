@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import concurrent.futures
+import itertools
+import logging
+import time
+
+from tqdm import tqdm
+
+from nnautobench.inference.postprocess import log_stage_summary
+from nnautobench.inference.postprocess import score_prediction
+from nnautobench.inference.postprocess import StageStats
+
+logger = logging.getLogger(__name__)
+
+
+def _timed(stage, fn):
+    def run(**kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(**kwargs)
+        finally:
+            stage.record(time.perf_counter() - start)
+
+    return run
+
+
+def _result(predictor, score_stage, future, prediction):
+    # prediction is set when the future is the post-processing of that row
+    if prediction is None:
+        return future.result()
+    scores = future.result()
+    score_stage.record(scores["seconds"])
+    return predictor.build_result(**prediction, scores=scores)
+
+
+def run_predictions_threaded(
+    predictor,
+    tasks,
+    max_workers,
+    on_result,
+    total=None,
+    postprocess_workers=0,
+):
+    """Run ``predictor.process_single_image`` for every task on a thread pool.
+
+    ``tasks`` may be a lazy iterator: only ``2 * max_workers`` rows are
+    submitted at a time, and ``on_result`` is called with each result as soon
+    as it completes.
+
+    With ``postprocess_workers``, the threads only wait on the API and every
+    answer is parsed and scored in a process pool instead. At most
+    ``2 * postprocess_workers`` answers are queued for it; while it is full no
+    new rows are started.
+    """
+    tasks = iter(tasks)
+    requesting = set()
+    scoring = {}
+    api_stage = StageStats("api", max_workers)
+    score_stage = StageStats("postprocess", postprocess_workers)
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    pool = (
+        concurrent.futures.ProcessPoolExecutor(max_workers=postprocess_workers)
+        if postprocess_workers
+        else None
+    )
+    row_fn = predictor.process_single_image if pool is None else predictor.predict_row
+
+    try:
+        with tqdm(total=total, desc="Processing images") as progress:
+            while True:
+                if pool is None or len(scoring) < 2 * postprocess_workers:
+                    for task in itertools.islice(
+                        tasks,
+                        2 * max_workers - len(requesting),
+                    ):
+                        requesting.add(
+                            executor.submit(_timed(api_stage, row_fn), **task),
+                        )
+                if not requesting and not scoring:
+                    break
+                done, _ = concurrent.futures.wait(
+                    requesting | scoring.keys(),
+                    return_when=concurrent.futures.FIRST_COMPLETED,
+                )
+                for future in done:
+                    if future in requesting:
+                        requesting.discard(future)
+                        if pool is not None and future.exception() is None:
+                            prediction = future.result()
+                            scoring[
+                                pool.submit(
+                                    score_prediction,
+                                    *predictor.score_args(prediction),
+                                )
+                            ] = prediction
+                            continue
+                    progress.update()
+                    try:
+                        on_result(
+                            _result(
+                                predictor,
+                                score_stage,
+                                future,
+                                scoring.pop(future, None),
+                            ),
+                        )
+                    except Exception as exc:
+                        logger.error(
+                            f"Image generated an exception: {exc}",
+                            exc_info=True,
+                        )
+    finally:
+        # on Ctrl-C do not wait for rows that have not started yet
+        executor.shutdown(wait=True, cancel_futures=True)
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+    log_stage_summary([api_stage, score_stage] if pool is not None else [api_stage])
@@ -1,20 +1,39 @@
 from __future__ import annotations
 
+import asyncio
+import concurrent.futures
+import contextvars
 import json
 import logging
 import os
+import time
 from abc import ABC
 from abc import abstractmethod
 
-import backoff
 import dotenv
 import openai
+from openai import AsyncOpenAI
 from openai import OpenAI
 
 from nnautobench.utils.common_utils import clean_gpt_response
 from nnautobench.utils.conf_score_prompts import get_conf_score_prob_prompt
 from nnautobench.utils.conf_score_prompts import get_conf_score_yes_no_prompt
+from nnautobench.utils.http_client import get_async_http_client
+from nnautobench.utils.http_client import get_http_client
+from nnautobench.utils.live_metrics import track_request
+from nnautobench.utils.logprob_utils import get_logprob_conf_score
 from nnautobench.utils.prompt_utils import create_field_extraction_prompt
+from nnautobench.utils.rate_limiter import estimate_request_tokens
+from nnautobench.utils.request_stats import append_request_stat
+from nnautobench.utils.request_stats import current_network_phase
+from nnautobench.utils.request_stats import network_phase
+from nnautobench.utils.request_stats import record_request_stat
+from nnautobench.utils.request_stats import time_network
+from nnautobench.utils.request_stats import time_phase
+from nnautobench.utils.retry_policy import RetryPolicy
+from nnautobench.utils.streaming import aconsume_stream
+from nnautobench.utils.streaming import consume_stream
+from nnautobench.utils.streaming import STREAM_KWARGS
 
 dotenv.load_dotenv()
 
@@ -22,15 +41,36 @@ logger = logging.getLogger(__name__)
 
 
 class BaseModel(ABC):
-    def __init__(self, model_name, api_base):
+    def __init__(self, model_name, api_base, client=None, aclient=None):
         self.model_name = model_name
         self.api_base = api_base
-        self.client = self._create_client()
-
-    @backoff.on_exception(backoff.expo, openai.RateLimitError)
-    def completions_with_backoff(self, **kwargs):
-        # logger.info({key:val for key, val in kwargs.items() if key != 'messages'})
+        # clients may be injected, e.g. in-process mock transports
+        client = client if client is not None else self._create_client()
+        # retries are left to retry_policy instead of the SDK
+        self.client = client.with_options(max_retries=0)
+        self._aclient = None if aclient is None else aclient.with_options(max_retries=0)
+        # retries of 429s, 5xx responses, timeouts and connection errors
+        self.retry_policy = RetryPolicy()
+        # optional AdaptiveConcurrencyLimiter shared per api_base
+        self.concurrency_limiter = None
+        # optional TokenBucketRateLimiter shared per provider key
+        self.rate_limiter = None
+        # optional ResponseCache consulted before any request is sent
+        self.response_cache = None
+        # optional RequestHedger duplicating requests slower than its p95
+        self.hedger = None
+        # StreamingStats when responses are streamed to time TTFT and decode
+        self.streaming_stats = None
+        # LiveMetrics counting requests in flight, outcomes and tokens
+        self.live_metrics = None
+        # TokenBudget counting the spend, optionally with token and cost limits
+        self.token_budget = None
+        # consistency samples drawn before checking whether the rest are needed
+        self.consistency_batch_size = 2
+        # cleared the first time the provider returns fewer choices than n
+        self.supports_n = True
 
+    def _prepare_completion_kwargs(self, kwargs, sample_index=0):
         if (
             self.model_name == "gemini-2.0-flash"
             or self.model_name == "mistral-large-latest"
@@ -40,8 +80,208 @@ class BaseModel(ABC):
             if "logprobs" in kwargs:
                 kwargs.pop("logprobs")
         else:
-            kwargs["seed"] = 42
-        return self.client.chat.completions.create(**kwargs)
+            # every sample of the same prompt gets its own seed
+            kwargs["seed"] = 42 + sample_index
+        return kwargs
+
+    def _cache_request(self, kwargs, sample_index):
+        # the same model name served by another endpoint answers differently;
+        # samples of the same prompt must not share a cache entry, even for
+        # providers that do not accept a seed
+        request = {**kwargs, "api_base": self.api_base}
+        if sample_index:
+            request["sample_index"] = sample_index
+        return request
+
+    def _cached_response(self, cache_request):
+        response = self.response_cache.get(cache_request)
+        if response is not None:
+            # the row's timings are not those of the model, see Predictor
+            record_request_stat("cached_requests", 1, add=True)
+        return response
+
+    def completions_with_backoff(self, sample_index=0, **kwargs):
+        # logger.info({key:val for key, val in kwargs.items() if key != 'messages'})
+        kwargs = self._prepare_completion_kwargs(kwargs, sample_index)
+        cache_request = self._cache_request(kwargs, sample_index)
+        if self.response_cache is not None:
+            response = self._cached_response(cache_request)
+            if response is not None:
+                return response
+        response = self._send_completion(kwargs)
+        if self.response_cache is not None:
+            self.response_cache.put(cache_request, response)
+        return response
+
+    async def acompletions_with_backoff(self, sample_index=0, **kwargs):
+        kwargs = self._prepare_completion_kwargs(kwargs, sample_index)
+        cache_request = self._cache_request(kwargs, sample_index)
+        # SQLite reads and writes stay off the event loop
+        if self.response_cache is not None:
+            response = await asyncio.to_thread(self._cached_response, cache_request)
+            if response is not None:
+                return response
+        response = await self._asend_completion(kwargs)
+        if self.response_cache is not None:
+            await asyncio.to_thread(self.response_cache.put, cache_request, response)
+        return response
+
+    def _send_completion(self, kwargs):
+        return self.retry_policy.call(
+            lambda timeout: self._send_attempt(kwargs, timeout),
+        )
+
+    async def _asend_completion(self, kwargs):
+        return await self.retry_policy.acall(
+            lambda timeout: self._asend_attempt(kwargs, timeout),
+        )
+
+    def _send_attempt(self, kwargs, timeout):
+        # hedge single attempts, a loser never starts a retry of its own
+        if self.hedger is None:
+            return self._create_completion_once(kwargs, timeout)
+        return self.hedger.call(
+            lambda: self._create_completion_once(kwargs, timeout),
+            kwargs,
+        )
+
+    async def _asend_attempt(self, kwargs, timeout):
+        if self.hedger is None:
+            return await self._acreate_completion_once(kwargs, timeout)
+        return await self.hedger.acall(
+            lambda: self._acreate_completion_once(kwargs, timeout),
+            kwargs,
+        )
+
+    def _create_completion_once(self, kwargs, timeout=None):
+        with time_network():
+            return self._create_completion_attempt(kwargs, timeout)
+
+    def _create_completion_attempt(self, kwargs, timeout):
+        estimated_tokens = self._estimate_tokens(kwargs)
+        if self.rate_limiter is not None:
+            with time_phase("queue_wait"):
+                self.rate_limiter.acquire(estimated_tokens)
+        # the retry budget left caps this attempt, else the client timeout applies
+        timeout = openai.NOT_GIVEN if timeout is None else timeout
+        reservation = self._reserve_token_budget(kwargs, estimated_tokens)
+        response = None
+        try:
+            if self.concurrency_limiter is None:
+                response = self._request(kwargs, timeout)
+            else:
+                with self.concurrency_limiter.slot():
+                    response = self._request(kwargs, timeout)
+        finally:
+            self._settle_rate_limit(estimated_tokens, response)
+            self._settle_token_budget(reservation, response)
+        return response
+
+    def _request(self, kwargs, timeout):
+        start = time.perf_counter()
+        with track_request(self.live_metrics) as request:
+            request.response = self._send_request(kwargs, timeout)
+        self._record_latency(start)
+        return request.response
+
+    async def _arequest(self, kwargs, timeout):
+        start = time.perf_counter()
+        with track_request(self.live_metrics) as request:
+            request.response = await self._asend_request(kwargs, timeout)
+        self._record_latency(start)
+        return request.response
+
+    def _record_latency(self, start):
+        # the hedge delay follows the requests alone, not the limiters or backoff
+        if self.hedger is not None:
+            self.hedger.record_latency(time.perf_counter() - start)
+
+    def _send_request(self, kwargs, timeout):
+        if self.streaming_stats is None:
+            return self.client.chat.completions.create(**kwargs, timeout=timeout)
+        start = time.perf_counter()
+        response, metrics = consume_stream(
+            self.client.chat.completions.create(
+                **kwargs,
+                **STREAM_KWARGS,
+                timeout=timeout,
+            ),
+            start,
+        )
+        self._record_stream(metrics)
+        return response
+
+    async def _asend_request(self, kwargs, timeout):
+        if self.streaming_stats is None:
+            return await self.aclient.chat.completions.create(
+                **kwargs,
+                timeout=timeout,
+            )
+        start = time.perf_counter()
+        response, metrics = await aconsume_stream(
+            await self.aclient.chat.completions.create(
+                **kwargs,
+                **STREAM_KWARGS,
+                timeout=timeout,
+            ),
+            start,
+        )
+        self._record_stream(metrics)
+        return response
+
+    def _record_stream(self, metrics):
+        if metrics is None:
+            return
+        self.streaming_stats.record(metrics)
+        append_request_stat("streams", {**metrics, "phase": current_network_phase()})
+
+    async def _acreate_completion_once(self, kwargs, timeout=None):
+        with time_network():
+            return await self._acreate_completion_attempt(kwargs, timeout)
+
+    async def _acreate_completion_attempt(self, kwargs, timeout):
+        estimated_tokens = self._estimate_tokens(kwargs)
+        if self.rate_limiter is not None:
+            with time_phase("queue_wait"):
+                await self.rate_limiter.aacquire(estimated_tokens)
+        timeout = openai.NOT_GIVEN if timeout is None else timeout
+        reservation = self._reserve_token_budget(kwargs, estimated_tokens)
+        response = None
+        try:
+            if self.concurrency_limiter is None:
+                response = await self._arequest(kwargs, timeout)
+            else:
+                async with self.concurrency_limiter.aslot():
+                    response = await self._arequest(kwargs, timeout)
+        finally:
+            self._settle_rate_limit(estimated_tokens, response)
+            self._settle_token_budget(reservation, response)
+        return response
+
+    def _estimate_tokens(self, kwargs):
+        if self.rate_limiter is None and (
+            self.token_budget is None or not self.token_budget.limited
+        ):
+            return 0
+        return estimate_request_tokens(kwargs)
+
+    def _settle_rate_limit(self, estimated_tokens, response):
+        if self.rate_limiter is None:
+            return
+        # failed requests are refunded, successful ones charged their real usage
+        actual_tokens = 0
+        if response is not None and response.usage is not None:
+            actual_tokens = response.usage.total_tokens
+        self.rate_limiter.adjust(estimated_tokens, actual_tokens)
+
+    def _reserve_token_budget(self, kwargs, estimated_tokens):
+        if self.token_budget is None:
+            return None
+        return self.token_budget.reserve(kwargs, estimated_tokens)
+
+    def _settle_token_budget(self, reservation, response):
+        if self.token_budget is not None:
+            self.token_budget.settle(reservation, response)
 
     def _create_client(self):
         api_key = os.getenv("BASE_API_KEY")  # Generic API Key
@@ -51,51 +291,92 @@ class BaseModel(ABC):
             )
             api_key = "EMPTY"  # Fallback to "EMPTY" if no key is set
 
-        return OpenAI(api_key=api_key, base_url=self.api_base)
+        return OpenAI(
+            api_key=api_key,
+            base_url=self.api_base,
+            http_client=get_http_client(self.api_base),
+        )
+
+    def _create_async_client(self):
+        # reuse the credentials resolved by the provider specific _create_client
+        return AsyncOpenAI(
+            api_key=self.client.api_key,
+            base_url=self.client.base_url,
+            http_client=get_async_http_client(self.api_base),
+            max_retries=0,
+        )
+
+    @property
+    def aclient(self):
+        if self._aclient is None:
+            self._aclient = self._create_async_client()
+        return self._aclient
 
     def create_prompt(self, fields, descriptions=None):
         return create_field_extraction_prompt(fields, descriptions)
 
-    def score_conf_prob_score(self, messages, answer, **kwargs):
-        # returns confidence score for each field
-        prompt = get_conf_score_prob_prompt()
-        messages.append({"role": "assistant", "content": answer})
-        messages.append({"role": "user", "content": prompt})
-        conf_score_response = self.completions_with_backoff(
+    def _completion_kwargs(self, messages, conf_score_method):
+        return dict(
             model=self.model_name,
             messages=messages,
-            temperature=0,
+            temperature=1.25 if conf_score_method == "consistency" else 0,
             max_tokens=3000,
-            response_format={"type": "json_object"},
+            logprobs=True,
+            top_logprobs=2,
+            n=5 if conf_score_method == "consistency" else 1,
         )
-        conf_score_response = json.loads(
-            conf_score_response.choices[0].message.content,
-        )
-        return conf_score_response
 
-    def score_conf_yes_no_score(self, messages, answer, **kwargs):
-        # returns 1 if the field is correct and 0 if it is incorrect
-        prompt = get_conf_score_yes_no_prompt()
-        messages.append({"role": "assistant", "content": answer})
-        messages.append({"role": "user", "content": prompt})
-        conf_score_response = self.completions_with_backoff(
+    def _conf_score_kwargs(self, messages):
+        return dict(
             model=self.model_name,
             messages=messages,
             temperature=0,
             max_tokens=3000,
             response_format={"type": "json_object"},
         )
-        conf_score_response = self.completions_with_backoff(
-            model=self.model_name,
-            messages=messages,
-            temperature=0,
-            max_tokens=3000,
-            response_format={"type": "json_object"},
+
+    def _conf_score_messages(self, messages, answer, prompt):
+        messages.append({"role": "assistant", "content": answer})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def _score_conf_score(self, messages, answer, prompt):
+        messages = self._conf_score_messages(messages, answer, prompt)
+        with network_phase("conf_call"):
+            conf_score_response = self.completions_with_backoff(
+                **self._conf_score_kwargs(messages),
+            )
+        return json.loads(conf_score_response.choices[0].message.content)
+
+    async def _ascore_conf_score(self, messages, answer, prompt):
+        messages = self._conf_score_messages(messages, answer, prompt)
+        with network_phase("conf_call"):
+            conf_score_response = await self.acompletions_with_backoff(
+                **self._conf_score_kwargs(messages),
+            )
+        return json.loads(conf_score_response.choices[0].message.content)
+
+    def score_conf_prob_score(self, messages, answer, **kwargs):
+        # returns confidence score for each field
+        return self._score_conf_score(messages, answer, get_conf_score_prob_prompt())
+
+    def score_conf_yes_no_score(self, messages, answer, **kwargs):
+        # returns 1 if the field is correct and 0 if it is incorrect
+        return self._score_conf_score(messages, answer, get_conf_score_yes_no_prompt())
+
+    async def ascore_conf_prob_score(self, messages, answer, **kwargs):
+        return await self._ascore_conf_score(
+            messages,
+            answer,
+            get_conf_score_prob_prompt(),
         )
-        conf_score_response = json.loads(
-            conf_score_response.choices[0].message.content,
+
+    async def ascore_conf_yes_no_score(self, messages, answer, **kwargs):
+        return await self._ascore_conf_score(
+            messages,
+            answer,
+            get_conf_score_yes_no_prompt(),
         )
-        return conf_score_response
 
     def get_consistency_conf_score(
         self,
@@ -133,6 +414,24 @@ class BaseModel(ABC):
         }
         return conf_score
 
+    def get_logprob_conf_score(
+        self,
+        messages,
+        answer,
+        choices,
+        parsed_answer,
+        **kwargs,
+    ):
+        # confidence from the logprobs of the answer itself, no extra request
+        logprobs = choices[0].logprobs
+        if logprobs is None or not logprobs.content:
+            logger.warning(
+                f"{self.model_name} returned no logprobs, logprob confidence unavailable",
+            )
+            return {}
+        fields = parsed_answer.keys() if isinstance(parsed_answer, dict) else []
+        return get_logprob_conf_score(logprobs.content, fields)
+
     def get_conf_score(
         self,
         conf_score_method,
@@ -160,39 +459,246 @@ class BaseModel(ABC):
                     parsed_answer,
                     **kwargs,
                 )
+            elif conf_score_method == "logprob":
+                return self.get_logprob_conf_score(
+                    messages,
+                    answer,
+                    choices,
+                    parsed_answer,
+                    **kwargs,
+                )
         except Exception as e:
             print(e)
             return {}
 
-    def predict(self, messages, conf_score_method):
-        conf_score = {}
+    async def aget_conf_score(
+        self,
+        conf_score_method,
+        messages,
+        choices,
+        parsed_answer,
+        **kwargs,
+    ):
+        answer = choices[0].message.content
         try:
+            if conf_score_method == "prob":
+                return await self.ascore_conf_prob_score(messages, answer, **kwargs)
+            elif conf_score_method == "yes_no":
+                return await self.ascore_conf_yes_no_score(messages, answer, **kwargs)
+        except Exception as e:
+            logger.error(e)
+            return {}
+        # the remaining methods do not make any additional requests
+        return self.get_conf_score(
+            conf_score_method,
+            messages,
+            choices,
+            parsed_answer,
+            **kwargs,
+        )
+
+    def _consistency_decided(self, choices):
+        # a field scores 1 only if every sample agrees, so once every field
+        # has disagreeing samples further samples cannot change the outcome
+        if len(choices) < 2:
+            return False
+        conf_score = self.get_consistency_conf_score(None, None, choices, None)
+        return bool(conf_score) and not any(conf_score.values())
+
+    def _draw_samples(self, kwargs, n, sample_index):
+        responses = []
+        if self.supports_n or n == 1:
             response = self.completions_with_backoff(
-                model=self.model_name,
-                messages=messages,
-                temperature=1.25 if conf_score_method == "consistency" else 0,
-                max_tokens=3000,
-                logprobs=True,
-                top_logprobs=2,
-                n=5 if conf_score_method == "consistency" else 1,
+                sample_index=sample_index,
+                **kwargs,
+                n=n,
+            )
+            responses.append(response)
+            if len(response.choices) >= n:
+                return responses
+            if self.supports_n:
+                self.supports_n = False
+                logger.info(
+                    f"{self.model_name} ignores n, "
+                    "using parallel single-sample requests",
+                )
+        drawn = sum(len(response.choices) for response in responses)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=n - drawn) as executor:
+            futures = [
+                executor.submit(
+                    contextvars.copy_context().run,
+                    self.completions_with_backoff,
+                    sample_index=sample_index + i,
+                    **kwargs,
+                    n=1,
+                )
+                for i in range(drawn, n)
+            ]
+            responses += [future.result() for future in futures]
+        return responses
+
+    async def _adraw_samples(self, kwargs, n, sample_index):
+        responses = []
+        if self.supports_n or n == 1:
+            response = await self.acompletions_with_backoff(
+                sample_index=sample_index,
+                **kwargs,
+                n=n,
+            )
+            responses.append(response)
+            if len(response.choices) >= n:
+                return responses
+            if self.supports_n:
+                self.supports_n = False
+                logger.info(
+                    f"{self.model_name} ignores n, "
+                    "using parallel single-sample requests",
+                )
+        drawn = sum(len(response.choices) for response in responses)
+        responses += await asyncio.gather(
+            *[
+                self.acompletions_with_backoff(
+                    sample_index=sample_index + i,
+                    **kwargs,
+                    n=1,
+                )
+                for i in range(drawn, n)
+            ],
+        )
+        return responses
+
+    def _add_samples(self, choices, usages, responses, budget):
+        for response in responses:
+            choices.extend(response.choices[: budget - len(choices)])
+            usages.append(response.usage.dict())
+
+    def _record_consistency(self, choices, usages):
+        record_request_stat("consistency_samples", len(choices))
+        # every request bills the prompt again
+        record_request_stat("consistency_requests", len(usages))
+
+    def sample_consistency(self, messages, conf_score_method):
+        """Draw ``consistency_batch_size`` consistency samples, then the rest in
+        one more request unless they already decide every field.
+        """
+        kwargs = self._completion_kwargs(messages, conf_score_method)
+        budget = kwargs.pop("n")
+        choices, usages = [], []
+        responses = self._draw_samples(
+            kwargs,
+            min(self.consistency_batch_size, budget),
+            0,
+        )
+        self._add_samples(choices, usages, responses, budget)
+        if len(choices) < budget and not self._consistency_decided(choices):
+            responses = self._draw_samples(kwargs, budget - len(choices), len(choices))
+            self._add_samples(choices, usages, responses, budget)
+        self._record_consistency(choices, usages)
+        return choices, _merge_usage(usages)
+
+    async def asample_consistency(self, messages, conf_score_method):
+        kwargs = self._completion_kwargs(messages, conf_score_method)
+        budget = kwargs.pop("n")
+        choices, usages = [], []
+        responses = await self._adraw_samples(
+            kwargs,
+            min(self.consistency_batch_size, budget),
+            0,
+        )
+        self._add_samples(choices, usages, responses, budget)
+        if len(choices) < budget and not self._consistency_decided(choices):
+            responses = await self._adraw_samples(
+                kwargs,
+                budget - len(choices),
+                len(choices),
+            )
+            self._add_samples(choices, usages, responses, budget)
+        self._record_consistency(choices, usages)
+        return choices, _merge_usage(usages)
+
+    def _predict_choices(self, messages, conf_score_method):
+        if conf_score_method == "consistency":
+            return self.sample_consistency(messages, conf_score_method)
+        response = self.completions_with_backoff(
+            **self._completion_kwargs(messages, conf_score_method),
+        )
+        return response.choices, response.usage.dict()
+
+    async def _apredict_choices(self, messages, conf_score_method):
+        if conf_score_method == "consistency":
+            return await self.asample_consistency(messages, conf_score_method)
+        response = await self.acompletions_with_backoff(
+            **self._completion_kwargs(messages, conf_score_method),
+        )
+        return response.choices, response.usage.dict()
+
+    def _prediction_output(self, choices, usage, conf_score):
+        logger.debug(f"conf_score: {conf_score}")
+        return choices[0].message.content, usage, conf_score
+
+    def batch_request_body(self, messages, conf_score_method):
+        """Body of the prediction request, as submitted to a provider batch API."""
+        return self._prepare_completion_kwargs(
+            self._completion_kwargs(messages, conf_score_method),
+        )
+
+    def score_choices(self, messages, choices, usage, conf_score_method):
+        """Confidence scores and prediction output for already received choices."""
+        parsed_answer, is_parsable = self.post_process(choices[0].message.content)
+        conf_score = self.get_conf_score(
+            conf_score_method=conf_score_method,
+            messages=messages,
+            choices=choices,
+            parsed_answer=parsed_answer,
+        )
+        return self._prediction_output(choices, usage, conf_score)
+
+    def predict(self, messages, conf_score_method):
+        try:
+            choices, usage = self._predict_choices(messages, conf_score_method)
+            return self.score_choices(messages, choices, usage, conf_score_method)
+        except Exception as e:
+            print(e)
+            print(messages)
+            raise e
+
+    async def apredict(self, messages, conf_score_method):
+        try:
+            choices, usage = await self._apredict_choices(
+                messages,
+                conf_score_method,
             )
-            if conf_score_method == "consistency":
-                print(f"len(response.choices): {len(response.choices)}")
             parsed_answer, is_parsable = self.post_process(
-                response.choices[0].message.content,
+                choices[0].message.content,
             )
-            conf_score = self.get_conf_score(
+            conf_score = await self.aget_conf_score(
                 conf_score_method=conf_score_method,
                 messages=messages,
-                choices=response.choices,
+                choices=choices,
                 parsed_answer=parsed_answer,
             )
         except Exception as e:
-            print(e)
-            print(messages)
+            logger.error(f"Async prediction failed for {self.model_name}: {e}")
             raise e
 
-        return response.choices[0].message.content, response.usage.dict(), conf_score
+        return self._prediction_output(choices, usage, conf_score)
+
+    @staticmethod
+    def post_process(content):
+        # static so it can be sent to a post-processing worker process
+        with time_phase("parse"):
+            return clean_gpt_response(content)
+
 
-    def post_process(self, content):
-        return clean_gpt_response(content)
+def _merge_usage(usages):
+    # sum the token counts of several responses, including nested details
+    merged = {}
+    for usage in usages:
+        for key, value in usage.items():
+            if isinstance(value, dict):
+                merged[key] = _merge_usage([merged.get(key) or {}, value])
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                merged[key] = (merged.get(key) or 0) + value
+            else:
+                merged.setdefault(key, value)
+    return merged
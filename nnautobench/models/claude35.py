@@ -8,6 +8,7 @@ from openai import OpenAI
 
 from .base_model import BaseModel
 from .gpt4o_model import GPT4oModel
+from nnautobench.utils.http_client import get_http_client
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -20,4 +21,8 @@ class Claude35(GPT4oModel):
             logger.warning(
                 "ANTHROPIC_API_KEY environment variable not set. Claude37 may not work.",
             )
-        return OpenAI(api_key=api_key, base_url=self.api_base)
+        return OpenAI(
+            api_key=api_key,
+            base_url=self.api_base,
+            http_client=get_http_client(self.api_base),
+        )
@@ -7,6 +7,7 @@ from dotenv import load_dotenv
 from openai import OpenAI
 
 from .gpt4o_model import GPT4oModel
+from nnautobench.utils.http_client import get_http_client
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -19,4 +20,8 @@ class Claude37(GPT4oModel):
             logger.warning(
                 "ANTHROPIC_API_KEY environment variable not set. Claude37 may not work.",
             )
-        return OpenAI(api_key=api_key, base_url=self.api_base)
+        return OpenAI(
+            api_key=api_key,
+            base_url=self.api_base,
+            http_client=get_http_client(self.api_base),
+        )
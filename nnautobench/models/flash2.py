@@ -7,6 +7,7 @@ from dotenv import load_dotenv
 from openai import OpenAI
 
 from .gpt4o_model import GPT4oModel
+from nnautobench.utils.http_client import get_http_client
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -20,4 +21,8 @@ class Flash2(GPT4oModel):
             logger.warning(
                 "GEMINI_API_KEY environment variable not set. Flash2 may not work.",
             )
-        return OpenAI(api_key=api_key, base_url=self.api_base)
+        return OpenAI(
+            api_key=api_key,
+            base_url=self.api_base,
+            http_client=get_http_client(self.api_base),
+        )
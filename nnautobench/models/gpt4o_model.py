@@ -9,6 +9,7 @@ from openai import OpenAI
 
 from .base_model import BaseModel
 from .qwen2_model import Qwen2Model
+from nnautobench.utils.http_client import get_http_client
 from nnautobench.utils.prompt_utils import create_field_extraction_prompt_ocr
 from nnautobench.utils.prompt_utils import get_sample_output
 
@@ -17,11 +18,6 @@ logger = logging.getLogger(__name__)
 
 
 class GPT4oModel(Qwen2Model):
-    def __init__(self, model_name, api_base):
-        self.model_name = model_name
-        self.api_base = api_base
-        self.client = self._create_client()
-
     def _create_client(self):
         # Using generic OpenAI key as GPT4o is also OpenAI
         api_key = os.getenv("OPENAI_API_KEY")
@@ -29,7 +25,11 @@ class GPT4oModel(Qwen2Model):
             logger.warning(
                 "OPENAI_API_KEY environment variable not set. GPT4o may not work.",
             )
-        return OpenAI(api_key=api_key, base_url=self.api_base)
+        return OpenAI(
+            api_key=api_key,
+            base_url=self.api_base,
+            http_client=get_http_client(self.api_base),
+        )
 
     def create_prompt(
         self,
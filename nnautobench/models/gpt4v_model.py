@@ -7,6 +7,7 @@ from dotenv import load_dotenv
 from openai import OpenAI
 
 from nnautobench.models.qwen2_model import Qwen2Model
+from nnautobench.utils.http_client import get_http_client
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -20,4 +21,8 @@ class GPT4VModel(Qwen2Model):
             logger.warning(
                 "OPENAI_API_KEY environment variable not set. GPT4V may not work.",
             )
-        return OpenAI(api_key=api_key, base_url=self.api_base)
+        return OpenAI(
+            api_key=api_key,
+            base_url=self.api_base,
+            http_client=get_http_client(self.api_base),
+        )
@@ -9,8 +9,7 @@ from openai import OpenAI
 
 from .base_model import BaseModel
 from .qwen2_model import Qwen2Model
-from nnautobench.utils.conf_score_prompts import get_conf_score_prob_prompt
-from nnautobench.utils.conf_score_prompts import get_conf_score_yes_no_prompt
+from nnautobench.utils.http_client import get_http_client
 from nnautobench.utils.prompt_utils import create_field_extraction_prompt_ocr
 from nnautobench.utils.prompt_utils import get_sample_output
 
@@ -19,11 +18,6 @@ logger = logging.getLogger(__name__)
 
 
 class GPTo3MiniModel(Qwen2Model):
-    def __init__(self, model_name, api_base):
-        self.model_name = model_name
-        self.api_base = api_base
-        self.client = self._create_client()
-
     def _create_client(self):
         # Using generic OpenAI key as GPT4o is also OpenAI
         api_key = os.getenv("OPENAI_API_KEY")
@@ -31,7 +25,11 @@ class GPTo3MiniModel(Qwen2Model):
             logger.warning(
                 "OPENAI_API_KEY environment variable not set. GPT4o may not work.",
             )
-        return OpenAI(api_key=api_key, base_url=self.api_base)
+        return OpenAI(
+            api_key=api_key,
+            base_url=self.api_base,
+            http_client=get_http_client(self.api_base),
+        )
 
     def create_prompt(
         self,
@@ -79,22 +77,13 @@ class GPTo3MiniModel(Qwen2Model):
             messages.append({"role": "user", "content": question})
         return messages
 
-    def score_conf_prob_score(self, messages, answer, **kwargs):
-        return self._score_conf_score(messages, answer, get_conf_score_prob_prompt())
-
-    def score_conf_yes_no_score(self, messages, answer, **kwargs):
-        return self._score_conf_score(messages, answer, get_conf_score_yes_no_prompt())
-
-    def _score_conf_score(self, messages, answer, prompt):
-        messages.append({"role": "assistant", "content": answer})
-        messages.append({"role": "user", "content": prompt})
-        conf_score_response = self.completions_with_backoff(
+    def _conf_score_kwargs(self, messages):
+        return dict(
             model=self.model_name,
             messages=messages,
             reasoning_effort="low",
             response_format={"type": "json_object"},
         )
-        return json.loads(conf_score_response.choices[0].message.content)
 
     def get_consistency_conf_score(
         self,
@@ -148,43 +137,36 @@ class GPTo3MiniModel(Qwen2Model):
                     parsed_answer,
                     **kwargs,
                 )
+            elif conf_score_method == "logprob":
+                # o3-mini does not expose logprobs, this logs and returns {}
+                return self.get_logprob_conf_score(
+                    messages,
+                    answer,
+                    choices,
+                    parsed_answer,
+                    **kwargs,
+                )
         except Exception as e:
             logger.error(e)
             return {}
 
-    def predict(self, messages, conf_score_method):
-        conf_score = {}
-        try:
-            response = self.completions_with_backoff(
-                model=self.model_name,
-                messages=messages,
-                max_completion_tokens=80000,
-                logprobs=False,
-                reasoning_effort="medium",
-                n=5 if conf_score_method == "consistency" else 1,
-            )
-            if conf_score_method == "consistency":
-                print(f"len(response.choices): {len(response.choices)}")
-            parsed_answer, is_parsable = self.post_process(
-                response.choices[0].message.content,
-            )
-            conf_score = self.get_conf_score(
-                conf_score_method=conf_score_method,
-                messages=messages,
-                choices=response.choices,
-                parsed_answer=parsed_answer,
-            )
-        except Exception as e:
-            print(e)
-            print(messages)
-            raise e
+    def _completion_kwargs(self, messages, conf_score_method):
+        return dict(
+            model=self.model_name,
+            messages=messages,
+            max_completion_tokens=80000,
+            logprobs=False,
+            reasoning_effort="medium",
+            n=5 if conf_score_method == "consistency" else 1,
+        )
 
+    def _prediction_output(self, choices, usage, conf_score):
         logger.debug(f"conf_score: {conf_score}")
         logger.debug(
-            f"response.choices[0].message.content: {response.choices[0].message.content}",
+            f"choices[0].message.content: {choices[0].message.content}",
         )
         logger.debug(
-            f"Completion Token Details: {response.usage.completion_tokens_details}",
+            f"Completion Token Details: {usage.get('completion_tokens_details')}",
         )
 
-        return response.choices[0].message.content, response.usage.dict(), conf_score
+        return choices[0].message.content, usage, conf_score
@@ -7,6 +7,7 @@ from dotenv import load_dotenv
 from openai import OpenAI
 
 from .gpt4o_model import GPT4oModel
+from nnautobench.utils.http_client import get_http_client
 
 logger = logging.getLogger(__name__)
 
@@ -18,4 +19,8 @@ class MistralLarge(GPT4oModel):
             logger.warning(
                 "MISTRAL_API_KEY environment variable not set. Mistral Large may not work.",
             )
-        return OpenAI(api_key=api_key, base_url=self.api_base)
+        return OpenAI(
+            api_key=api_key,
+            base_url=self.api_base,
+            http_client=get_http_client(self.api_base),
+        )
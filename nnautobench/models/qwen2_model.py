@@ -8,7 +8,8 @@ from dotenv import load_dotenv
 from openai import OpenAI
 
 from nnautobench.models.base_model import BaseModel
-from nnautobench.utils.image_utils import encode_image_base64
+from nnautobench.utils.http_client import get_http_client
+from nnautobench.utils.image_utils import encode_image_data_url
 from nnautobench.utils.prompt_utils import create_field_extraction_prompt
 from nnautobench.utils.prompt_utils import get_sample_output
 
@@ -17,18 +18,17 @@ logger = logging.getLogger(__name__)
 
 
 class Qwen2Model(BaseModel):
-    def __init__(self, model_name, api_base):
-        self.model_name = model_name
-        self.api_base = api_base
-        self.client = self._create_client()
-
     def _create_client(self):
         api_key = os.getenv("QWEN2_API_KEY")  # Specific API key for Qwen2
         if not api_key:
             logger.warning(
                 "QWEN2_API_KEY environment variable not set. Qwen2 may not work.",
             )
-        return OpenAI(api_key=api_key, base_url=self.api_base)
+        return OpenAI(
+            api_key=api_key,
+            base_url=self.api_base,
+            http_client=get_http_client(self.api_base),
+        )
 
     def create_prompt(
         self,
@@ -41,10 +41,7 @@ class Qwen2Model(BaseModel):
     ):
         actual_few_shot = len(ctx)
         question = create_field_extraction_prompt(fields, descriptions)
-        base64_images = [encode_image_base64(img) for img in image_paths]
-        data_urls = [
-            f"data:image/jpeg;base64,{base64_image}" for base64_image in base64_images
-        ]
+        data_urls = [encode_image_data_url(img) for img in image_paths]
         if actual_few_shot == 0:
             # zeroshot
             content = []
@@ -75,8 +72,7 @@ class Qwen2Model(BaseModel):
                     ctx[i]["accepted"],
                 )
                 answer = f"{json.dumps(sample_output, ensure_ascii=False)}"
-                sample_base64_image = encode_image_base64(ctx[i]["image_path"])
-                sample_image_url = f"data:image/jpeg;base64,{sample_base64_image}"
+                sample_image_url = encode_image_data_url(ctx[i]["image_path"])
                 content = []
                 content.append(
                     {
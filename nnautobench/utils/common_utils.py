@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import ast
+import hashlib
 import json
 import re
 from json import JSONDecodeError
@@ -271,6 +272,48 @@ def load_data(file_path):
     return df
 
 
+def get_shard_index(row, num_shards):
+    # stable across machines and python processes, unlike hash()
+    payload = f"{row['image_path']}|{row['Queried_labels']}".encode("utf-8")
+    return int(hashlib.sha1(payload).hexdigest(), 16) % num_shards
+
+
+def iter_data(file_path, limit=None, offset=0, shard=None):
+    """Lazily yield rows of a JSONL dataset.
+
+    Rows outside ``shard`` (a ``(index, num_shards)`` tuple) are skipped, then
+    the first ``offset`` remaining rows, and reading stops as soon as ``limit``
+    rows have been yielded.
+    """
+    yielded = 0
+    skipped = 0
+    with open(file_path, encoding="utf-8") as f:
+        for line in f:
+            if limit is not None and yielded >= limit:
+                return
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            if shard is not None and get_shard_index(row, shard[1]) != shard[0]:
+                continue
+            if skipped < offset:
+                skipped += 1
+                continue
+            yielded += 1
+            yield row
+
+
+def get_row_key(image_path, keys, ctx):
+    # identifies a benchmark row across runs: document, queried labels and few-shot context
+    payload = json.dumps(
+        [image_path, keys, ctx],
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
 def filter_data(df, categories):
     df_filtered = df[df.category.isin(categories)].copy()
     df_filtered = df_filtered[df_filtered.s3_path_exists == True]
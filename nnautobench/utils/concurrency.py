@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager
+from contextlib import contextmanager
+
+import openai
+
+from nnautobench.utils.request_stats import time_phase
+
+logger = logging.getLogger(__name__)
+
+
+def classify_exception(exc):
+    """Map a failed request to the overload signal it carries, if any."""
+    if isinstance(exc, openai.RateLimitError):
+        return "rate_limited"
+    if isinstance(exc, openai.APITimeoutError):
+        return "timeout"
+    status_code = getattr(exc, "status_code", None)
+    if status_code is not None and status_code >= 500:
+        return "server_error"
+    return "error"
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD limit on the number of requests in flight against one endpoint.
+
+    The limit grows by one per window of successful requests while the
+    endpoint keeps up, is cut by ``backoff_ratio`` on 429s, 5xx responses and
+    timeouts, and is cut gently when the recent latency drifts above
+    ``latency_tolerance`` times the long-term average. LLM latency follows
+    the length of the answers, so the baseline is an average over about
+    ``baseline_window`` requests rather than the best latency seen.
+    Usable from worker threads (``slot``) and from asyncio tasks (``aslot``).
+    """
+
+    def __init__(
+        self,
+        name,
+        initial_limit=8,
+        min_limit=1,
+        max_limit=256,
+        backoff_ratio=0.5,
+        latency_backoff_ratio=0.9,
+        latency_tolerance=2.0,
+        baseline_window=100,
+        log_interval=10.0,
+    ):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.latency_backoff_ratio = latency_backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.baseline_window = baseline_window
+        self.log_interval = log_interval
+
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._async_waiters = []
+        self._latencies = 0
+        self._baseline_latency = None
+        self._smoothed_latency = None
+        self._last_decrease = 0.0
+        self._last_log = 0.0
+        self._start = time.monotonic()
+        self.counts = {
+            "success": 0,
+            "rate_limited": 0,
+            "server_error": 0,
+            "timeout": 0,
+            "error": 0,
+        }
+        # (seconds since start, limit) every time the integer limit changes
+        self.history = [(0.0, int(self._limit))]
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def _try_acquire(self):
+        if self._in_flight < int(self._limit):
+            self._in_flight += 1
+            return True
+        return False
+
+    def acquire(self):
+        with self._cond:
+            while not self._try_acquire():
+                self._cond.wait()
+
+    async def aacquire(self):
+        while True:
+            with self._cond:
+                if self._try_acquire():
+                    return
+                loop = asyncio.get_running_loop()
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._cond:
+                    if (loop, waiter) in self._async_waiters:
+                        self._async_waiters.remove((loop, waiter))
+                    else:
+                        # we were woken up, hand the free slot to someone else
+                        self._wake_waiters()
+                raise
+
+    def _wake_waiters(self):
+        free = int(self._limit) - self._in_flight
+        if free <= 0:
+            return
+        self._cond.notify(free)
+        while self._async_waiters and free > 0:
+            loop, waiter = self._async_waiters.pop(0)
+            if loop.is_closed():
+                continue
+            loop.call_soon_threadsafe(_set_waiter_done, waiter)
+            free -= 1
+
+    def release(self, latency=None, outcome="success"):
+        with self._cond:
+            self._in_flight -= 1
+            self.counts[outcome] += 1
+            previous = int(self._limit)
+            self._update_limit(latency, outcome)
+            if int(self._limit) != previous:
+                self._record_change(previous, latency)
+            self._wake_waiters()
+
+    def _update_limit(self, latency, outcome):
+        now = time.monotonic()
+        if outcome in ("rate_limited", "server_error", "timeout"):
+            # a burst of concurrent failures is one overload event
+            if now - self._last_decrease >= (self._smoothed_latency or 1.0):
+                self._limit = max(self.min_limit, self._limit * self.backoff_ratio)
+                self._last_decrease = now
+            return
+        if outcome != "success" or latency is None:
+            return
+
+        self._latencies += 1
+        if self._smoothed_latency is None:
+            self._smoothed_latency = self._baseline_latency = latency
+        else:
+            self._smoothed_latency = 0.8 * self._smoothed_latency + 0.2 * latency
+            # a plain mean over the first requests, so the first ones weigh no more
+            weight = max(1 / self._latencies, 1 / self.baseline_window)
+            self._baseline_latency += weight * (latency - self._baseline_latency)
+
+        if self._smoothed_latency > self.latency_tolerance * self._baseline_latency:
+            if now - self._last_decrease >= self._smoothed_latency:
+                self._limit = max(
+                    self.min_limit,
+                    self._limit * self.latency_backoff_ratio,
+                )
+                self._last_decrease = now
+        elif self._in_flight + 1 >= int(self._limit) / 2:
+            # only grow while the current limit is actually being used
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+    def _record_change(self, previous, latency):
+        now = time.monotonic()
+        self.history.append((now - self._start, int(self._limit)))
+        if now - self._last_log >= self.log_interval:
+            self._last_log = now
+            logger.info(
+                f"Concurrency for {self.name}: {previous} -> {int(self._limit)} "
+                f"(in flight: {self._in_flight}, smoothed latency: "
+                f"{self._smoothed_latency or 0:.2f}s, 429s: "
+                f"{self.counts['rate_limited']}, 5xx: {self.counts['server_error']})",
+            )
+
+    @contextmanager
+    def slot(self):
+        with time_phase("queue_wait"):
+            self.acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException as exc:
+            self.release(time.perf_counter() - start, classify_exception(exc))
+            raise
+        self.release(time.perf_counter() - start)
+
+    @asynccontextmanager
+    async def aslot(self):
+        with time_phase("queue_wait"):
+            await self.aacquire()
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException as exc:
+            self.release(time.perf_counter() - start, classify_exception(exc))
+            raise
+        self.release(time.perf_counter() - start)
+
+    def summary(self):
+        limits = [limit for _, limit in self.history]
+        return {
+            "name": self.name,
+            "final_limit": self.limit,
+            "min_limit": min(limits),
+            "max_limit": max(limits),
+            "baseline_latency": self._baseline_latency,
+            "history": list(self.history),
+            **self.counts,
+        }
+
+
+def _set_waiter_done(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_concurrency_limiter(api_base, **kwargs):
+    """Return the limiter shared by every model sending requests to ``api_base``."""
+    with _limiters_lock:
+        if api_base not in _limiters:
+            _limiters[api_base] = AdaptiveConcurrencyLimiter(api_base, **kwargs)
+        return _limiters[api_base]
+
+
+def log_concurrency_summary():
+    for limiter in _limiters.values():
+        summary = limiter.summary()
+        logger.info(
+            f"Concurrency for {summary['name']}: final {summary['final_limit']}, "
+            f"range {summary['min_limit']}-{summary['max_limit']}, "
+            f"success: {summary['success']}, 429s: {summary['rate_limited']}, "
+            f"5xx: {summary['server_error']}, timeouts: {summary['timeout']}",
+        )
+        logger.info(
+            f"Concurrency timeline for {summary['name']}: "
+            + ", ".join(f"{t:.0f}s={limit}" for t, limit in summary["history"]),
+        )
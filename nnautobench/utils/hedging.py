@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import contextvars
+import logging
+import threading
+from collections import deque
+
+from nnautobench.utils.rate_limiter import estimate_request_tokens
+from nnautobench.utils.request_stats import record_request_stat
+
+logger = logging.getLogger(__name__)
+
+
+class RequestHedger:
+    """Sends a duplicate of a request that is slower than the running latency
+    quantile of its model; the first successful response wins.
+
+    Hedging covers a single attempt, retries are left to the caller, and the
+    latencies are those of the requests alone, reported by the model through
+    ``record_latency``. Hedging starts once ``min_samples`` of them have been
+    observed. The losing request is cancelled where possible (async); a
+    synchronous loser finishes its attempt in the background and its usage is
+    counted as extra. ``close`` shuts the thread pool down at the end of a run.
+    """
+
+    def __init__(
+        self,
+        name,
+        quantile=0.95,
+        window=500,
+        min_samples=20,
+        max_workers=64,
+    ):
+        self.name = name
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.tokens = 0
+        self.extra_tokens = 0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        # every hedged call occupies two threads: the original and the duplicate
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=2 * max_workers,
+            thread_name_prefix="hedge",
+        )
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging, or None while still warming up."""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[int(self.quantile * (len(latencies) - 1))]
+
+    def record_latency(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def _count(self, response, hedged=False, hedge_won=False):
+        with self._lock:
+            self.requests += 1
+            self.hedged += hedged
+            self.hedge_wins += hedge_won
+            if response.usage is not None:
+                self.tokens += response.usage.total_tokens
+        if hedged:
+            record_request_stat("hedged_requests", 1, add=True)
+        return response
+
+    def _add_extra_tokens(self, tokens):
+        with self._lock:
+            self.extra_tokens += tokens
+
+    def _settle_loser(self, future, kwargs):
+        # the loser still costs its real usage, or roughly its prompt if it failed
+        if future.cancelled() or future.exception() is not None:
+            self._add_extra_tokens(estimate_request_tokens(kwargs))
+        elif future.result().usage is not None:
+            self._add_extra_tokens(future.result().usage.total_tokens)
+
+    def call(self, create, kwargs):
+        """Run ``create()``, hedging it with a second call if it is too slow."""
+        delay = self.hedge_delay()
+        if delay is None:
+            return self._count(create())
+
+        # copy the context so per-row stats follow the request into the pool
+        primary = self._executor.submit(contextvars.copy_context().run, create)
+        done, _ = concurrent.futures.wait([primary], timeout=delay)
+        if done:
+            return self._count(primary.result())
+
+        hedge = self._executor.submit(contextvars.copy_context().run, create)
+        pending = {primary, hedge}
+        winner = None
+        while pending and winner is None:
+            done, pending = concurrent.futures.wait(
+                pending,
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+            winner = next((f for f in done if f.exception() is None), None)
+        if winner is None:
+            return primary.result()
+        loser = hedge if winner is primary else primary
+        loser.add_done_callback(lambda future: self._settle_loser(future, kwargs))
+        return self._count(winner.result(), True, hedge_won=winner is hedge)
+
+    async def acall(self, create, kwargs):
+        delay = self.hedge_delay()
+        if delay is None:
+            return self._count(await create())
+
+        primary = asyncio.ensure_future(create())
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return self._count(primary.result())
+
+            hedge = asyncio.ensure_future(create())
+            pending = {primary, hedge}
+            winner = None
+            while pending and winner is None:
+                done, pending = await asyncio.wait(
+                    pending,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                winner = next((t for t in done if t.exception() is None), None)
+            if winner is None:
+                return primary.result()
+            loser = hedge if winner is primary else primary
+            loser.add_done_callback(lambda task: self._settle_loser(task, kwargs))
+            return self._count(winner.result(), True, hedge_won=winner is hedge)
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def close(self):
+        # losers still running only settle their usage, there is nothing to wait for
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def summary(self):
+        return {
+            "name": self.name,
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "hedge_rate": self.hedged / self.requests if self.requests else 0.0,
+            "tokens": self.tokens,
+            "extra_tokens": self.extra_tokens,
+            "hedge_delay": self.hedge_delay(),
+        }
+
+    def log_summary(self):
+        summary = self.summary()
+        delay = summary["hedge_delay"]
+        logger.info(
+            f"Hedging for {summary['name']}: {summary['hedged']} of "
+            f"{summary['requests']} requests hedged ({summary['hedge_rate']:.2%}), "
+            f"{summary['hedge_wins']} won by the hedge, "
+            f"{summary['extra_tokens']} extra tokens on top of {summary['tokens']}, "
+            f"final delay {'n/a' if delay is None else f'{delay:.2f}s'}",
+        )
@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import logging
+import threading
+import time
+import weakref
+
+import httpx
+
+from nnautobench.utils.load_balancer import AsyncLoadBalancedTransport
+from nnautobench.utils.load_balancer import get_load_balancer
+from nnautobench.utils.load_balancer import LoadBalancedTransport
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HTTP_CLIENT_SETTINGS = {
+    "max_connections": 64,
+    "max_keepalive_connections": None,
+    "keepalive_expiry": 30.0,
+    "connect_timeout": 10.0,
+    "read_timeout": 600.0,
+    "http2": False,
+    # several URLs of the same deployment are load balanced, see load_balancer
+    "replicas": None,
+    "load_balancing": "least_outstanding",
+}
+
+
+class HTTPClientStats:
+    """Counts requests, newly opened connections and time spent waiting for one.
+
+    The wait of a request is the time until the pool hands it a connection,
+    so it includes the TCP/TLS handshake when a new connection is opened.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.requests = 0
+        self.new_connections = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    def record_connect(self):
+        with self._lock:
+            self.new_connections += 1
+
+    def record_request(self, wait):
+        with self._lock:
+            self.requests += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def summary(self):
+        reused = max(self.requests - self.new_connections, 0)
+        return {
+            "name": self.name,
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reuse_rate": reused / self.requests if self.requests else 0.0,
+            "avg_wait": self.total_wait / self.requests if self.requests else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+
+class _Waiter:
+    # the first trace event of a request fires once it holds a connection
+    def __init__(self, stats):
+        self.stats = stats
+        self.start = time.perf_counter()
+        self.wait = None
+
+    def on_event(self, name):
+        if self.wait is None:
+            self.wait = time.perf_counter() - self.start
+        if name == "connection.connect_tcp.complete":
+            self.stats.record_connect()
+
+    def done(self):
+        self.stats.record_request(
+            self.wait if self.wait is not None else time.perf_counter() - self.start,
+        )
+
+
+class InstrumentedTransport(httpx.HTTPTransport):
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    def handle_request(self, request):
+        waiter = _Waiter(self.stats)
+        request.extensions["trace"] = lambda name, info: waiter.on_event(name)
+        try:
+            return super().handle_request(request)
+        finally:
+            waiter.done()
+
+
+class AsyncInstrumentedTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    async def handle_async_request(self, request):
+        waiter = _Waiter(self.stats)
+
+        async def trace(name, info):
+            waiter.on_event(name)
+
+        request.extensions["trace"] = trace
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            waiter.done()
+
+
+_settings = {}
+_stats = {}
+_clients = {}
+# async clients are bound to the event loop they were first used on
+_async_clients = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def configure_http_client(api_base, **settings):
+    """Set the pool and timeout settings of the client created for ``api_base``.
+
+    Only takes effect for clients that have not been created yet.
+    """
+    with _lock:
+        _settings[api_base] = {**DEFAULT_HTTP_CLIENT_SETTINGS, **settings}
+
+
+def _client_kwargs(api_base):
+    settings = _settings.get(api_base, DEFAULT_HTTP_CLIENT_SETTINGS)
+    http2 = settings["http2"]
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("HTTP/2 needs the h2 package (pip install httpx[http2])")
+        http2 = False
+    max_keepalive = settings["max_keepalive_connections"]
+    limits = httpx.Limits(
+        max_connections=settings["max_connections"],
+        # keeping every pooled connection alive avoids reconnect churn at full load
+        max_keepalive_connections=(
+            settings["max_connections"] if max_keepalive is None else max_keepalive
+        ),
+        keepalive_expiry=settings["keepalive_expiry"],
+    )
+    timeout = httpx.Timeout(
+        settings["read_timeout"],
+        connect=settings["connect_timeout"],
+    )
+    return dict(limits=limits, http2=http2), timeout
+
+
+def _get_stats(api_base):
+    if api_base not in _stats:
+        _stats[api_base] = HTTPClientStats(api_base or "default")
+    return _stats[api_base]
+
+
+def _get_balancer(api_base):
+    settings = _settings.get(api_base, DEFAULT_HTTP_CLIENT_SETTINGS)
+    replicas = settings["replicas"]
+    if not replicas or len(replicas) < 2:
+        return None
+    return get_load_balancer(
+        api_base,
+        replicas,
+        policy=settings["load_balancing"],
+    )
+
+
+def _create_transport(api_base, transport_class, balanced_class):
+    transport_kwargs, timeout = _client_kwargs(api_base)
+    stats = _get_stats(api_base)
+    balancer = _get_balancer(api_base)
+    if balancer is None:
+        return transport_class(stats, **transport_kwargs), timeout
+    # one connection pool per replica
+    transports = {
+        replica.url: transport_class(stats, **transport_kwargs)
+        for replica in balancer.replicas
+    }
+    return balanced_class(balancer, transports), timeout
+
+
+def get_http_client(api_base):
+    """Return the pooled client shared by every model sending requests to ``api_base``."""
+    with _lock:
+        if api_base not in _clients:
+            transport, timeout = _create_transport(
+                api_base,
+                InstrumentedTransport,
+                LoadBalancedTransport,
+            )
+            _clients[api_base] = httpx.Client(transport=transport, timeout=timeout)
+        return _clients[api_base]
+
+
+def get_async_http_client(api_base):
+    """Async counterpart of ``get_http_client`` for the running event loop."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        if api_base not in clients:
+            transport, timeout = _create_transport(
+                api_base,
+                AsyncInstrumentedTransport,
+                AsyncLoadBalancedTransport,
+            )
+            clients[api_base] = httpx.AsyncClient(
+                transport=transport,
+                timeout=timeout,
+            )
+        return clients[api_base]
+
+
+def log_http_client_summary():
+    for stats in _stats.values():
+        summary = stats.summary()
+        if not summary["requests"]:
+            continue
+        logger.info(
+            f"HTTP connections for {summary['name']}: {summary['requests']} requests, "
+            f"{summary['new_connections']} new connections "
+            f"(reuse rate {summary['reuse_rate']:.2%}), "
+            f"connection wait avg {summary['avg_wait'] * 1000:.1f}ms "
+            f"max {summary['max_wait'] * 1000:.1f}ms",
+        )
@@ -1,8 +1,195 @@
 from __future__ import annotations
 
 import base64
+import io
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
 
+from PIL import Image
 
-def encode_image_base64(image_path):
+from nnautobench.utils.request_stats import time_phase
+
+
+class EncodedImageCache:
+    """Thread-safe LRU cache of base64 image payloads, bounded by total bytes.
+
+    Entries are keyed by path and encoding variant, and invalidated when the
+    file's mtime or size changes.
+    """
+
+    def __init__(self, max_bytes=512 * 1024**2):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_encode(self, image_path, encode, variant=""):
+        stat = os.stat(image_path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        key = (image_path, variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # encode outside the lock so other threads keep hitting the cache
+        payload = encode(image_path)
+        if len(payload) > self.max_bytes:
+            return payload
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[1])
+            self._entries[key] = (version, payload)
+            self._size += len(payload)
+            while self._size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+        return payload
+
+    def resize(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            while self._size > self.max_bytes and self._entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "cached_bytes": self._size,
+            "entries": len(self._entries),
+        }
+
+
+class ImagePreprocessing:
+    """Downscale / recompress / grayscale images before they are base64 encoded.
+
+    With every option left at its default images are sent untouched.
+    """
+
+    def __init__(
+        self,
+        max_long_edge=None,
+        image_format=None,
+        quality=85,
+        grayscale=False,
+    ):
+        self.configure(max_long_edge, image_format, quality, grayscale)
+
+    def configure(
+        self,
+        max_long_edge=None,
+        image_format=None,
+        quality=85,
+        grayscale=False,
+    ):
+        if image_format is not None and image_format.lower() not in (
+            "jpeg",
+            "webp",
+            "png",
+        ):
+            raise ValueError(f"Unsupported image format: {image_format}")
+        self.max_long_edge = max_long_edge
+        self.image_format = image_format.lower() if image_format else None
+        self.quality = quality
+        self.grayscale = grayscale
+
+    @property
+    def enabled(self):
+        return bool(self.max_long_edge or self.image_format or self.grayscale)
+
+    @property
+    def signature(self):
+        # distinguishes cached payloads produced under different settings
+        return (
+            f"{self.max_long_edge}:{self.image_format}:{self.quality}:{self.grayscale}"
+        )
+
+    def __call__(self, image_path):
+        """Return ``(image bytes, mime type)`` of the image as it will be sent."""
+        if not self.enabled:
+            with open(image_path, "rb") as image_file:
+                return image_file.read(), guess_mime_type(image_path)
+
+        with Image.open(image_path) as image:
+            image_format = self.image_format or (image.format or "png").lower()
+            image.load()
+            if self.grayscale:
+                image = image.convert("L")
+            if self.max_long_edge and max(image.size) > self.max_long_edge:
+                image.thumbnail(
+                    (self.max_long_edge, self.max_long_edge),
+                    Image.Resampling.LANCZOS,
+                )
+            if image_format == "jpeg" and image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            buffer = io.BytesIO()
+            image.save(buffer, format=image_format.upper(), quality=self.quality)
+        return buffer.getvalue(), f"image/{image_format}"
+
+
+def guess_mime_type(image_path):
+    mime_type, _ = mimetypes.guess_type(image_path)
+    return mime_type or "image/jpeg"
+
+
+# shared by every model in the process, few-shot examples repeat across rows
+image_cache = EncodedImageCache()
+image_preprocessing = ImagePreprocessing()
+
+
+def _encode_file_base64(image_path):
     with open(image_path, "rb") as image_file:
         return base64.b64encode(image_file.read()).decode("utf-8")
+
+
+def _encode_data_url(image_path):
+    image_bytes, mime_type = image_preprocessing(image_path)
+    return f"data:{mime_type};base64,{base64.b64encode(image_bytes).decode('utf-8')}"
+
+
+def encode_image_base64(image_path):
+    with time_phase("encode"):
+        return image_cache.get_or_encode(image_path, _encode_file_base64)
+
+
+def encode_image_data_url(image_path):
+    """Data URL of the preprocessed image, labelled with its actual MIME type."""
+    with time_phase("encode"):
+        return image_cache.get_or_encode(
+            image_path,
+            _encode_data_url,
+            variant=image_preprocessing.signature,
+        )
+
+
+def data_url_num_bytes(url):
+    payload = url.split(",", 1)[-1]
+    return len(payload) * 3 // 4 - payload[-2:].count("=")
+
+
+def get_image_payload_bytes(messages):
+    # decoded size of every inline image sent in a chat completion request
+    total = 0
+    for message in messages:
+        if isinstance(message["content"], str):
+            continue
+        for item in message["content"]:
+            if item.get("type") == "image_url":
+                total += data_url_num_bytes(item["image_url"]["url"])
+    return total
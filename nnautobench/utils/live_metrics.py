@@ -0,0 +1,336 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from nnautobench.utils.concurrency import classify_exception
+
+logger = logging.getLogger(__name__)
+
+# upper bounds in seconds of the latency histogram buckets
+REQUEST_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+DOCUMENT_LATENCY_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+OUTCOMES = ("success", "rate_limited", "server_error", "timeout", "error", "cancelled")
+# window of the documents/sec and tokens/sec rates
+RATE_WINDOW = 60.0
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        # (upper bound, observations at or below it) as in the Prometheus format
+        total = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            total += count
+            yield str(bound), total
+
+
+class _TrackedRequest:
+    response = None
+
+
+class LiveMetrics:
+    """Running counters of one model's benchmark while it is in progress.
+
+    Fed by the model layer for every request sent and by ``run_benchmark``
+    for every finished document; read by the metrics endpoint and the status
+    file.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.in_flight = 0
+        self.requests = dict.fromkeys(OUTCOMES, 0)
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.documents = 0
+        self.parsable = 0
+        self.accuracy_sum = 0.0
+        self.request_latency = _Histogram(REQUEST_LATENCY_BUCKETS)
+        self.document_latency = _Histogram(DOCUMENT_LATENCY_BUCKETS)
+        self._start = time.monotonic()
+        # (time, documents, tokens) of the last RATE_WINDOW seconds
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    def _add_recent(self, documents, tokens):
+        now = time.monotonic()
+        self._recent.append((now, documents, tokens))
+        while self._recent[0][0] < now - RATE_WINDOW:
+            self._recent.popleft()
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self, latency, outcome, response=None):
+        with self._lock:
+            self.in_flight -= 1
+            self.requests[outcome] += 1
+            if outcome != "success":
+                return
+            self.request_latency.observe(latency)
+            usage = response.usage if response is not None else None
+            if usage is not None:
+                self.prompt_tokens += usage.prompt_tokens
+                self.completion_tokens += usage.completion_tokens
+                self._add_recent(0, usage.total_tokens)
+
+    def document_finished(self, result):
+        with self._lock:
+            self.documents += 1
+            self.parsable += result["parsing_accuracy"]
+            self.accuracy_sum += result.get("file_accuracy") or 0.0
+            # batch-ingested rows were not timed, cached rows did not wait on
+            # the model; neither counts towards latency or throughput
+            if result.get("time_taken") is None or result.get("cached"):
+                return
+            self.document_latency.observe(result["time_taken"])
+            self._add_recent(1, 0)
+
+    def snapshot(self):
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._start
+            window = min(elapsed, RATE_WINDOW) or 1.0
+            recent = [item for item in self._recent if item[0] >= now - RATE_WINDOW]
+            return {
+                "elapsed_seconds": elapsed,
+                "in_flight": self.in_flight,
+                "requests": dict(self.requests),
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "documents": self.documents,
+                "documents_per_second": sum(item[1] for item in recent) / window,
+                "tokens_per_second": sum(item[2] for item in recent) / window,
+                "file_accuracy": (
+                    self.accuracy_sum / self.documents if self.documents else None
+                ),
+                "parsing_accuracy": (
+                    self.parsable / self.documents if self.documents else None
+                ),
+                "request_latency_seconds": _histogram_snapshot(self.request_latency),
+                "document_latency_seconds": _histogram_snapshot(
+                    self.document_latency,
+                ),
+            }
+
+
+def _histogram_snapshot(histogram):
+    return {
+        "buckets": dict(histogram.cumulative()),
+        "sum": histogram.sum,
+        "count": histogram.count,
+    }
+
+
+@contextmanager
+def track_request(metrics):
+    """Count a request as in flight on ``metrics``, which may be None.
+
+    The caller sets ``response`` on the yielded object so that its usage is
+    counted.
+    """
+    request = _TrackedRequest()
+    if metrics is None:
+        yield request
+        return
+    metrics.request_started()
+    start = time.perf_counter()
+    try:
+        yield request
+    except BaseException as exc:
+        # the losing duplicate of a hedged request is cancelled, not failed
+        outcome = (
+            "cancelled"
+            if isinstance(exc, asyncio.CancelledError)
+            else classify_exception(exc)
+        )
+        metrics.request_finished(time.perf_counter() - start, outcome)
+        raise
+    metrics.request_finished(time.perf_counter() - start, "success", request.response)
+
+
+_live_metrics = {}
+_live_metrics_lock = threading.Lock()
+
+
+def get_live_metrics(name):
+    """Start fresh live metrics for a run of model ``name``."""
+    with _live_metrics_lock:
+        _live_metrics[name] = LiveMetrics(name)
+        return _live_metrics[name]
+
+
+def live_metrics_status():
+    with _live_metrics_lock:
+        metrics = list(_live_metrics.values())
+    return {
+        "updated": datetime.now().isoformat(timespec="seconds"),
+        "models": {live.name: live.snapshot() for live in metrics},
+    }
+
+
+_METRICS = (
+    ("in_flight", "gauge", "Requests sent and not answered yet."),
+    ("requests", "counter", "Requests answered, by outcome."),
+    ("tokens", "counter", "Tokens reported in the usage of responses."),
+    ("tokens_per_second", "gauge", f"Token throughput over {RATE_WINDOW:.0f}s."),
+    ("documents", "counter", "Documents answered and scored."),
+    ("documents_per_second", "gauge", f"Documents answered over {RATE_WINDOW:.0f}s."),
+    ("file_accuracy", "gauge", "Running mean file accuracy."),
+    ("parsing_accuracy", "gauge", "Running fraction of parsable answers."),
+    ("request_latency_seconds", "histogram", "Latency of successful requests."),
+    ("document_latency_seconds", "histogram", "Time taken per document."),
+)
+
+
+def render_openmetrics(status):
+    """Prometheus text exposition of ``live_metrics_status()``."""
+    lines = []
+    for metric, kind, description in _METRICS:
+        name = f"nnautobench_{metric}"
+        if kind == "counter":
+            name += "_total"
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for model, snapshot in status["models"].items():
+            label = f'model="{model}"'
+            if metric == "requests":
+                for outcome, count in snapshot["requests"].items():
+                    lines.append(f'{name}{{{label},outcome="{outcome}"}} {count}')
+            elif metric == "tokens":
+                for token_type in ("prompt", "completion"):
+                    count = snapshot[f"{token_type}_tokens"]
+                    lines.append(f'{name}{{{label},type="{token_type}"}} {count}')
+            elif kind == "histogram":
+                histogram = snapshot[metric]
+                for bound, count in histogram["buckets"].items():
+                    lines.append(f'{name}_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f"{name}_sum{{{label}}} {histogram['sum']}")
+                lines.append(f"{name}_count{{{label}}} {histogram['count']}")
+            elif snapshot[metric] is not None:
+                lines.append(f"{name}{{{label}}} {snapshot[metric]}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body = render_openmetrics(live_metrics_status()).encode()
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path in ("/", "/status"):
+            body = json.dumps(live_metrics_status(), indent=2).encode()
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # scrapes every few seconds would drown the benchmark log
+        pass
+
+
+def write_status_file(path):
+    # readers never see a half-written file
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(live_metrics_status(), f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class LiveMetricsExporter:
+    """Serves the live metrics over HTTP and/or rewrites a JSON status file."""
+
+    def __init__(self, port=None, status_file=None, status_interval=10.0):
+        self.status_file = status_file
+        self.status_interval = status_interval
+        self._server = None
+        self._stopped = threading.Event()
+        self._threads = []
+        if port is not None:
+            self._server = ThreadingHTTPServer(("", port), _MetricsHandler)
+            self._server.daemon_threads = True
+            self._threads.append(
+                threading.Thread(target=self._server.serve_forever, daemon=True),
+            )
+            logger.info(f"Live metrics on http://localhost:{port}/metrics")
+        if status_file is not None:
+            self._threads.append(
+                threading.Thread(target=self._write_status_loop, daemon=True),
+            )
+            logger.info(
+                f"Live status written to {status_file} every {status_interval}s",
+            )
+        for thread in self._threads:
+            thread.start()
+
+    def _write_status_loop(self):
+        while not self._stopped.wait(self.status_interval):
+            try:
+                write_status_file(self.status_file)
+            except OSError as exc:
+                logger.warning(f"Could not write status file: {exc}")
+
+    def close(self):
+        self._stopped.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for thread in self._threads:
+            thread.join()
+        if self.status_file is not None:
+            # the final counters of the run
+            write_status_file(self.status_file)
+
+
+_exporter = None
+_exporter_users = 0
+
+
+def start_live_metrics_exporter(port=None, status_file=None, status_interval=10.0):
+    """Start the exporter, or share the one already started by a concurrent run."""
+    global _exporter, _exporter_users
+    with _live_metrics_lock:
+        if _exporter is None:
+            _exporter = LiveMetricsExporter(port, status_file, status_interval)
+        _exporter_users += 1
+
+
+def stop_live_metrics_exporter():
+    global _exporter, _exporter_users
+    with _live_metrics_lock:
+        _exporter_users -= 1
+        if _exporter_users or _exporter is None:
+            return
+        exporter, _exporter = _exporter, None
+    exporter.close()
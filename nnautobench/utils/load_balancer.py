@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+BALANCING_POLICIES = ("least_outstanding", "latency_weighted")
+
+
+class Replica:
+    """Load, latency and health of one replica behind a load balanced api_base."""
+
+    def __init__(self, url, window=500):
+        self.url = url
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+        self.consecutive_failures = 0
+        self.ejection_streak = 0
+        self.ejected_until = 0.0
+        self.latency_ewma = None
+        self._latencies = deque(maxlen=window)
+
+    def ejected(self, now):
+        return now < self.ejected_until
+
+    def summary(self, elapsed):
+        latencies = sorted(self._latencies)
+        return {
+            "url": self.url,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejections": self.ejections,
+            "throughput": self.requests / elapsed if elapsed > 0 else 0.0,
+            "p50_latency": latencies[len(latencies) // 2] if latencies else 0.0,
+            "p95_latency": (
+                latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0
+            ),
+        }
+
+
+class LoadBalancer:
+    """Routes requests for one api_base across replicas of the same deployment.
+
+    ``least_outstanding`` picks the replica with the fewest requests in flight,
+    ``latency_weighted`` picks at random with weights inversely proportional
+    to each replica's smoothed latency times its load. Transport errors and
+    5xx responses are counted as failures, cancelled requests and timeouts
+    of our own deadlines count neither way; ``max_failures`` in a row eject a
+    replica for ``ejection_seconds``, doubled on each ejection that follows
+    another without a success in between, up to ``max_ejection_seconds``.
+    """
+
+    def __init__(
+        self,
+        api_base,
+        replicas,
+        policy="least_outstanding",
+        max_failures=3,
+        ejection_seconds=10.0,
+        max_ejection_seconds=300.0,
+        ewma_alpha=0.2,
+    ):
+        if policy not in BALANCING_POLICIES:
+            raise ValueError(f"Unknown load balancing policy: {policy}")
+        self.api_base = api_base.rstrip("/")
+        self.replicas = [Replica(url.rstrip("/")) for url in replicas]
+        self.policy = policy
+        self.max_failures = max_failures
+        self.ejection_seconds = ejection_seconds
+        self.max_ejection_seconds = max_ejection_seconds
+        self.ewma_alpha = ewma_alpha
+        self.first_request = None
+        self.last_response = None
+        self._rng = random.Random()
+        self._lock = threading.Lock()
+
+    def _candidates(self, now):
+        healthy = [replica for replica in self.replicas if not replica.ejected(now)]
+        if healthy:
+            return healthy
+        # every replica is ejected: keep going with the one back the soonest
+        return [min(self.replicas, key=lambda replica: replica.ejected_until)]
+
+    def _pick(self, candidates):
+        if self.policy == "least_outstanding":
+            fewest = min(replica.outstanding for replica in candidates)
+            return self._rng.choice(
+                [replica for replica in candidates if replica.outstanding == fewest],
+            )
+        known = [r.latency_ewma for r in candidates if r.latency_ewma is not None]
+        # replicas without a latency yet look as fast as the fastest one
+        fastest = min(known) if known else 1.0
+        weights = [
+            1
+            / (
+                (fastest if replica.latency_ewma is None else replica.latency_ewma)
+                * (replica.outstanding + 1)
+            )
+            for replica in candidates
+        ]
+        return self._rng.choices(candidates, weights=weights)[0]
+
+    def acquire(self):
+        now = time.monotonic()
+        with self._lock:
+            replica = self._pick(self._candidates(now))
+            replica.outstanding += 1
+            replica.requests += 1
+            if self.first_request is None:
+                self.first_request = now
+        return replica
+
+    def release(self, replica, latency=None, ok=None):
+        """End a request on ``replica``; ``ok`` is None when it says nothing
+        about the replica's health.
+        """
+        now = time.monotonic()
+        with self._lock:
+            replica.outstanding -= 1
+            if ok is None:
+                return
+            self.last_response = now
+            if ok:
+                replica.consecutive_failures = 0
+                replica.ejection_streak = 0
+                replica._latencies.append(latency)
+                replica.latency_ewma = (
+                    latency
+                    if replica.latency_ewma is None
+                    else self.ewma_alpha * latency
+                    + (1 - self.ewma_alpha) * replica.latency_ewma
+                )
+                return
+            replica.failures += 1
+            if replica.ejected(now):
+                # still answering requests sent before the ejection
+                return
+            replica.consecutive_failures += 1
+            if replica.consecutive_failures < self.max_failures:
+                return
+            duration = min(
+                self.ejection_seconds * 2**replica.ejection_streak,
+                self.max_ejection_seconds,
+            )
+            replica.ejected_until = now + duration
+            replica.ejections += 1
+            replica.ejection_streak += 1
+            # a single failure after coming back ejects the replica again
+            replica.consecutive_failures = self.max_failures - 1
+        logger.warning(
+            f"Ejected replica {replica.url} of {self.api_base} for {duration:.0f}s "
+            f"after {self.max_failures} consecutive failures",
+        )
+
+    def route(self, request, replica):
+        """Copy of ``request`` sent to ``replica`` instead of the api_base."""
+        url = str(request.url)
+        if not url.startswith(self.api_base):
+            return request
+        target = httpx.URL(replica.url + url[len(self.api_base) :])
+        headers = request.headers.copy()
+        headers["host"] = target.netloc.decode("ascii")
+        return httpx.Request(
+            request.method,
+            target,
+            headers=headers,
+            stream=request.stream,
+            extensions=request.extensions,
+        )
+
+    def summary(self):
+        with self._lock:
+            # throughput of every replica is over the same span
+            elapsed = (
+                self.last_response - self.first_request
+                if self.last_response is not None
+                else 0.0
+            )
+            return {
+                "name": self.api_base,
+                "policy": self.policy,
+                "replicas": [replica.summary(elapsed) for replica in self.replicas],
+            }
+
+
+def _ok(status_code):
+    return status_code < 500
+
+
+def _replica_failed(exc):
+    # read, write and pool timeouts come from the deadline of the request or
+    # the client; only a replica that cannot be reached has failed
+    return isinstance(exc, httpx.TransportError) and not isinstance(
+        exc,
+        (httpx.ReadTimeout, httpx.WriteTimeout, httpx.PoolTimeout),
+    )
+
+
+class LoadBalancedTransport(httpx.BaseTransport):
+    def __init__(self, balancer, transports):
+        self.balancer = balancer
+        self.transports = transports
+
+    def handle_request(self, request):
+        replica = self.balancer.acquire()
+        start = time.perf_counter()
+        try:
+            response = self.transports[replica.url].handle_request(
+                self.balancer.route(request, replica),
+            )
+        except BaseException as exc:
+            self.balancer.release(replica, ok=False if _replica_failed(exc) else None)
+            raise
+        self.balancer.release(
+            replica,
+            time.perf_counter() - start,
+            _ok(response.status_code),
+        )
+        return response
+
+    def close(self):
+        for transport in self.transports.values():
+            transport.close()
+
+
+class AsyncLoadBalancedTransport(httpx.AsyncBaseTransport):
+    def __init__(self, balancer, transports):
+        self.balancer = balancer
+        self.transports = transports
+
+    async def handle_async_request(self, request):
+        replica = self.balancer.acquire()
+        start = time.perf_counter()
+        try:
+            response = await self.transports[replica.url].handle_async_request(
+                self.balancer.route(request, replica),
+            )
+        except BaseException as exc:
+            # the losing duplicate of a hedged request is cancelled, not failed
+            self.balancer.release(replica, ok=False if _replica_failed(exc) else None)
+            raise
+        self.balancer.release(
+            replica,
+            time.perf_counter() - start,
+            _ok(response.status_code),
+        )
+        return response
+
+    async def aclose(self):
+        for transport in self.transports.values():
+            await transport.aclose()
+
+
+_balancers = {}
+_balancers_lock = threading.Lock()
+
+
+def get_load_balancer(api_base, replicas, **kwargs):
+    """Return the balancer shared by every client sending requests to ``api_base``."""
+    with _balancers_lock:
+        if api_base not in _balancers:
+            _balancers[api_base] = LoadBalancer(api_base, replicas, **kwargs)
+        return _balancers[api_base]
+
+
+def log_load_balancer_summary():
+    for balancer in _balancers.values():
+        summary = balancer.summary()
+        for replica in summary["replicas"]:
+            logger.info(
+                f"Replica {replica['url']} of {summary['name']} "
+                f"({summary['policy']}): {replica['requests']} requests "
+                f"({replica['throughput']:.1f}/s), {replica['failures']} failures, "
+                f"{replica['ejections']} ejections, latency p50 "
+                f"{replica['p50_latency']:.2f}s p95 {replica['p95_latency']:.2f}s",
+            )
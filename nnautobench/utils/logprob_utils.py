@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import json
+import logging
+import math
+import re
+
+logger = logging.getLogger(__name__)
+
+
+def _value_end(text, start):
+    """Index just past the JSON value starting at ``text[start]``."""
+    if text[start] == '"':
+        i = start + 1
+        while i < len(text):
+            if text[i] == "\\":
+                i += 2
+                continue
+            if text[i] == '"':
+                return i + 1
+            i += 1
+        return len(text)
+    if text[start] in "[{":
+        depth = 0
+        in_string = False
+        i = start
+        while i < len(text):
+            char = text[i]
+            if in_string:
+                if char == "\\":
+                    i += 1
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char in "[{":
+                depth += 1
+            elif char in "]}":
+                depth -= 1
+                if depth == 0:
+                    return i + 1
+            i += 1
+        return len(text)
+    match = re.compile(r"[,}\]\n]").search(text, start)
+    return match.start() if match else len(text)
+
+
+def find_value_span(text, field):
+    """Character span of ``field``'s value in a JSON answer, or None.
+
+    Handles both ``"field": {"value": ...}`` and flat ``"field": ...`` outputs.
+    """
+    key = re.escape(json.dumps(field, ensure_ascii=False))
+    match = re.search(key + r'\s*:\s*(\{\s*"value"\s*:\s*)?', text)
+    if match is None or match.end() >= len(text):
+        return None
+    start = match.end()
+    return start, _value_end(text, start)
+
+
+def get_logprob_conf_score(logprobs_content, fields):
+    """Per-field confidence from the token logprobs of the answer.
+
+    The confidence of a field is the joint probability of the tokens that
+    overlap its value span, so it costs no extra request.
+    """
+    offsets = []
+    text = ""
+    for token in logprobs_content:
+        offsets.append((len(text), len(text) + len(token.token), token.logprob))
+        text += token.token
+
+    conf_score = {}
+    for field in fields:
+        span = find_value_span(text, field)
+        if span is None:
+            continue
+        start, end = span
+        logprob = sum(
+            token_logprob
+            for token_start, token_end, token_logprob in offsets
+            if token_start < end and token_end > start
+        )
+        conf_score[field] = math.exp(logprob)
+    return conf_score
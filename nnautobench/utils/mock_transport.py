@@ -0,0 +1,340 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import random
+import re
+import threading
+import time
+
+import httpx
+from openai import AsyncOpenAI
+from openai import OpenAI
+
+from nnautobench.utils.prompt_utils import parse_fields
+from nnautobench.utils.request_stats import current_network_phase
+from nnautobench.utils.request_stats import get_current_row
+from nnautobench.utils.token_budget import DEFAULT_IMAGE_TOKENS
+
+logger = logging.getLogger(__name__)
+
+MOCK_API_BASE = "http://mock/v1"
+
+_TOKEN_PATTERN = re.compile(r"\w+|\s+|[^\w\s]")
+
+# request fields the mock answers by; quotes inside JSON strings are escaped,
+# so only keys of the body match
+_PARAM_PATTERN = re.compile(
+    rb'"(model|n|logprobs|top_logprobs|stream|include_usage)":\s*'
+    rb'("[^"]*"|true|false|null|-?\d+)',
+)
+
+
+def count_mock_tokens(content):
+    return len(_TOKEN_PATTERN.findall(content))
+
+
+def mock_logprobs(content, top_logprobs, rng):
+    """Near-certain per-token logprobs of ``content``, as the API returns them."""
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(content):
+        logprob = -0.001 * rng.random()
+        tokens.append(
+            {
+                "token": token,
+                "bytes": list(token.encode("utf-8")),
+                "logprob": logprob,
+                "top_logprobs": [
+                    {
+                        "token": token,
+                        "bytes": list(token.encode("utf-8")),
+                        "logprob": logprob,
+                    },
+                ][:top_logprobs],
+            },
+        )
+    return {"content": tokens}
+
+
+def parse_latency(spec):
+    """Latency sampler in seconds from ``const:S``, ``uniform:LOW:HIGH``,
+    ``exp:MEAN`` or ``lognormal:MEDIAN:SIGMA``.
+    """
+    name, *params = spec.split(":")
+    params = [float(param) for param in params]
+    if name == "const" and len(params) == 1:
+        return lambda rng: params[0]
+    if name == "uniform" and len(params) == 2:
+        return lambda rng: rng.uniform(*params)
+    if name == "exp" and len(params) == 1:
+        return lambda rng: rng.expovariate(1 / params[0]) if params[0] else 0.0
+    if name == "lognormal" and len(params) == 2:
+        # mu of the underlying normal is the log of the median
+        return lambda rng: params[0] * rng.lognormvariate(0, params[1])
+    raise ValueError(f"Invalid latency distribution: {spec}")
+
+
+def parse_request(content):
+    """Small fields of a request body and its estimated prompt tokens.
+
+    Decoding the body would cost more than the harness itself on vision rows,
+    the row being answered is read from the context instead. Prompt tokens
+    are a quarter of the bytes besides the images, plus a flat price per
+    image.
+    """
+    images = 0
+    image_bytes = 0
+    # the other fields follow the messages, after their last image
+    params_start = 0
+    start = content.find(b'"data:')
+    while start != -1:
+        end = content.find(b'"', start + 1)
+        images += 1
+        image_bytes += end - start
+        params_start = end
+        start = content.find(b'"data:', end)
+    params = {
+        key.decode(): json.loads(value)
+        for key, value in _PARAM_PATTERN.findall(content, params_start)
+    }
+    params["prompt_tokens"] = (
+        len(content) - image_bytes
+    ) // 4 + images * DEFAULT_IMAGE_TOKENS
+    return params
+
+
+class MockChatCompletions:
+    """Answers chat completion requests from the annotation of the current row.
+
+    Lets ``run_benchmark`` run without a model, so the harness' own throughput
+    can be measured. Answers are the row's annotated values for the queried
+    fields, with ``field_error_rate`` of them corrupted; confidence follow-up
+    requests get a score of 1 for every field.
+    """
+
+    def __init__(
+        self,
+        latency="const:0",
+        error_rate=0.0,
+        rate_limit_rate=0.0,
+        field_error_rate=0.0,
+        tokens_per_second=None,
+        seed=None,
+    ):
+        self.latency = parse_latency(latency)
+        # decode speed of streamed responses, unlimited when None
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.field_error_rate = field_error_rate
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _answer(self):
+        row = get_current_row()
+        if row is None:
+            return {}
+        fields = parse_fields(row["keys"])
+        if current_network_phase() == "conf_call":
+            return {field: 1 for field in fields}
+        annotated = row["annotation"].get("fields", {})
+        answer = {}
+        for field in fields:
+            value = annotated.get(field, {"value": ""}).get("value", "")
+            if self.field_error_rate and self._rng.random() < self.field_error_rate:
+                value = f"{value}#"
+            answer[field] = {"value": value}
+        return answer
+
+    def respond(self, params):
+        """Return ``(delay, status code, headers, json body)`` for a request.
+
+        ``params`` are the fields returned by ``parse_request``.
+        """
+        delay = self.latency(self._rng)
+        roll = self._rng.random()
+        with self._lock:
+            self.requests += 1
+            if roll < self.rate_limit_rate:
+                self.rate_limited += 1
+                status = 429
+            elif roll < self.rate_limit_rate + self.error_rate:
+                self.errors += 1
+                status = 500
+            else:
+                status = 200
+        if status == 429:
+            error = {"message": "Mock rate limit", "type": "rate_limit_exceeded"}
+            return delay, status, {"retry-after-ms": "10"}, {"error": error}
+        if status == 500:
+            error = {"message": "Mock server error", "type": "server_error"}
+            return delay, status, {}, {"error": error}
+
+        choices = []
+        for i in range(params.get("n") or 1):
+            content = json.dumps(self._answer(), ensure_ascii=False)
+            choice = {
+                "index": i,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": content},
+            }
+            if params.get("logprobs"):
+                choice["logprobs"] = mock_logprobs(
+                    content,
+                    params.get("top_logprobs") or 1,
+                    self._rng,
+                )
+            choices.append(choice)
+        prompt_tokens = params["prompt_tokens"]
+        # the same tokens stream_events sends one per chunk
+        completion_tokens = sum(
+            count_mock_tokens(choice["message"]["content"]) for choice in choices
+        )
+        return (
+            delay,
+            status,
+            {},
+            {
+                "id": f"chatcmpl-mock-{self.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": params.get("model"),
+                "choices": choices,
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            },
+        )
+
+    def stream_events(self, response, params):
+        """Server-sent events of a streamed ``response``, one token per chunk.
+
+        Yields ``(delay, data)`` pairs; the delay of the first token is the
+        request latency already waited by the transport.
+        """
+        interval = 1 / self.tokens_per_second if self.tokens_per_second else 0.0
+        base = {key: response[key] for key in ("id", "created", "model")}
+        base["object"] = "chat.completion.chunk"
+        tokens = [
+            (choice, token, position)
+            for choice in response["choices"]
+            for position, token in enumerate(
+                _TOKEN_PATTERN.findall(choice["message"]["content"]),
+            )
+        ]
+        # choices are decoded side by side, as with n > 1 on a real server
+        tokens.sort(key=lambda item: item[2])
+        for i, (choice, token, position) in enumerate(tokens):
+            delta = {"content": token}
+            if position == 0:
+                delta["role"] = "assistant"
+            chunk_choice = {"index": choice["index"], "delta": delta}
+            if "logprobs" in choice:
+                chunk_choice["logprobs"] = {
+                    "content": choice["logprobs"]["content"][position : position + 1],
+                }
+            yield (interval if i else 0.0), {**base, "choices": [chunk_choice]}
+        for choice in response["choices"]:
+            yield 0.0, {
+                **base,
+                "choices": [
+                    {"index": choice["index"], "delta": {}, "finish_reason": "stop"},
+                ],
+            }
+        if params.get("include_usage"):
+            yield 0.0, {**base, "choices": [], "usage": response["usage"]}
+
+    def summary(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+        }
+
+
+def _read_timeout(request):
+    # honor the client timeout like a real transport would
+    return request.extensions.get("timeout", {}).get("read")
+
+
+def _sse(data):
+    return f"data: {json.dumps(data)}\n\n".encode()
+
+
+class MockTransport(httpx.BaseTransport):
+    def __init__(self, responder):
+        self.responder = responder
+
+    def _stream(self, response, params):
+        for delay, chunk in self.responder.stream_events(response, params):
+            if delay:
+                time.sleep(delay)
+            yield _sse(chunk)
+        yield b"data: [DONE]\n\n"
+
+    def handle_request(self, request):
+        params = parse_request(request.content)
+        delay, status, headers, body = self.responder.respond(params)
+        read_timeout = _read_timeout(request)
+        if read_timeout is not None and delay > read_timeout:
+            time.sleep(read_timeout)
+            raise httpx.ReadTimeout("Mock read timeout", request=request)
+        if delay:
+            time.sleep(delay)
+        if status == 200 and params.get("stream"):
+            return httpx.Response(
+                status,
+                headers={"content-type": "text/event-stream"},
+                content=self._stream(body, params),
+            )
+        return httpx.Response(status, headers=headers, json=body)
+
+
+class AsyncMockTransport(httpx.AsyncBaseTransport):
+    def __init__(self, responder):
+        self.responder = responder
+
+    async def _stream(self, response, params):
+        for delay, chunk in self.responder.stream_events(response, params):
+            if delay:
+                await asyncio.sleep(delay)
+            yield _sse(chunk)
+        yield b"data: [DONE]\n\n"
+
+    async def handle_async_request(self, request):
+        params = parse_request(await request.aread())
+        delay, status, headers, body = self.responder.respond(params)
+        read_timeout = _read_timeout(request)
+        if read_timeout is not None and delay > read_timeout:
+            await asyncio.sleep(read_timeout)
+            raise httpx.ReadTimeout("Mock read timeout", request=request)
+        if delay:
+            await asyncio.sleep(delay)
+        if status == 200 and params.get("stream"):
+            return httpx.Response(
+                status,
+                headers={"content-type": "text/event-stream"},
+                content=self._stream(body, params),
+            )
+        return httpx.Response(status, headers=headers, json=body)
+
+
+def create_mock_clients(responder):
+    """Sync and async OpenAI clients served in-process by ``responder``."""
+    client = OpenAI(
+        api_key="mock",
+        base_url=MOCK_API_BASE,
+        http_client=httpx.Client(transport=MockTransport(responder)),
+    )
+    aclient = AsyncOpenAI(
+        api_key="mock",
+        base_url=MOCK_API_BASE,
+        http_client=httpx.AsyncClient(transport=AsyncMockTransport(responder)),
+    )
+    return client, aclient
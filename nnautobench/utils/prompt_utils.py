@@ -2,17 +2,45 @@ from __future__ import annotations
 
 import ast
 import json
+from functools import lru_cache
 from typing import Any
 
 
-def create_field_extraction_prompt(fields, descriptions=None, multiple_images=False):
+@lru_cache(maxsize=4096)
+def parse_fields(fields: str) -> tuple:
+    # the dataset stores Queried_labels as a python list literal
+    return tuple(ast.literal_eval(fields))
+
+
+def _fields_key(fields) -> tuple:
     if isinstance(fields, str):
-        fields = ast.literal_eval(fields)
+        return parse_fields(fields)
+    return tuple(fields)
+
+
+def _descriptions_key(descriptions):
+    if descriptions is None:
+        return None
+    return tuple(sorted(descriptions.items()))
+
+
+def create_field_extraction_prompt(fields, descriptions=None, multiple_images=False):
+    return _field_extraction_prompt(
+        _fields_key(fields),
+        _descriptions_key(descriptions),
+        multiple_images,
+    )
+
+
+@lru_cache(maxsize=1024)
+def _field_extraction_prompt(fields, descriptions, multiple_images):
+    # the prompt only depends on the label set, so it is built once per set
     if descriptions is None:
         field_instructions = "\n".join(
             f"{i+1}. {field}" for i, field in enumerate(fields)
         )
     else:
+        descriptions = dict(descriptions)
         field_instructions = ""
         for i, field in enumerate(fields):
             label_string = field.replace("\n", " ")
@@ -42,9 +70,19 @@ def create_field_extraction_prompt_ocr(
     ocr_text="",
     **kwargs,
 ):
-    if isinstance(fields, str):
-        fields = ast.literal_eval(fields)
+    head, tail = _field_extraction_prompt_ocr_template(
+        _fields_key(fields),
+        _descriptions_key(descriptions),
+        disable_output_format,
+    )
+    return f"{head}{ocr_text}{tail}"
+
+
+@lru_cache(maxsize=1024)
+def _field_extraction_prompt_ocr_template(fields, descriptions, disable_output_format):
+    # everything but the OCR text, which is substituted per row
     if descriptions:
+        descriptions = dict(descriptions)
         label_instructions = "\n".join(
             f"{i+1}. {col}: {descriptions[col] if col in descriptions else ''}"
             for i, col in enumerate(fields)
@@ -52,9 +90,10 @@ def create_field_extraction_prompt_ocr(
     else:
         label_instructions = "\n".join(f"{i+1}. {col}" for i, col in enumerate(fields))
     json_dict = {field: {"value": ".."} for field in fields}
-    prompt = f"""Consider the following document text
+    head = """Consider the following document text
 --------------------------------
-{ocr_text}
+"""
+    tail = f"""
 --------------------------------
 From this document, extract the following fields
 
@@ -63,10 +102,10 @@ From this document, extract the following fields
 The output should be formatted as the flattened JSON format. If value is not present for a field then \"\" should be provided. If there are more than 1 value for a field, give all the values as an array. Do not give any additional explanation
 """
     if not disable_output_format:
-        prompt += f"""OUTPUT JSON FORMAT
+        tail += f"""OUTPUT JSON FORMAT
 {json.dumps(json_dict)}
     """
-    return prompt
+    return head, tail
 
 
 def create_ocr_prompt():
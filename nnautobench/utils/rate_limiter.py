@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+
+from nnautobench.utils.token_budget import estimate_prompt_tokens
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_request_tokens(kwargs):
+    """Guess of the prompt tokens of a chat completion request before it is sent."""
+    return estimate_prompt_tokens(kwargs.get("messages", []))
+
+
+class _Bucket:
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        # the level may go negative, callers wait until it is paid back
+        self._refill(now)
+        self.level -= amount
+        return max(0.0, -self.level / self.rate)
+
+    def refund(self, amount, now):
+        self._refill(now)
+        self.level = min(self.capacity, self.level + amount)
+
+
+class TokenBucketRateLimiter:
+    """Requests-per-minute and tokens-per-minute limits for one provider key.
+
+    Token cost is charged up front from an estimate and corrected with
+    ``adjust`` once the ``usage`` of the response is known.
+    """
+
+    def __init__(self, name, requests_per_minute=None, tokens_per_minute=None):
+        self.name = name
+        self._lock = threading.Lock()
+        self._requests = _Bucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = _Bucket(tokens_per_minute) if tokens_per_minute else None
+        self.total_wait = 0.0
+        self.throttled_requests = 0
+        self.requests = 0
+
+    def reserve(self, tokens):
+        """Charge one request of ``tokens`` and return the seconds to wait before sending it."""
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            if self._requests is not None:
+                wait = max(wait, self._requests.reserve(1, now))
+            if self._tokens is not None:
+                wait = max(wait, self._tokens.reserve(tokens, now))
+            self.requests += 1
+            if wait > 0:
+                self.throttled_requests += 1
+                self.total_wait += wait
+            return wait
+
+    def acquire(self, tokens):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def adjust(self, estimated_tokens, actual_tokens):
+        if self._tokens is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            difference = estimated_tokens - actual_tokens
+            if difference >= 0:
+                self._tokens.refund(difference, now)
+            else:
+                self._tokens.reserve(-difference, now)
+
+    def summary(self):
+        return {
+            "name": self.name,
+            "requests": self.requests,
+            "throttled_requests": self.throttled_requests,
+            "total_wait": self.total_wait,
+        }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(key, requests_per_minute=None, tokens_per_minute=None):
+    """Return the limiter shared by every worker sending requests under ``key``.
+
+    Returns None when neither limit is configured.
+    """
+    if not requests_per_minute and not tokens_per_minute:
+        return None
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = TokenBucketRateLimiter(
+                key,
+                requests_per_minute,
+                tokens_per_minute,
+            )
+        return _limiters[key]
+
+
+def log_rate_limit_summary():
+    for limiter in _limiters.values():
+        summary = limiter.summary()
+        logger.info(
+            f"Rate limiter {summary['name']}: {summary['throttled_requests']}/"
+            f"{summary['requests']} requests throttled, "
+            f"{summary['total_wait']:.2f}s spent waiting",
+        )
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# where the time of a row goes, reported in its "timings"
+PHASES = (
+    "prompt_build",
+    "encode",
+    "queue_wait",
+    "network",
+    "conf_call",
+    "parse",
+    "score",
+)
+
+# per-row stats collected by the model layer while a Predictor processes a row;
+# context variables follow both worker threads and asyncio tasks
+_current_stats = contextvars.ContextVar("request_stats", default=None)
+# the row being answered, for code below the model layer such as mock transports
+_current_row = contextvars.ContextVar("current_row", default=None)
+# clocks of the phases of the current row, see time_phase
+_phase_clocks = contextvars.ContextVar("phase_clocks", default=None)
+# innermost block timed with time_phase, paused while a nested phase runs
+_current_block = contextvars.ContextVar("current_block", default=None)
+# phase charged with the network time of requests, see network_phase
+_network_phase = contextvars.ContextVar("network_phase", default="network")
+
+
+@contextmanager
+def collect_request_stats():
+    """Collect everything recorded with ``record_request_stat`` into a dict."""
+    stats = {}
+    token = _current_stats.set(stats)
+    clocks_token = _phase_clocks.set(_PhaseClocks(stats))
+    try:
+        yield stats
+    finally:
+        _phase_clocks.reset(clocks_token)
+        _current_stats.reset(token)
+
+
+def record_request_stat(name, value, add=False):
+    stats = _current_stats.get()
+    if stats is None:
+        return
+    if add:
+        stats[name] = stats.get(name, 0) + value
+    else:
+        stats[name] = value
+
+
+class _PhaseClocks:
+    """Wall-clock time of each phase of a row.
+
+    A phase is running while at least one of its blocks is, so blocks that
+    overlap in other threads or tasks, like hedged requests or parallel
+    consistency samples, are only counted once.
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.lock = threading.Lock()
+        self._running = {}
+        self._since = {}
+
+    def start(self, name, now):
+        if not self._running.get(name):
+            self._since[name] = now
+        self._running[name] = self._running.get(name, 0) + 1
+
+    def stop(self, name, now):
+        self._running[name] -= 1
+        if not self._running[name]:
+            timings = self.stats.setdefault("timings", dict.fromkeys(PHASES, 0.0))
+            timings[name] += now - self._since[name]
+
+
+class _Block:
+    def __init__(self, clocks, name):
+        self.clocks = clocks
+        self.name = name
+        self.paused = 0
+        self.done = False
+
+    def pause(self, now):
+        if not self.done and not self.paused:
+            self.clocks.stop(self.name, now)
+        self.paused += 1
+
+    def resume(self, now):
+        self.paused -= 1
+        if not self.done and not self.paused:
+            self.clocks.start(self.name, now)
+
+    def finish(self, now):
+        if not self.paused:
+            self.clocks.stop(self.name, now)
+        self.done = True
+
+
+@contextmanager
+def time_phase(name):
+    """Add the time spent in the block to phase ``name`` of the current row.
+
+    The block does not count while a phase timed inside it runs, so every
+    second is only charged to the innermost phase, and overlapping blocks of
+    the same phase count their wall-clock span.
+    """
+    clocks = _phase_clocks.get()
+    if clocks is None:
+        yield
+        return
+    parent = _current_block.get()
+    block = _Block(clocks, name)
+    with clocks.lock:
+        now = time.perf_counter()
+        if parent is not None:
+            parent.pause(now)
+        clocks.start(name, now)
+    token = _current_block.set(block)
+    try:
+        yield
+    finally:
+        _current_block.reset(token)
+        with clocks.lock:
+            now = time.perf_counter()
+            block.finish(now)
+            if parent is not None:
+                parent.resume(now)
+
+
+@contextmanager
+def network_phase(name):
+    """Charge requests sent in the block to phase ``name`` instead of network."""
+    token = _network_phase.set(name)
+    try:
+        yield
+    finally:
+        _network_phase.reset(token)
+
+
+def current_network_phase():
+    return _network_phase.get()
+
+
+def time_network():
+    return time_phase(current_network_phase())
+
+
+def append_request_stat(name, value):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.setdefault(name, []).append(value)
+
+
+@contextmanager
+def row_context(**row):
+    token = _current_row.set(row)
+    try:
+        yield
+    finally:
+        _current_row.reset(token)
+
+
+def get_current_row():
+    return _current_row.get()
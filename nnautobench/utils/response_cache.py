@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from openai.types.chat import ChatCompletion
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(kwargs):
+    """Content hash of a chat completion request: endpoint, model, messages and
+    sampling params.
+    """
+    payload = json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """On-disk SQLite cache of chat completion responses keyed by request content.
+
+    Entries older than ``max_age_seconds`` are dropped, and the least recently
+    used entries are dropped once the stored responses exceed ``max_size_bytes``.
+    Access times of hits are written along with the next write, so a hit never
+    commits.
+    """
+
+    def __init__(
+        self,
+        path="cache/responses.sqlite",
+        max_size_bytes=2 * 1024**3,
+        max_age_seconds=30 * 24 * 3600,
+        evict_every=200,
+    ):
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self.max_age_seconds = max_age_seconds
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        # key -> last access time of hits not written yet
+        self._accessed = {}
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)",
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)",
+        )
+        self._conn.commit()
+        self.evict()
+
+    def get(self, kwargs):
+        key = cache_key(kwargs)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age_seconds:
+                self.misses += 1
+                return None
+            self._accessed[key] = now
+            self.hits += 1
+        return ChatCompletion.model_validate_json(row[0])
+
+    def _write_accessed(self):
+        # called with the lock held, committed by the caller
+        if self._accessed:
+            self._conn.executemany(
+                "UPDATE responses SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._accessed.items()],
+            )
+            self._accessed.clear()
+
+    def put(self, kwargs, response):
+        key = cache_key(kwargs)
+        value = response.model_dump_json()
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            self._write_accessed()
+            self._conn.commit()
+            self.writes += 1
+            evict = self.writes % self.evict_every == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        with self._lock:
+            # least recently used is judged on up to date access times
+            self._write_accessed()
+            self._conn.execute(
+                "DELETE FROM responses WHERE created < ?",
+                (time.time() - self.max_age_seconds,),
+            )
+            total_size = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses",
+            ).fetchone()[0]
+            if total_size > self.max_size_bytes:
+                # walk from least recently used until we are back under budget
+                to_free = total_size - self.max_size_bytes
+                freed = 0
+                stale_keys = []
+                for key, size in self._conn.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed",
+                ):
+                    if freed >= to_free:
+                        break
+                    stale_keys.append((key,))
+                    freed += size
+                self._conn.executemany(
+                    "DELETE FROM responses WHERE key = ?",
+                    stale_keys,
+                )
+            self._conn.commit()
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "writes": self.writes,
+        }
+
+    def close(self):
+        with self._lock:
+            self._write_accessed()
+            self._conn.commit()
+            self._conn.close()
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ResultsWriter:
+    """Appends result rows to a JSONL file as soon as they are produced.
+
+    Every row is flushed to the OS immediately; ``os.fsync`` is batched to
+    once per ``fsync_every`` rows or ``fsync_interval`` seconds, whichever
+    comes first, so a crash loses at most the last batch.
+    """
+
+    def __init__(self, path, fsync_every=50, fsync_interval=5.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.rows_written = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        _drop_partial_last_line(path)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, result):
+        line = json.dumps(result, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            self.rows_written += 1
+            self._unsynced += 1
+            if (
+                self._unsynced >= self.fsync_every
+                or time.monotonic() - self._last_sync >= self.fsync_interval
+            ):
+                self._sync()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.flush()
+            self._sync()
+            self._file.close()
+
+
+def _drop_partial_last_line(path):
+    # a crash mid-write can leave a truncated row that would corrupt the next append
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return
+    with open(path, "rb+") as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) == b"\n":
+            return
+        f.seek(0)
+        data = f.read()
+        f.seek(data.rfind(b"\n") + 1)
+        f.truncate()
+    logger.warning(f"Dropped a partially written row at the end of {path}")
+
+
+def load_completed_row_keys(path):
+    """Return the ``row_key`` of every complete row already in a results file."""
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "row_key" in row:
+                completed.add(row["row_key"])
+    return completed
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import asyncio
+import email.utils
+import logging
+import random
+import threading
+import time
+
+import openai
+
+from nnautobench.utils.request_stats import record_request_stat
+
+logger = logging.getLogger(__name__)
+
+# same statuses the OpenAI SDK retries, plus every 5xx
+RETRYABLE_STATUS_CODES = (408, 409, 429)
+
+
+def is_retryable(exc):
+    # APITimeoutError is a subclass of APIConnectionError
+    if isinstance(exc, openai.APIConnectionError):
+        return True
+    status_code = getattr(exc, "status_code", None)
+    return status_code is not None and (
+        status_code in RETRYABLE_STATUS_CODES or status_code >= 500
+    )
+
+
+def get_retry_after(exc):
+    """Seconds the server asked us to wait, from ``retry-after(-ms)`` headers."""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if "retry-after-ms" in headers:
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except (ValueError, TypeError):
+            pass
+    if "retry-after" not in headers:
+        return None
+    try:
+        return float(headers["retry-after"])
+    except (ValueError, TypeError):
+        pass
+    # Retry-After may also be an HTTP date, a malformed one is ignored
+    try:
+        retry_at = email.utils.parsedate_to_datetime(headers["retry-after"])
+    except (ValueError, TypeError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class RetryPolicy:
+    """Retries 429s, 5xx responses, timeouts and connection errors.
+
+    Waits for exponential backoff with full jitter, but never less than the
+    server's ``Retry-After`` capped at ``max_delay``. Gives up after ``max_retries`` retries, when
+    the next attempt would start past the per-request budget
+    ``request_timeout`` (seconds, retries included) or past ``run_deadline``
+    (a ``time.monotonic()`` timestamp); no request starts after the latter.
+    """
+
+    def __init__(
+        self,
+        max_retries=10,
+        base_delay=1.0,
+        max_delay=60.0,
+        request_timeout=None,
+        run_deadline=None,
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.request_timeout = request_timeout
+        self.run_deadline = run_deadline
+        self.retries = 0
+        self.backoff_seconds = 0.0
+        self.gave_up = 0
+        self._lock = threading.Lock()
+
+    def _deadline(self, started):
+        deadlines = [self.run_deadline]
+        if self.request_timeout is not None:
+            deadlines.append(started + self.request_timeout)
+        deadlines = [deadline for deadline in deadlines if deadline is not None]
+        return min(deadlines) if deadlines else None
+
+    def _remaining(self, started):
+        """Time left for the next attempt, None when unbounded."""
+        deadline = self._deadline(started)
+        if deadline is None:
+            return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("Request deadline reached before sending")
+        return remaining
+
+    def _next_delay(self, retry, exc, started):
+        if not is_retryable(exc) or retry >= self.max_retries:
+            return None
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**retry))
+        retry_after = get_retry_after(exc)
+        if retry_after is not None:
+            # a server asking for an hour would otherwise stall the worker
+            delay = max(delay, min(retry_after, self.max_delay))
+        deadline = self._deadline(started)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    def _record(self, delay, exc):
+        with self._lock:
+            self.retries += 1
+            self.backoff_seconds += delay
+        self._record_row(1, delay)
+        logger.debug(f"Retrying in {delay:.2f}s after {type(exc).__name__}: {exc}")
+
+    def _record_row(self, retries, delay):
+        # every row reports its retries, zero included
+        record_request_stat("retries", retries, add=True)
+        record_request_stat("backoff_seconds", delay, add=True)
+
+    def _give_up(self, exc):
+        if is_retryable(exc):
+            with self._lock:
+                self.gave_up += 1
+
+    def call(self, send):
+        """Call ``send(timeout)`` until it succeeds or the policy gives up.
+
+        ``timeout`` is the time left in the budget, or None when unbounded.
+        """
+        started = time.monotonic()
+        retry = 0
+        self._record_row(0, 0.0)
+        while True:
+            try:
+                return send(self._remaining(started))
+            except Exception as exc:
+                delay = self._next_delay(retry, exc, started)
+                if delay is None:
+                    self._give_up(exc)
+                    raise
+                self._record(delay, exc)
+                time.sleep(delay)
+                retry += 1
+
+    async def acall(self, send):
+        started = time.monotonic()
+        retry = 0
+        self._record_row(0, 0.0)
+        while True:
+            try:
+                return await send(self._remaining(started))
+            except Exception as exc:
+                delay = self._next_delay(retry, exc, started)
+                if delay is None:
+                    self._give_up(exc)
+                    raise
+                self._record(delay, exc)
+                await asyncio.sleep(delay)
+                retry += 1
+
+    def summary(self):
+        return {
+            "retries": self.retries,
+            "backoff_seconds": self.backoff_seconds,
+            "gave_up": self.gave_up,
+        }
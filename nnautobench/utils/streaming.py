@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+
+import httpx
+import openai
+from openai.types.chat import ChatCompletion
+
+logger = logging.getLogger(__name__)
+
+# asks the server to report usage in a last chunk, for output tokens/sec
+STREAM_KWARGS = dict(stream=True, stream_options={"include_usage": True})
+
+
+class _StreamAccumulator:
+    # the SDK's ChatCompletionStreamState rebuilds its snapshot on every chunk,
+    # which costs more than the decode being measured on long answers
+    def __init__(self):
+        self.base = None
+        self.usage = None
+        self.choices = {}
+
+    def add(self, chunk):
+        if self.base is None:
+            self.base = dict(
+                id=chunk.id,
+                created=chunk.created,
+                model=chunk.model,
+                system_fingerprint=chunk.system_fingerprint,
+            )
+        if chunk.usage is not None:
+            self.usage = chunk.usage.model_dump()
+        for choice in chunk.choices:
+            state = self.choices.setdefault(
+                choice.index,
+                {"content": [], "logprobs": [], "finish_reason": None},
+            )
+            if choice.delta.content:
+                state["content"].append(choice.delta.content)
+            if choice.logprobs is not None and choice.logprobs.content:
+                state["logprobs"].extend(choice.logprobs.content)
+            if choice.finish_reason is not None:
+                state["finish_reason"] = choice.finish_reason
+
+    def completion(self):
+        return ChatCompletion.construct(
+            **(self.base or {}),
+            object="chat.completion",
+            choices=[
+                {
+                    "index": index,
+                    "finish_reason": state["finish_reason"] or "stop",
+                    "message": {
+                        "role": "assistant",
+                        "content": "".join(state["content"]),
+                    },
+                    "logprobs": (
+                        {"content": [lp.model_dump() for lp in state["logprobs"]]}
+                        if state["logprobs"]
+                        else None
+                    ),
+                }
+                for index, state in sorted(self.choices.items())
+            ],
+            usage=self.usage,
+        )
+
+
+class _StreamTimer:
+    def __init__(self, start):
+        self.start = start
+        self.token_times = []
+
+    def on_chunk(self, chunk):
+        if any(choice.delta.content for choice in chunk.choices):
+            self.token_times.append(time.perf_counter())
+
+    def metrics(self, completion):
+        if not self.token_times:
+            return None
+        first, last = self.token_times[0], self.token_times[-1]
+        # servers without include_usage support: one token per content chunk
+        output_tokens = (
+            completion.usage.completion_tokens
+            if completion.usage is not None
+            else len(self.token_times)
+        )
+        chunks = len(self.token_times)
+        return {
+            "ttft": first - self.start,
+            "itl": (last - first) / (chunks - 1) if chunks > 1 else None,
+            "output_tokens": output_tokens,
+            "output_tokens_per_second": (
+                output_tokens / (last - first) if last > first else None
+            ),
+        }
+
+
+def _connection_error(exc):
+    # errors while reading the body are raw httpx errors, unlike the ones
+    # raised by create(), so retry_policy would not recognise them
+    return openai.APIConnectionError(message=str(exc), request=exc.request)
+
+
+def consume_stream(stream, start):
+    """Assemble a streamed response into a ``ChatCompletion``.
+
+    ``start`` is the ``time.perf_counter()`` at which the request was sent.
+    Returns the completion and its TTFT, inter-token latency and decode
+    speed, or None for those when no content was streamed.
+    """
+    accumulator = _StreamAccumulator()
+    timer = _StreamTimer(start)
+    try:
+        with stream:
+            for chunk in stream:
+                timer.on_chunk(chunk)
+                accumulator.add(chunk)
+    except httpx.TransportError as exc:
+        raise _connection_error(exc) from exc
+    completion = accumulator.completion()
+    return completion, timer.metrics(completion)
+
+
+async def aconsume_stream(stream, start):
+    accumulator = _StreamAccumulator()
+    timer = _StreamTimer(start)
+    try:
+        async with stream:
+            async for chunk in stream:
+                timer.on_chunk(chunk)
+                accumulator.add(chunk)
+    except httpx.TransportError as exc:
+        raise _connection_error(exc) from exc
+    completion = accumulator.completion()
+    return completion, timer.metrics(completion)
+
+
+def _percentile(values, quantile):
+    values = sorted(value for value in values if value is not None)
+    if not values:
+        return None
+    return values[int(quantile * (len(values) - 1))]
+
+
+class StreamingStats:
+    """TTFT, inter-token latency and decode speed of every streamed request."""
+
+    def __init__(self, name):
+        self.name = name
+        self._samples = []
+        self._lock = threading.Lock()
+
+    def record(self, metrics):
+        with self._lock:
+            self._samples.append(metrics)
+
+    def summary(self):
+        with self._lock:
+            samples = list(self._samples)
+        summary = {"streamed_requests": len(samples)}
+        for metric in ("ttft", "itl", "output_tokens_per_second"):
+            values = [sample[metric] for sample in samples]
+            for quantile in (0.5, 0.95):
+                summary[f"{metric}_p{int(quantile * 100)}"] = _percentile(
+                    values,
+                    quantile,
+                )
+        return summary
+
+    def log_summary(self):
+        summary = self.summary()
+        if not summary["streamed_requests"]:
+            return
+
+        def ms(value):
+            return "n/a" if value is None else f"{value * 1000:.1f}ms"
+
+        def rate(value):
+            return "n/a" if value is None else f"{value:.1f}"
+
+        logger.info(
+            f"Streaming for {self.name}: {summary['streamed_requests']} requests, "
+            f"TTFT p50 {ms(summary['ttft_p50'])} p95 {ms(summary['ttft_p95'])}, "
+            f"inter-token p50 {ms(summary['itl_p50'])} p95 {ms(summary['itl_p95'])}, "
+            f"output tokens/s p50 {rate(summary['output_tokens_per_second_p50'])} "
+            f"p95 {rate(summary['output_tokens_per_second_p95'])}",
+        )
@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import base64
+import functools
+import io
+import logging
+import math
+import string
+import threading
+
+from PIL import Image
+
+from nnautobench.utils.request_stats import record_request_stat
+
+logger = logging.getLogger(__name__)
+
+# formatting tokens added to every message of a chat completion
+MESSAGE_OVERHEAD_TOKENS = 4
+# an image whose size cannot be read is priced as a 1024x1024 one
+DEFAULT_IMAGE_TOKENS = 765
+
+_PUNCTUATION = string.punctuation.encode()
+
+
+def estimate_text_tokens(text):
+    """Local guess of the BPE tokens of ``text``, no tokenizer needed.
+
+    Words cost about one token per 4 bytes and punctuation one token each,
+    which keeps digit- and symbol-heavy OCR text from being underestimated.
+    Works on UTF-8 bytes with C-level string methods, since it runs for
+    every request when limits are set.
+    """
+    data = text.encode()
+    letters = data.translate(None, _PUNCTUATION)
+    punctuation = len(data) - len(letters)
+    words = letters.split()
+    return (sum(map(len, words)) + 3 * len(words)) // 4 + punctuation
+
+
+def estimate_image_tokens(width, height):
+    # high detail vision pricing: fit in 2048x2048, shortest side down to 768,
+    # then 170 tokens per 512px tile plus 85
+    scale = min(1.0, 2048 / max(width, height))
+    scale *= min(1.0, 768 / (min(width, height) * scale))
+    tiles = math.ceil(width * scale / 512) * math.ceil(height * scale / 512)
+    return 85 + 170 * tiles
+
+
+@functools.lru_cache(maxsize=64)
+def _data_url_image_tokens(url):
+    # few-shot images recur in every row, their URL string is the cache key
+    try:
+        payload = url.split(",", 1)[1]
+        with Image.open(io.BytesIO(base64.b64decode(payload))) as image:
+            return estimate_image_tokens(*image.size)
+    except Exception:
+        return DEFAULT_IMAGE_TOKENS
+
+
+def estimate_prompt_tokens(messages):
+    """Estimated prompt tokens of the text and image parts of ``messages``."""
+    tokens = 0
+    for message in messages:
+        tokens += MESSAGE_OVERHEAD_TOKENS
+        content = message["content"]
+        if isinstance(content, str):
+            tokens += estimate_text_tokens(content)
+            continue
+        for item in content:
+            if "text" in item:
+                tokens += estimate_text_tokens(item["text"])
+            elif item.get("type") == "image_url":
+                url = item["image_url"]["url"]
+                tokens += (
+                    _data_url_image_tokens(url)
+                    if url.startswith("data:")
+                    else DEFAULT_IMAGE_TOKENS
+                )
+    return tokens
+
+
+class TokenBudget:
+    """Token and dollar spend of one model, with optional hard limits.
+
+    Every request reserves its estimated tokens before it is sent and is
+    settled with the ``usage`` of its response, so requests still in flight
+    count against the limits. ``prices`` are USD per million ``input`` and
+    ``output`` tokens; without them only tokens are counted.
+    """
+
+    def __init__(self, name, prices=None, max_tokens=None, max_cost=None):
+        self.name = name
+        self.prices = prices or {}
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.choices = 0
+        self.estimated_prompt_tokens = 0
+        self.rows_scheduled = 0
+        self.rows_finished = 0
+        self._finished_tokens = 0
+        self._finished_cost = 0.0
+        self._reserved_tokens = 0
+        self._reserved_cost = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def limited(self):
+        return self.max_tokens is not None or self.max_cost is not None
+
+    def cost(self, prompt_tokens, completion_tokens):
+        return (
+            prompt_tokens * self.prices.get("input", 0.0)
+            + completion_tokens * self.prices.get("output", 0.0)
+        ) / 1e6
+
+    def _expected_completion_tokens(self, kwargs):
+        # answers are expected to be as long as the average one so far,
+        # max_tokens is far above the length of a typical extraction
+        expected = self.completion_tokens / self.choices if self.choices else 0
+        max_tokens = kwargs.get("max_completion_tokens") or kwargs.get("max_tokens")
+        if max_tokens:
+            expected = min(expected, max_tokens)
+        return int(expected * kwargs.get("n", 1))
+
+    def reserve(self, kwargs, prompt_tokens):
+        """Count a request as in flight and return its reservation."""
+        if not self.limited:
+            return None
+        with self._lock:
+            completion_tokens = self._expected_completion_tokens(kwargs)
+            reservation = (
+                prompt_tokens + completion_tokens,
+                self.cost(prompt_tokens, completion_tokens),
+            )
+            self.estimated_prompt_tokens += prompt_tokens
+            self._reserved_tokens += reservation[0]
+            self._reserved_cost += reservation[1]
+        return reservation
+
+    def settle(self, reservation, response):
+        usage = response.usage if response is not None else None
+        with self._lock:
+            if reservation is not None:
+                self._reserved_tokens -= reservation[0]
+                self._reserved_cost -= reservation[1]
+            if usage is None:
+                return
+            self.requests += 1
+            self.prompt_tokens += usage.prompt_tokens
+            self.completion_tokens += usage.completion_tokens
+            self.choices += len(response.choices)
+        # the spend of a row: every request, confidence calls and retries included
+        record_request_stat("billed_tokens", usage.total_tokens, add=True)
+        if self.prices:
+            record_request_stat(
+                "cost_usd",
+                self.cost(usage.prompt_tokens, usage.completion_tokens),
+                add=True,
+            )
+
+    def row_finished(self, result):
+        with self._lock:
+            self.rows_finished += 1
+            self._finished_tokens += result.get("billed_tokens", 0)
+            self._finished_cost += result.get("cost_usd", 0.0)
+
+    def _over_limit(self, spent, reserved, finished_spent, limit):
+        if limit is None:
+            return False
+        committed = spent + reserved
+        if self.rows_finished:
+            # rows scheduled but not finished yet will cost about as much as
+            # the finished ones, and so will the next one
+            per_row = finished_spent / self.rows_finished
+            unfinished = self.rows_scheduled - self.rows_finished
+            committed = max(committed, finished_spent + per_row * unfinished)
+            committed += per_row
+        return committed >= limit
+
+    def exhausted(self):
+        """Whether starting another row could go over a limit."""
+        with self._lock:
+            return self._over_limit(
+                self.prompt_tokens + self.completion_tokens,
+                self._reserved_tokens,
+                self._finished_tokens,
+                self.max_tokens,
+            ) or self._over_limit(
+                self.cost(self.prompt_tokens, self.completion_tokens),
+                self._reserved_cost,
+                self._finished_cost,
+                self.max_cost,
+            )
+
+    def guard(self, tasks):
+        """Yield ``tasks`` until the budget is exhausted, then stop scheduling."""
+        for task in tasks:
+            if self.limited and self.exhausted():
+                logger.warning(
+                    f"Budget of {self.name} reached after scheduling "
+                    f"{self.rows_scheduled} rows, no new rows are started",
+                )
+                return
+            with self._lock:
+                self.rows_scheduled += 1
+            yield task
+
+    def summary(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "estimated_prompt_tokens": self.estimated_prompt_tokens,
+                "cost_usd": (
+                    self.cost(self.prompt_tokens, self.completion_tokens)
+                    if self.prices
+                    else None
+                ),
+            }
+
+    def log_summary(self):
+        summary = self.summary()
+        if not summary["requests"]:
+            return
+        cost = (
+            f"${summary['cost_usd']:.4f}"
+            if summary["cost_usd"] is not None
+            else "no price configured"
+        )
+        logger.info(
+            f"Spend of {self.name}: {summary['requests']} requests, "
+            f"{summary['prompt_tokens']} prompt + {summary['completion_tokens']} "
+            f"completion tokens, {cost}",
+        )
+        if summary["estimated_prompt_tokens"] and summary["prompt_tokens"]:
+            logger.info(
+                f"Estimated prompt tokens of {self.name}: "
+                f"{summary['estimated_prompt_tokens']} "
+                f"({summary['estimated_prompt_tokens'] / summary['prompt_tokens']:.2f}x "
+                f"actual)",
+            )
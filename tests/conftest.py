@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import json
+import os
+
+import pytest
+
+from nnautobench.config.config import MODEL_CONFIGS
+from nnautobench.models import available_models
+from nnautobench.utils.mock_transport import create_mock_clients
+from nnautobench.utils.mock_transport import MOCK_API_BASE
+from nnautobench.utils.mock_transport import MockChatCompletions
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def mock_model():
+    """Build a model answered in-process by a ``MockChatCompletions``."""
+
+    def build(model_name="dsv3", **mock_kwargs):
+        responder = MockChatCompletions(**{"seed": 0, **mock_kwargs})
+        client, aclient = create_mock_clients(responder)
+        model = available_models[model_name](
+            MODEL_CONFIGS[model_name]["model_name"],
+            MOCK_API_BASE,
+            client=client,
+            aclient=aclient,
+        )
+        return model, responder
+
+    return build
+
+
+@pytest.fixture
+def text_tasks():
+    """Zero-shot text tasks of the sample documents, each under four paths."""
+    with open(os.path.join(ROOT, "sample_data.jsonl"), encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [
+        dict(
+            image_path=f"{row['image_path']}#{i}",
+            annotation=row["accepted"],
+            few_shot=0,
+            ctx=[],
+            input_text=row["content"],
+            keys=row["Queried_labels"],
+            layout="default",
+        )
+        for i in range(4)
+        for row in rows
+    ]
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from nnautobench.inference.batch import export_batch_requests
+from nnautobench.inference.batch import ingest_batch_results
+from nnautobench.inference.batch import load_batch_results
+from nnautobench.inference.batch import write_fake_batch_results
+from nnautobench.inference.predictor import Predictor
+
+
+def _round_trip(predictor, tasks, tmp_path):
+    requests = str(tmp_path / "requests.jsonl")
+    results = str(tmp_path / "results.jsonl")
+    assert export_batch_requests(predictor, tasks, requests) == len(tasks)
+    assert write_fake_batch_results(requests, tasks, results) == len(tasks)
+    return requests, results
+
+
+@pytest.mark.parametrize("conf_score_method", ["consistency", "logprob"])
+def test_batch_results_score_like_live_predictions(
+    mock_model,
+    text_tasks,
+    tmp_path,
+    conf_score_method,
+):
+    model, responder = mock_model()
+    predictor = Predictor(model, conf_score_method)
+    _, results = _round_trip(predictor, text_tasks, tmp_path)
+    ingested = []
+    missing = ingest_batch_results(
+        predictor,
+        text_tasks,
+        load_batch_results(results),
+        ingested.append,
+    )
+    assert missing == 0
+    assert responder.requests == 0
+    assert [row["row_key"] for row in ingested] == [
+        predictor.process_single_image(**task)["row_key"] for task in text_tasks
+    ]
+    assert all(row["file_accuracy"] == 1.0 for row in ingested)
+    assert all(row["predicted_field_conf_scores"] for row in ingested)
+
+
+def test_failed_and_unknown_rows_are_reported_missing(
+    mock_model,
+    text_tasks,
+    tmp_path,
+):
+    model, _ = mock_model()
+    predictor = Predictor(model, "logprob")
+    requests, results = _round_trip(predictor, text_tasks, tmp_path)
+    # the provider answers all but the first row, which fails
+    with open(results, encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    lines[0]["response"] = {"status_code": 500, "body": {"error": "boom"}}
+    with open(results, "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(line) + "\n" for line in lines)
+
+    responses = load_batch_results(results)
+    assert len(responses) == len(text_tasks) - 1
+    ingested = []
+    assert ingest_batch_results(predictor, text_tasks, responses, ingested.append) == 1
+    assert len(ingested) == len(text_tasks) - 1
+
+    # a result file for other rows answers none of these
+    write_fake_batch_results(requests, [], results)
+    assert load_batch_results(results) == {}
+
+
+@pytest.mark.parametrize("conf_score_method", ["prob", "yes_no"])
+def test_methods_with_a_second_request_cannot_be_batched(
+    mock_model,
+    text_tasks,
+    tmp_path,
+    conf_score_method,
+):
+    model, _ = mock_model()
+    predictor = Predictor(model, conf_score_method)
+    with pytest.raises(ValueError):
+        export_batch_requests(predictor, text_tasks, str(tmp_path / "requests.jsonl"))
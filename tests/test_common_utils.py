@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+import json
+
+from nnautobench.utils.common_utils import iter_data
+
+
+def _write(path, lines):
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def test_iter_data_skips_blank_lines_and_applies_offset(tmp_path):
+    path = _write(
+        tmp_path / "data.jsonl",
+        [json.dumps({"id": i}) if i % 2 == 0 else "" for i in range(10)],
+    )
+    assert [row["id"] for row in iter_data(path)] == [0, 2, 4, 6, 8]
+    assert [row["id"] for row in iter_data(path, offset=3)] == [6, 8]
+    assert [row["id"] for row in iter_data(path, offset=1, limit=2)] == [2, 4]
+
+
+def test_iter_data_stops_reading_at_the_limit(tmp_path):
+    # rows past the limit are never parsed
+    path = _write(tmp_path / "data.jsonl", [json.dumps({"id": 0}), "not json"])
+    assert [row["id"] for row in iter_data(path, limit=1)] == [0]
+
+
+def test_iter_data_is_lazy(tmp_path):
+    path = _write(tmp_path / "data.jsonl", [json.dumps({"id": i}) for i in range(3)])
+    rows = iter_data(path)
+    assert next(rows) == {"id": 0}
+    rows.close()
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import random
+import types
+
+import openai
+import pytest
+
+from nnautobench.utils import concurrency
+from nnautobench.utils.concurrency import AdaptiveConcurrencyLimiter
+from nnautobench.utils.concurrency import classify_exception
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.0]
+    fake_time = types.SimpleNamespace(
+        monotonic=lambda: now[0],
+        perf_counter=lambda: now[0],
+    )
+    monkeypatch.setattr(concurrency, "time", fake_time)
+    return now
+
+
+def _run(limiter, clock, latencies):
+    # a saturated endpoint: every free slot is used, requests finish in turn
+    for latency in latencies:
+        while limiter.in_flight < limiter.limit:
+            limiter.acquire()
+        clock[0] += latency / limiter.limit
+        limiter.release(latency)
+    # requests still in flight end without a signal
+    while limiter.in_flight:
+        limiter.release(outcome="error")
+
+
+def test_steady_endpoint_with_varied_answer_lengths_keeps_its_limit(clock):
+    rng = random.Random(0)
+    limiter = AdaptiveConcurrencyLimiter("endpoint", initial_limit=8, max_limit=64)
+    # one short answer first, then answers of 50 to 1000 tokens at 100 tokens/s
+    latencies = [0.2] + [0.1 + rng.uniform(50, 1000) / 100 for _ in range(2000)]
+    _run(limiter, clock, latencies)
+    assert limiter.limit >= 8
+
+
+def test_growing_latency_cuts_the_limit(clock):
+    limiter = AdaptiveConcurrencyLimiter("endpoint", initial_limit=32, max_limit=64)
+    _run(limiter, clock, [1.0] * 200)
+    before = limiter.limit
+    _run(limiter, clock, [5.0] * 20)
+    assert limiter.limit < before
+
+
+def test_rate_limit_halves_the_limit(clock):
+    limiter = AdaptiveConcurrencyLimiter("endpoint", initial_limit=16)
+    limiter.acquire()
+    clock[0] += 5.0
+    limiter.release(1.0, "rate_limited")
+    assert limiter.limit == 8
+    # the rest of the same burst of failures is one overload event
+    limiter.acquire()
+    limiter.release(1.0, "rate_limited")
+    assert limiter.limit == 8
+
+
+def test_limit_stays_within_bounds(clock):
+    limiter = AdaptiveConcurrencyLimiter(
+        "endpoint",
+        initial_limit=4,
+        min_limit=2,
+        max_limit=6,
+    )
+    _run(limiter, clock, [1.0] * 500)
+    assert limiter.limit == 6
+    for _ in range(10):
+        clock[0] += 10.0
+        limiter.acquire()
+        limiter.release(1.0, "server_error")
+    assert limiter.limit == 2
+
+
+def test_classify_exception():
+    request = openai._base_client.httpx.Request("POST", "http://test")
+
+    def status_error(cls, status_code):
+        response = openai._base_client.httpx.Response(status_code, request=request)
+        return cls("error", response=response, body=None)
+
+    assert classify_exception(status_error(openai.RateLimitError, 429)) == (
+        "rate_limited"
+    )
+    assert classify_exception(status_error(openai.InternalServerError, 503)) == (
+        "server_error"
+    )
+    assert classify_exception(openai.APITimeoutError(request=request)) == "timeout"
+    assert classify_exception(status_error(openai.BadRequestError, 400)) == "error"
+    assert classify_exception(ValueError()) == "error"
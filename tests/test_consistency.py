@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import asyncio
+
+from nnautobench.utils.request_stats import collect_request_stats
+from nnautobench.utils.request_stats import row_context
+
+ROW = {"annotation": {"fields": {"Total": {"value": "42"}}}, "keys": "['Total']"}
+MESSAGES = [{"role": "user", "content": "Total: 42"}]
+
+
+def _sample(model):
+    with row_context(**ROW), collect_request_stats() as stats:
+        choices, usage = model.sample_consistency(MESSAGES, "consistency")
+    return choices, usage, stats
+
+
+def test_undecided_rows_draw_the_rest_in_one_request(mock_model):
+    model, responder = mock_model()
+    choices, usage, stats = _sample(model)
+    assert len(choices) == 5
+    assert stats["consistency_samples"] == 5
+    assert stats["consistency_requests"] == 2
+    assert responder.requests == 2
+    # the prompt is billed once per request
+    model.consistency_batch_size = 5
+    _, single_request_usage, _ = _sample(model)
+    assert usage["prompt_tokens"] == 2 * single_request_usage["prompt_tokens"]
+
+
+def test_disagreeing_samples_stop_early(mock_model):
+    model, responder = mock_model(field_error_rate=0.5)
+    samples = []
+    for _ in range(20):
+        choices, _, stats = _sample(model)
+        assert stats["consistency_requests"] <= 2
+        samples.append(len(choices))
+        if len(choices) == 2:
+            assert choices[0].message.content != choices[1].message.content
+    assert 2 in samples
+    assert 5 in samples
+
+
+def test_batch_size_of_five_draws_every_sample_at_once(mock_model):
+    model, responder = mock_model()
+    model.consistency_batch_size = 5
+    choices, _, stats = _sample(model)
+    assert len(choices) == 5
+    assert stats["consistency_requests"] == 1
+
+
+def test_async_sampling_matches(mock_model):
+    model, responder = mock_model()
+
+    async def sample():
+        with row_context(**ROW), collect_request_stats() as stats:
+            choices, _ = await model.asample_consistency(MESSAGES, "consistency")
+        return choices, stats
+
+    choices, stats = asyncio.run(sample())
+    assert len(choices) == 5
+    assert stats["consistency_requests"] == 2
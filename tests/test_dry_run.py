@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import pytest
+
+from nnautobench.inference.dry_run import run_dry_run
+from nnautobench.inference.predictor import Predictor
+from nnautobench.utils.token_budget import estimate_prompt_tokens
+
+
+def _estimate(predictor, task):
+    messages, _ = predictor.prepare_messages(
+        task["image_path"],
+        task["few_shot"],
+        task["ctx"],
+        task["input_text"],
+        task["keys"],
+        task["layout"],
+    )
+    return estimate_prompt_tokens(messages)
+
+
+def test_dry_run_builds_every_prompt_without_requests(mock_model, text_tasks):
+    model, responder = mock_model()
+    predictor = Predictor(model)
+    summary = run_dry_run(predictor, text_tasks, prices={"input": 2.0})
+    assert responder.requests == 0
+    assert summary["rows"] == len(text_tasks)
+    assert summary["failed_rows"] == 0
+    tokens = [_estimate(predictor, task) for task in text_tasks]
+    assert summary["prompt_tokens_total"] == sum(tokens)
+    assert summary["prompt_tokens_max"] == max(tokens)
+    assert summary["estimated_prompt_cost_usd"] == pytest.approx(
+        2 * sum(tokens) / 1e6,
+    )
+    assert summary["payload_bytes_total"] > 0
+    assert summary["image_bytes_total"] == 0
+
+
+def test_dry_run_counts_rows_whose_prompt_fails(mock_model, text_tasks):
+    model, _ = mock_model()
+    broken = {**text_tasks[0], "keys": "not a list"}
+    summary = run_dry_run(Predictor(model), [broken, text_tasks[1]])
+    assert summary["rows"] == 1
+    assert summary["failed_rows"] == 1
+    assert summary["estimated_prompt_cost_usd"] is None
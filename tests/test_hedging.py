@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+import types
+
+from nnautobench.utils import retry_policy
+from nnautobench.utils.hedging import RequestHedger
+from nnautobench.utils.request_stats import row_context
+from nnautobench.utils.retry_policy import RetryPolicy
+
+KWARGS = {"messages": [{"role": "user", "content": "Total: 42"}]}
+ROW = {"annotation": {"fields": {"Total": {"value": "42"}}}, "keys": "['Total']"}
+
+
+def _warm(hedger, latency=0.01):
+    for _ in range(hedger.min_samples):
+        hedger.record_latency(latency)
+
+
+def _response(name):
+    return types.SimpleNamespace(name=name, usage=None)
+
+
+def _slow_then_fast():
+    calls = []
+    lock = threading.Lock()
+
+    def create():
+        with lock:
+            calls.append(None)
+            first = len(calls) == 1
+        time.sleep(0.5 if first else 0.0)
+        return _response("primary" if first else "hedge")
+
+    return create
+
+
+def test_no_hedge_while_warming_up():
+    hedger = RequestHedger("model", min_samples=5)
+    assert hedger.hedge_delay() is None
+    assert hedger.call(lambda: _response("primary"), KWARGS).name == "primary"
+    assert hedger.summary()["hedged"] == 0
+    hedger.close()
+
+
+def test_slow_request_is_hedged():
+    hedger = RequestHedger("model", min_samples=5)
+    _warm(hedger)
+    assert hedger.call(_slow_then_fast(), KWARGS).name == "hedge"
+    summary = hedger.summary()
+    assert summary["hedged"] == 1
+    assert summary["hedge_wins"] == 1
+    hedger.close()
+    assert hedger._executor._shutdown
+
+
+def test_async_loser_is_cancelled_and_billed():
+    hedger = RequestHedger("model", min_samples=5)
+    _warm(hedger)
+    started = []
+
+    async def create():
+        started.append(None)
+        await asyncio.sleep(0.5 if len(started) == 1 else 0.0)
+        return _response("primary" if len(started) == 1 else "hedge")
+
+    async def run():
+        response = await hedger.acall(create, KWARGS)
+        # let the cancelled primary settle
+        await asyncio.sleep(0)
+        return response
+
+    assert asyncio.run(run()).name == "hedge"
+    assert hedger.summary()["hedge_wins"] == 1
+    assert hedger.summary()["extra_tokens"] > 0
+
+
+def test_latencies_leave_out_retry_backoff(mock_model, monkeypatch):
+    # every backoff is the full 0.2s, requests to the mock take milliseconds
+    monkeypatch.setattr(
+        retry_policy,
+        "random",
+        types.SimpleNamespace(uniform=lambda low, high: high),
+    )
+    model, responder = mock_model(rate_limit_rate=0.5)
+    model.retry_policy = RetryPolicy(base_delay=0.2, max_delay=0.2)
+    model.hedger = RequestHedger(model.model_name, min_samples=1000)
+    with row_context(**ROW):
+        for _ in range(5):
+            model.completions_with_backoff(
+                model=model.model_name,
+                messages=KWARGS["messages"],
+            )
+    model.hedger.close()
+    assert model.retry_policy.retries > 0
+    assert len(model.hedger._latencies) == 5
+    assert max(model.hedger._latencies) < 0.2
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import asyncio
+import http.server
+import threading
+
+import pytest
+
+from nnautobench.utils.http_client import configure_http_client
+from nnautobench.utils.http_client import get_async_http_client
+from nnautobench.utils.http_client import get_http_client
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    # keeps the connection open between requests
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api_base():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+    server.server_close()
+
+
+def _stats(client):
+    return client._transport.stats.summary()
+
+
+def test_one_client_per_endpoint(api_base):
+    client = get_http_client(api_base)
+    assert get_http_client(api_base) is client
+    assert get_http_client(f"{api_base}/other") is not client
+
+
+def test_requests_reuse_pooled_connections(api_base):
+    client = get_http_client(api_base)
+    for _ in range(5):
+        assert client.get(f"{api_base}/models").text == "ok"
+    stats = _stats(client)
+    assert stats["requests"] == 5
+    assert stats["new_connections"] == 1
+    assert stats["reuse_rate"] == 0.8
+
+
+def test_configured_pool_limits_and_timeouts(api_base):
+    configure_http_client(api_base, max_connections=2, read_timeout=5.0)
+    client = get_http_client(api_base)
+    assert client.timeout.read == 5.0
+    pool = client._transport._pool
+    assert pool._max_connections == 2
+    # every pooled connection is kept alive by default
+    assert pool._max_keepalive_connections == 2
+
+
+def test_async_clients_are_shared_within_an_event_loop(api_base):
+    async def clients():
+        client = get_async_http_client(api_base)
+        assert get_async_http_client(api_base) is client
+        for _ in range(3):
+            assert (await client.get(f"{api_base}/models")).text == "ok"
+        return client
+
+    first = asyncio.run(clients())
+    assert _stats(first)["new_connections"] == 1
+    assert asyncio.run(clients()) is not first
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import base64
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from nnautobench.utils.image_utils import data_url_num_bytes
+from nnautobench.utils.image_utils import EncodedImageCache
+from nnautobench.utils.image_utils import ImagePreprocessing
+
+
+@pytest.fixture
+def image(tmp_path):
+    path = str(tmp_path / "page.png")
+    Image.new("RGBA", (400, 200), (255, 0, 0, 255)).save(path)
+    return path
+
+
+def _encoder(calls):
+    def encode(path):
+        calls.append(path)
+        with open(path, "rb") as f:
+            return f.read().hex()
+
+    return encode
+
+
+def test_cache_hits_until_the_file_changes(image):
+    cache = EncodedImageCache()
+    calls = []
+    first = cache.get_or_encode(image, _encoder(calls))
+    assert cache.get_or_encode(image, _encoder(calls)) == first
+    assert len(calls) == 1
+    # another variant of the same file is encoded on its own
+    cache.get_or_encode(image, _encoder(calls), variant="jpeg")
+    assert len(calls) == 2
+
+    Image.new("RGB", (10, 10)).save(image)
+    os.utime(image, ns=(0, 0))
+    assert cache.get_or_encode(image, _encoder(calls)) != first
+    assert len(calls) == 3
+    assert cache.summary()["hits"] == 1
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"{i}.bin"
+        path.write_bytes(b"x" * 10)
+        paths.append(str(path))
+    cache = EncodedImageCache(max_bytes=40)
+    calls = []
+    cache.get_or_encode(paths[0], _encoder(calls))
+    cache.get_or_encode(paths[1], _encoder(calls))
+    cache.get_or_encode(paths[0], _encoder(calls))
+    # 20 hex characters per file, the third pushes out the second
+    cache.get_or_encode(paths[2], _encoder(calls))
+    assert cache.summary()["evictions"] == 1
+    assert cache.summary()["cached_bytes"] == 40
+    cache.get_or_encode(paths[0], _encoder(calls))
+    assert calls.count(paths[0]) == 1
+    cache.resize(20)
+    assert cache.summary()["entries"] == 1
+
+
+def test_untouched_images_keep_their_bytes_and_type(image):
+    data, mime_type = ImagePreprocessing()(image)
+    with open(image, "rb") as f:
+        assert data == f.read()
+    assert mime_type == "image/png"
+
+
+def test_preprocessing_downscales_and_recompresses(image):
+    data, mime_type = ImagePreprocessing(max_long_edge=100, image_format="jpeg")(
+        image,
+    )
+    assert mime_type == "image/jpeg"
+    with Image.open(io.BytesIO(data)) as sent:
+        assert sent.format == "JPEG"
+        assert sent.size == (100, 50)
+        assert sent.mode == "RGB"
+
+
+def test_grayscale_and_unknown_formats(image):
+    data, _ = ImagePreprocessing(grayscale=True)(image)
+    with Image.open(io.BytesIO(data)) as sent:
+        assert sent.mode == "L"
+        assert sent.size == (400, 200)
+    with pytest.raises(ValueError):
+        ImagePreprocessing(image_format="gif")
+
+
+def test_data_url_num_bytes():
+    for size in (1, 2, 3, 10):
+        payload = base64.b64encode(b"x" * size).decode()
+        assert data_url_num_bytes(f"data:image/png;base64,{payload}") == size
@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+from nnautobench.utils.live_metrics import LiveMetrics
+
+
+def _row(time_taken):
+    return {"parsing_accuracy": 1, "file_accuracy": 1.0, "time_taken": time_taken}
+
+
+def test_document_finished_timed_row():
+    metrics = LiveMetrics("model")
+    metrics.document_finished(_row(2.0))
+    snapshot = metrics.snapshot()
+    assert snapshot["documents"] == 1
+    assert snapshot["document_latency_seconds"]["count"] == 1
+    assert snapshot["document_latency_seconds"]["sum"] == 2.0
+
+
+def test_document_finished_batch_ingested_row():
+    # rows from --batch_ingest have no time_taken
+    metrics = LiveMetrics("model")
+    metrics.document_finished(_row(None))
+    snapshot = metrics.snapshot()
+    assert snapshot["documents"] == 1
+    assert snapshot["file_accuracy"] == 1.0
+    assert snapshot["document_latency_seconds"]["count"] == 0
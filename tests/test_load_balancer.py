@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import asyncio
+
+import httpx
+import pytest
+
+from nnautobench.utils.load_balancer import AsyncLoadBalancedTransport
+from nnautobench.utils.load_balancer import LoadBalancedTransport
+from nnautobench.utils.load_balancer import LoadBalancer
+
+API_BASE = "http://lb.test/v1"
+REPLICAS = ["http://a.test/v1", "http://b.test/v1"]
+
+
+def _raise(exc):
+    def handler(request):
+        raise exc
+
+    return handler
+
+
+def _transport(handler, balancer=None):
+    balancer = balancer or LoadBalancer(API_BASE, REPLICAS[:1], max_failures=3)
+    transports = {url: httpx.MockTransport(handler) for url in REPLICAS}
+    return balancer, LoadBalancedTransport(balancer, transports)
+
+
+def _send(transport, n=1):
+    for _ in range(n):
+        try:
+            transport.handle_request(httpx.Request("POST", f"{API_BASE}/chat"))
+        except (httpx.HTTPError, ValueError):
+            pass
+
+
+@pytest.mark.parametrize(
+    "handler",
+    [
+        lambda request: httpx.Response(503),
+        _raise(httpx.ConnectError("refused")),
+        _raise(httpx.ConnectTimeout("unreachable")),
+    ],
+)
+def test_server_and_connect_errors_eject(handler):
+    balancer, transport = _transport(handler)
+    _send(transport, 3)
+    (replica,) = balancer.replicas
+    assert replica.failures == 3
+    assert replica.ejections == 1
+    assert replica.outstanding == 0
+
+
+@pytest.mark.parametrize(
+    "handler",
+    [
+        lambda request: httpx.Response(429),
+        _raise(httpx.ReadTimeout("deadline")),
+        _raise(httpx.PoolTimeout("pool")),
+        _raise(ValueError("client bug")),
+    ],
+)
+def test_client_side_outcomes_do_not_eject(handler):
+    balancer, transport = _transport(handler)
+    _send(transport, 5)
+    (replica,) = balancer.replicas
+    assert replica.failures == 0
+    assert replica.ejections == 0
+    assert replica.outstanding == 0
+
+
+def test_neutral_release_records_no_latency():
+    balancer, transport = _transport(_raise(httpx.ReadTimeout("deadline")))
+    _send(transport, 2)
+    (replica,) = balancer.replicas
+    assert replica.latency_ewma is None
+    assert not replica._latencies
+    assert balancer.last_response is None
+
+
+def test_cancelled_request_is_neutral():
+    balancer = LoadBalancer(API_BASE, REPLICAS[:1], max_failures=1)
+
+    async def hang(request):
+        await asyncio.sleep(10)
+
+    transport = AsyncLoadBalancedTransport(
+        balancer,
+        {REPLICAS[0]: httpx.MockTransport(hang)},
+    )
+
+    async def run():
+        task = asyncio.create_task(
+            transport.handle_async_request(httpx.Request("POST", f"{API_BASE}/chat")),
+        )
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    (replica,) = balancer.replicas
+    assert replica.failures == 0
+    assert replica.ejections == 0
+    assert replica.outstanding == 0
+
+
+def test_requests_are_routed_to_replicas():
+    seen = []
+
+    def handler(request):
+        seen.append(str(request.url))
+        return httpx.Response(200)
+
+    balancer = LoadBalancer(API_BASE, REPLICAS)
+    _, transport = _transport(handler, balancer)
+    _send(transport, 4)
+    assert len(seen) == 4
+    assert set(seen) <= {f"{url}/chat" for url in REPLICAS}
+    assert sum(len(replica._latencies) for replica in balancer.replicas) == 4
+
+
+def test_least_outstanding_avoids_busy_replica():
+    balancer = LoadBalancer(API_BASE, REPLICAS)
+    busy = balancer.acquire()
+    for _ in range(5):
+        replica = balancer.acquire()
+        assert replica is not busy
+        balancer.release(replica, 0.1, True)
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import math
+import types
+
+import pytest
+
+from nnautobench.inference.predictor import Predictor
+from nnautobench.utils.logprob_utils import find_value_span
+from nnautobench.utils.logprob_utils import get_logprob_conf_score
+from nnautobench.utils.prompt_utils import parse_fields
+
+
+def _tokens(*pairs):
+    return [types.SimpleNamespace(token=token, logprob=lp) for token, lp in pairs]
+
+
+@pytest.mark.parametrize(
+    "text,field,value",
+    [
+        ('{"Total": {"value": "42.00"}}', "Total", '"42.00"'),
+        ('{"Total": "42.00", "Date": "1 May"}', "Total", '"42.00"'),
+        ('{"Total": 42, "Date": "1 May"}', "Total", "42"),
+        ('{"Items": ["a", "b]"], "Total": 1}', "Items", '["a", "b]"]'),
+        ('{"Name": "say \\"hi\\"", "x": 1}', "Name", '"say \\"hi\\""'),
+        ('{"Addr": {"value": {"city": "X"}}}', "Addr", '{"city": "X"}'),
+    ],
+)
+def test_value_span(text, field, value):
+    start, end = find_value_span(text, field)
+    assert text[start:end] == value
+
+
+def test_missing_field_has_no_span():
+    assert find_value_span('{"Total": "1"}', "Date") is None
+    # cut off right after the key
+    assert find_value_span('{"Total": ', "Total") is None
+
+
+def test_confidence_is_the_joint_probability_of_the_value_tokens():
+    tokens = _tokens(
+        ('{"Total', -0.5),
+        ('": "', -0.5),
+        ("42", -0.1),
+        (".00", -0.2),
+        ('", "Date": "', -0.5),
+        ("1 May", -0.3),
+        ('"}', -0.5),
+    )
+    conf_score = get_logprob_conf_score(tokens, ["Total", "Date", "Missing"])
+    # the tokens holding the quotes around a value count towards it too
+    assert conf_score["Total"] == pytest.approx(math.exp(-0.5 - 0.1 - 0.2 - 0.5))
+    assert conf_score["Date"] == pytest.approx(math.exp(-0.5 - 0.3 - 0.5))
+    assert "Missing" not in conf_score
+
+
+def test_certain_answer_scores_one():
+    tokens = _tokens(('{"Total": ', 0.0), ('"42"', 0.0), ("}", 0.0))
+    assert get_logprob_conf_score(tokens, ["Total"]) == {"Total": 1.0}
+
+
+def test_logprob_confidence_needs_no_second_request(mock_model, text_tasks):
+    model, responder = mock_model()
+    task = text_tasks[0]
+    result = Predictor(model, "logprob").process_single_image(**task)
+    assert responder.requests == 1
+    conf_score = result["predicted_field_conf_scores"]
+    assert set(conf_score) == set(parse_fields(task["keys"]))
+    assert all(0 < score <= 1 for score in conf_score.values())
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import json
+import random
+
+import httpx
+import pytest
+
+from nnautobench.utils.mock_transport import MockChatCompletions
+from nnautobench.utils.mock_transport import MockTransport
+from nnautobench.utils.mock_transport import parse_latency
+from nnautobench.utils.mock_transport import parse_request
+from nnautobench.utils.request_stats import row_context
+from nnautobench.utils.token_budget import DEFAULT_IMAGE_TOKENS
+
+ROW = {"annotation": {"fields": {"Total": {"value": "42"}}}, "keys": "['Total']"}
+
+
+def _body(text, images=0, **params):
+    content = [{"type": "text", "text": text}]
+    content += [
+        {"type": "image_url", "image_url": {"url": "data:image/png;base64,AAAA"}},
+    ] * images
+    return json.dumps(
+        {"messages": [{"role": "user", "content": content}], **params},
+    ).encode()
+
+
+def test_parse_request_reads_params_after_the_images():
+    body = _body("pick n", images=2, model="m", n=3, logprobs=True, stream=False)
+    params = parse_request(body)
+    assert params["model"] == "m"
+    assert params["n"] == 3
+    assert params["logprobs"] is True
+    assert params["stream"] is False
+    image_bytes = 2 * len('"data:image/png;base64,AAAA')
+    assert params["prompt_tokens"] == (
+        (len(body) - image_bytes) // 4 + 2 * DEFAULT_IMAGE_TOKENS
+    )
+
+
+def test_parse_request_ignores_params_quoted_in_the_prompt():
+    params = parse_request(_body('answer with "n": 5', model="m"))
+    assert "n" not in params
+    assert params["model"] == "m"
+
+
+def test_parse_latency():
+    rng = random.Random(0)
+    assert parse_latency("const:0.5")(rng) == 0.5
+    assert 1 <= parse_latency("uniform:1:2")(rng) <= 2
+    assert parse_latency("exp:0")(rng) == 0.0
+    assert parse_latency("lognormal:1:0")(rng) == 1.0
+    with pytest.raises(ValueError):
+        parse_latency("normal:1")
+
+
+def test_mock_answers_from_the_current_row():
+    responder = MockChatCompletions(seed=0)
+    with row_context(**ROW):
+        _, status, _, body = responder.respond({"n": 2, "prompt_tokens": 7})
+    assert status == 200
+    assert [json.loads(c["message"]["content"]) for c in body["choices"]] == [
+        {"Total": {"value": "42"}},
+    ] * 2
+    assert body["usage"]["prompt_tokens"] == 7
+
+
+def test_mock_injects_errors_and_rate_limits():
+    responder = MockChatCompletions(error_rate=0.5, rate_limit_rate=0.5, seed=0)
+    statuses = {responder.respond({"prompt_tokens": 1})[1] for _ in range(20)}
+    assert statuses == {429, 500}
+    summary = responder.summary()
+    assert summary["requests"] == 20
+    assert summary["errors"] + summary["rate_limited"] == 20
+
+
+def test_mock_times_out_like_a_real_transport():
+    transport = MockTransport(MockChatCompletions(latency="const:0.05"))
+    with httpx.Client(transport=transport, timeout=0.01) as client:
+        with pytest.raises(httpx.ReadTimeout):
+            client.post("http://mock/v1/chat/completions", content=_body("hi"))
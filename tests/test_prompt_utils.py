@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import pytest
+
+from nnautobench.utils.prompt_utils import create_field_extraction_prompt
+from nnautobench.utils.prompt_utils import create_field_extraction_prompt_ocr
+
+INSTRUCTIONS = (
+    ' and if value is not present for a field then "" should be provided. If '
+    "there are more than 1 value for a field, give all the values as an array.\n"
+    "Extract the following fields from this document\n\n"
+)
+OCR_INSTRUCTIONS = (
+    "\n\nThe output should be formatted as the flattened JSON format. If value "
+    'is not present for a field then "" should be provided. If there are more '
+    "than 1 value for a field, give all the values as an array. Do not give any "
+    "additional explanation\n"
+)
+OUTPUT_FORMAT = (
+    'OUTPUT JSON FORMAT\n{"Total": {"value": ".."}, "Date": {"value": ".."}}\n'
+)
+OCR_HEAD = (
+    "Consider the following document text\n--------------------------------\n"
+    "TOTAL 42\n--------------------------------\n"
+    "From this document, extract the following fields\n\n"
+)
+
+
+# prompts of the implementation before the templates were memoized
+@pytest.mark.parametrize("fields", [["Total", "Date"], "['Total', 'Date']"])
+def test_field_extraction_prompt_matches_the_original(fields):
+    assert create_field_extraction_prompt(fields) == (
+        '"Follow the below instructions and extract field(s) from the document '
+        "image"
+        + INSTRUCTIONS
+        + "1. Total\n2. Date\n\nThe output should be formatted as a flattened "
+        "JSON output. Do not give any additional explanation.\n" + OUTPUT_FORMAT
+    )
+    assert create_field_extraction_prompt(
+        fields,
+        {"Total": "amount due"},
+        multiple_images=True,
+    ) == (
+        '"Follow the below instructions and extract field(s) from the document '
+        "images"
+        + INSTRUCTIONS
+        + "\n1. Total: amount due\n2. Date\n\nThe output should be formatted as "
+        "a flattened JSON output. Do not give any additional explanation.If "
+        "there are multiple images, DO NOT give a list of dictionary for each "
+        "image, consider all images and extract one single json dictionary.\n"
+        + OUTPUT_FORMAT
+    )
+
+
+@pytest.mark.parametrize("fields", [["Total", "Date"], "['Total', 'Date']"])
+def test_ocr_prompt_matches_the_original(fields):
+    assert create_field_extraction_prompt_ocr(
+        fields,
+        {"Total": "amount due"},
+        ocr_text="TOTAL 42",
+    ) == (
+        OCR_HEAD
+        + "1. Total: amount due\n2. Date: "
+        + OCR_INSTRUCTIONS
+        + OUTPUT_FORMAT
+        + "    "
+    )
+    assert create_field_extraction_prompt_ocr(
+        fields,
+        disable_output_format=True,
+        ocr_text="TOTAL 42",
+    ) == (OCR_HEAD + "1. Total\n2. Date" + OCR_INSTRUCTIONS)
+
+
+def test_memoized_ocr_prompt_only_differs_in_its_text():
+    first = create_field_extraction_prompt_ocr(["Total"], ocr_text="first")
+    second = create_field_extraction_prompt_ocr(["Total"], ocr_text="second")
+    assert first.replace("first", "second") == second
+    described = create_field_extraction_prompt_ocr(
+        ["Total"],
+        {"Total": "amount due"},
+        ocr_text="first",
+    )
+    assert described != first
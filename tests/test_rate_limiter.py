@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import types
+
+import pytest
+
+from nnautobench.utils import rate_limiter
+from nnautobench.utils.rate_limiter import get_rate_limiter
+from nnautobench.utils.rate_limiter import TokenBucketRateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.0]
+
+    def sleep(seconds):
+        now[0] += seconds
+
+    monkeypatch.setattr(
+        rate_limiter,
+        "time",
+        types.SimpleNamespace(monotonic=lambda: now[0], sleep=sleep),
+    )
+    return now
+
+
+def test_burst_up_to_the_limit_is_not_throttled(clock):
+    limiter = TokenBucketRateLimiter("key", requests_per_minute=60)
+    assert all(limiter.reserve(0) == 0 for _ in range(60))
+    # the 61st request waits for one refill at 1 request per second
+    assert limiter.reserve(0) == pytest.approx(1.0)
+    assert limiter.summary()["throttled_requests"] == 1
+
+
+def test_sustained_rate_matches_the_limit(clock):
+    limiter = TokenBucketRateLimiter("key", requests_per_minute=120)
+    for _ in range(120 + 240):
+        limiter.acquire(0)
+    # a full bucket, then 240 more requests at 2 per second
+    assert clock[0] == pytest.approx(120.0)
+
+
+def test_tokens_per_minute_limit(clock):
+    limiter = TokenBucketRateLimiter("key", tokens_per_minute=6000)
+    assert limiter.reserve(6000) == 0
+    assert limiter.reserve(500) == pytest.approx(5.0)
+
+
+def test_adjust_refunds_overestimates_and_charges_underestimates(clock):
+    limiter = TokenBucketRateLimiter("key", tokens_per_minute=6000)
+    limiter.reserve(6000)
+    limiter.adjust(6000, 3000)
+    assert limiter.reserve(3000) == 0
+    limiter.adjust(0, 1000)
+    # 1000 tokens behind at 100 tokens per second
+    assert limiter.reserve(0) == pytest.approx(10.0)
+
+
+def test_refund_never_overfills_the_bucket(clock):
+    limiter = TokenBucketRateLimiter("key", tokens_per_minute=6000)
+    limiter.adjust(5000, 0)
+    assert limiter.reserve(6000) == 0
+    assert limiter.reserve(100) > 0
+
+
+def test_limiters_are_shared_per_key():
+    assert get_rate_limiter("none") is None
+    limiter = get_rate_limiter("shared-key", requests_per_minute=10)
+    assert get_rate_limiter("shared-key", requests_per_minute=10) is limiter
+    assert get_rate_limiter("other-key", requests_per_minute=10) is not limiter
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import contextvars
+import time
+import types
+
+import pytest
+
+from nnautobench.utils import request_stats
+from nnautobench.utils.request_stats import collect_request_stats
+from nnautobench.utils.request_stats import time_phase
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(
+        request_stats,
+        "time",
+        types.SimpleNamespace(perf_counter=lambda: now[0]),
+    )
+    return now
+
+
+def test_nested_phases_are_charged_to_the_innermost(clock):
+    with collect_request_stats() as stats:
+        with time_phase("network"):
+            clock[0] += 1.0
+            with time_phase("queue_wait"):
+                clock[0] += 2.0
+            clock[0] += 3.0
+        with time_phase("network"):
+            clock[0] += 0.5
+    assert stats["timings"]["network"] == 4.5
+    assert stats["timings"]["queue_wait"] == 2.0
+
+
+def test_nothing_is_recorded_outside_a_row(clock):
+    with time_phase("network"):
+        clock[0] += 1.0
+    with collect_request_stats() as stats:
+        pass
+    assert "timings" not in stats
+
+
+def _sleep_in_phase(seconds, name="network"):
+    with time_phase(name):
+        time.sleep(seconds)
+
+
+def test_overlapping_threads_count_their_wall_clock_span():
+    with collect_request_stats() as stats:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, _sleep_in_phase, 0.2)
+                for _ in range(3)
+            ]
+            for future in futures:
+                future.result()
+    assert 0.2 <= stats["timings"]["network"] < 0.35
+
+
+def test_overlapping_tasks_count_their_wall_clock_span():
+    async def attempt(seconds):
+        with time_phase("network"):
+            await asyncio.sleep(seconds)
+
+    async def row():
+        with collect_request_stats() as stats:
+            await asyncio.gather(attempt(0.2), attempt(0.1))
+        return stats
+
+    stats = asyncio.run(row())
+    assert 0.2 <= stats["timings"]["network"] < 0.3
+
+
+def test_sequential_blocks_add_up():
+    with collect_request_stats() as stats:
+        _sleep_in_phase(0.1)
+        _sleep_in_phase(0.1)
+    assert stats["timings"]["network"] >= 0.2
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import types
+
+import pytest
+from openai.types.chat import ChatCompletion
+
+from nnautobench.utils import response_cache
+from nnautobench.utils.request_stats import collect_request_stats
+from nnautobench.utils.request_stats import row_context
+from nnautobench.utils.response_cache import ResponseCache
+
+ROW = {"annotation": {"fields": {"Total": {"value": "42"}}}, "keys": "['Total']"}
+
+
+def _request(content):
+    return {"model": "model", "messages": [{"role": "user", "content": content}]}
+
+
+def _response(content):
+    return ChatCompletion.model_validate(
+        {
+            "id": "response",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "model",
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                },
+            ],
+        },
+    )
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(
+        response_cache,
+        "time",
+        types.SimpleNamespace(time=lambda: now[0]),
+    )
+    return now
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"), evict_every=1000)
+    yield cache
+    cache.close()
+
+
+def _values(cache):
+    return {row[0] for row in cache._conn.execute("SELECT value FROM responses")}
+
+
+def test_round_trip_and_persistence(tmp_path, clock):
+    path = str(tmp_path / "responses.sqlite")
+    cache = ResponseCache(path)
+    assert cache.get(_request("a")) is None
+    cache.put(_request("a"), _response("answer"))
+    assert cache.get(_request("a")).choices[0].message.content == "answer"
+    assert cache.get(_request("b")) is None
+    cache.close()
+
+    reopened = ResponseCache(path)
+    assert reopened.get(_request("a")).choices[0].message.content == "answer"
+    reopened.close()
+    assert cache.summary()["hits"] == 1
+    assert cache.summary()["misses"] == 2
+
+
+def test_expired_entries_miss_and_are_evicted(cache, clock):
+    cache.put(_request("a"), _response("answer"))
+    clock[0] += cache.max_age_seconds + 1
+    assert cache.get(_request("a")) is None
+    cache.evict()
+    assert not _values(cache)
+
+
+def test_least_recently_used_entries_go_first(cache, clock):
+    for content in ("a", "b", "c"):
+        clock[0] += 1
+        cache.put(_request(content), _response(content))
+    size = len(_response("a").model_dump_json())
+    clock[0] += 1
+    cache.get(_request("a"))
+    cache.max_size_bytes = 2 * size
+    cache.evict()
+    assert cache.get(_request("b")) is None
+    assert cache.get(_request("a")) is not None
+    assert cache.get(_request("c")) is not None
+
+
+def test_access_times_are_written_without_a_commit_per_hit(cache, clock):
+    cache.put(_request("a"), _response("a"))
+    clock[0] += 10
+    cache.get(_request("a"))
+    (accessed,) = cache._conn.execute("SELECT accessed FROM responses").fetchone()
+    assert accessed == clock[0] - 10
+    cache.put(_request("b"), _response("b"))
+    accessed = dict(
+        cache._conn.execute("SELECT value, accessed FROM responses").fetchall(),
+    )
+    assert accessed[_response("a").model_dump_json()] == clock[0]
+
+
+def test_model_answers_repeated_requests_from_the_cache(mock_model, cache):
+    model, responder = mock_model()
+    model.response_cache = cache
+    kwargs = dict(model=model.model_name, messages=_request("Total: 42")["messages"])
+    with row_context(**ROW):
+        with collect_request_stats() as first:
+            model.completions_with_backoff(**kwargs)
+        with collect_request_stats() as second:
+            model.completions_with_backoff(**kwargs)
+        # another endpoint serving the same model answers differently
+        model.api_base = "http://replica/v1"
+        model.completions_with_backoff(**kwargs)
+    assert responder.requests == 2
+    assert "cached_requests" not in first
+    assert second["cached_requests"] == 1
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import sys
+
+from nnautobench.utils.common_utils import get_row_key
+from nnautobench.utils.results_writer import load_completed_row_keys
+from nnautobench.utils.results_writer import ResultsWriter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CTX = [{"text": "Total: 1", "image_path": "ctx.png", "accepted": {}}]
+
+
+def test_row_key_is_stable_and_covers_the_whole_row():
+    # a sha1 of the row, the same in every process
+    key = get_row_key("docs/0/page.png", "['Total']", [])
+    assert key == "8e2ab48635e237e9fb53da5a6017d5122c2c2266"
+    assert get_row_key("docs/0/page.png", "['Total']", []) == key
+    assert get_row_key("docs/1/page.png", "['Total']", []) != key
+    assert get_row_key("docs/0/page.png", "['Date']", []) != key
+    assert get_row_key("docs/0/page.png", "['Total']", CTX) != key
+
+
+def test_writer_appends_and_drops_a_partial_last_row(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    writer = ResultsWriter(path)
+    writer.write({"row_key": "a"})
+    writer.write({"row_key": "b"})
+    writer.close()
+    # a crash in the middle of a write
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"row_key": "c", "con')
+    assert load_completed_row_keys(path) == {"a", "b"}
+
+    writer = ResultsWriter(path)
+    writer.write({"row_key": "c"})
+    writer.close()
+    with open(path, encoding="utf-8") as f:
+        assert [json.loads(line)["row_key"] for line in f] == ["a", "b", "c"]
+
+
+def test_completed_keys_of_a_missing_file(tmp_path):
+    assert load_completed_row_keys(str(tmp_path / "missing.jsonl")) == set()
+
+
+def _run(cwd, *args):
+    subprocess.run(
+        [sys.executable, os.path.join(ROOT, "tools", "benchmark.py"), *args],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+        env={**os.environ, "PYTHONPATH": ROOT},
+    )
+
+
+def _row_keys(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["row_key"] for line in f if line.strip()]
+
+
+def test_resume_completes_an_interrupted_run(tmp_path):
+    args = ["dsv3", "--input_file", os.path.join(ROOT, "sample_data.jsonl")]
+    _run(tmp_path, *args, "--mock")
+    (results,) = (tmp_path / "results").iterdir()
+    expected = _row_keys(results)
+    # keep two rows and half of the third, as a crash would
+    with open(results, encoding="utf-8") as f:
+        lines = f.readlines()
+    with open(results, "w", encoding="utf-8") as f:
+        f.writelines(lines[:2])
+        f.write(lines[2][: len(lines[2]) // 2])
+
+    _run(tmp_path, *args, "--mock", "--resume", str(results))
+    resumed = _row_keys(results)
+    assert resumed[:2] == expected[:2]
+    assert sorted(resumed) == sorted(expected)
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import types
+
+import httpx
+import openai
+import pytest
+
+from nnautobench.utils import retry_policy
+from nnautobench.utils.retry_policy import get_retry_after
+from nnautobench.utils.retry_policy import is_retryable
+from nnautobench.utils.retry_policy import RetryPolicy
+
+REQUEST = httpx.Request("POST", "http://endpoint.test/v1/chat/completions")
+
+
+def _status_error(status_code, headers=None):
+    response = httpx.Response(status_code, headers=headers, request=REQUEST)
+    return openai.APIStatusError("error", response=response, body=None)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.0]
+
+    def sleep(seconds):
+        now[0] += seconds
+
+    fake_time = types.SimpleNamespace(
+        monotonic=lambda: now[0],
+        sleep=sleep,
+        time=lambda: 1_000_000.0 + now[0],
+    )
+    monkeypatch.setattr(retry_policy, "time", fake_time)
+    return now
+
+
+@pytest.mark.parametrize("status_code", [408, 409, 429, 500, 502, 503, 504])
+def test_retryable_statuses(status_code):
+    assert is_retryable(_status_error(status_code))
+
+
+@pytest.mark.parametrize("status_code", [400, 401, 403, 404, 422])
+def test_client_errors_are_not_retried(status_code):
+    assert not is_retryable(_status_error(status_code))
+
+
+def test_connection_errors_and_timeouts_are_retried():
+    assert is_retryable(openai.APIConnectionError(request=REQUEST))
+    assert is_retryable(openai.APITimeoutError(request=REQUEST))
+    assert not is_retryable(ValueError("not a request error"))
+
+
+def test_retry_after_headers():
+    assert get_retry_after(_status_error(429, {"retry-after": "3"})) == 3.0
+    assert get_retry_after(_status_error(429, {"retry-after-ms": "250"})) == 0.25
+    assert get_retry_after(_status_error(429, {"retry-after": "soon"})) is None
+    assert get_retry_after(_status_error(429)) is None
+
+
+def test_jitter_stays_within_the_backoff(clock):
+    policy = RetryPolicy(base_delay=1.0, max_delay=10.0)
+    exc = _status_error(503)
+    for retry in range(6):
+        delays = [policy._next_delay(retry, exc, 0.0) for _ in range(200)]
+        assert all(0 <= delay <= min(10.0, 2**retry) for delay in delays)
+        # full jitter, not a fixed delay
+        assert max(delays) - min(delays) > 0.5 * min(10.0, 2**retry)
+
+
+def test_retry_after_is_honored_up_to_max_delay(clock):
+    policy = RetryPolicy(base_delay=0.01, max_delay=30.0)
+    assert policy._next_delay(0, _status_error(429, {"retry-after": "5"}), 0.0) >= 5
+    exc = _status_error(429, {"retry-after": "3600"})
+    assert policy._next_delay(0, exc, 0.0) == 30.0
+
+
+def test_gives_up_when_retry_after_exceeds_the_budget(clock):
+    policy = RetryPolicy(max_delay=60.0, request_timeout=10.0)
+    clock[0] = 2.0
+    exc = _status_error(429, {"retry-after": "20"})
+    assert policy._next_delay(0, exc, 0.0) is None
+
+
+def test_gives_up_after_max_retries(clock):
+    policy = RetryPolicy(max_retries=3, base_delay=0.1)
+    attempts = []
+
+    def send(timeout):
+        attempts.append(timeout)
+        raise _status_error(503)
+
+    with pytest.raises(openai.APIStatusError):
+        policy.call(send)
+    assert len(attempts) == 4
+    assert policy.summary()["retries"] == 3
+    assert policy.summary()["gave_up"] == 1
+
+
+def test_attempts_get_the_rest_of_the_budget(clock):
+    policy = RetryPolicy(base_delay=1.0, max_delay=1.0, request_timeout=10.0)
+    timeouts = []
+
+    def send(timeout):
+        timeouts.append(timeout)
+        clock[0] += 2.0
+        if len(timeouts) < 3:
+            raise openai.APITimeoutError(request=REQUEST)
+        return "answer"
+
+    assert policy.call(send) == "answer"
+    assert timeouts[0] == 10.0
+    # each attempt is cut off at what is left after the ones before it
+    assert timeouts[1] <= timeouts[0] - 2.0
+    assert timeouts[2] <= timeouts[1] - 2.0
+
+
+def test_no_request_starts_after_the_run_deadline(clock):
+    policy = RetryPolicy(run_deadline=5.0)
+    clock[0] = 6.0
+    with pytest.raises(TimeoutError):
+        policy.call(lambda timeout: "answer")
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import asyncio
+
+from nnautobench.inference.async_runner import get_provider_semaphore
+from nnautobench.inference.async_runner import run_predictions_async
+from nnautobench.inference.predictor import Predictor
+from nnautobench.inference.thread_runner import run_predictions_threaded
+
+
+def _outcomes(results):
+    return sorted(
+        (row["row_key"], row["file_accuracy"], row["parsing_accuracy"])
+        for row in results
+    )
+
+
+def _track_concurrency(model):
+    in_flight = [0, 0]
+    apredict = model.apredict
+
+    async def tracked(*args):
+        in_flight[0] += 1
+        in_flight[1] = max(in_flight)
+        try:
+            # hold the slot long enough for the others to pile up
+            await asyncio.sleep(0.01)
+            return await apredict(*args)
+        finally:
+            in_flight[0] -= 1
+
+    model.apredict = tracked
+    return in_flight
+
+
+def test_async_engine_answers_every_row_like_the_thread_engine(
+    mock_model,
+    text_tasks,
+):
+    model, _ = mock_model()
+    predictor = Predictor(model)
+    threaded, awaited = [], []
+    run_predictions_threaded(predictor, text_tasks, 4, threaded.append)
+    run_predictions_async(predictor, text_tasks, 4, awaited.append)
+    assert len(awaited) == len(text_tasks)
+    assert _outcomes(awaited) == _outcomes(threaded)
+    assert all(row["file_accuracy"] == 1.0 for row in awaited)
+
+
+def test_async_engine_caps_rows_in_flight(mock_model, text_tasks):
+    model, _ = mock_model()
+    in_flight = _track_concurrency(model)
+    results = []
+    run_predictions_async(Predictor(model), text_tasks, 3, results.append)
+    assert len(results) == len(text_tasks)
+    assert in_flight[1] == 3
+
+
+def test_async_engine_keeps_going_after_a_failed_row(mock_model, text_tasks):
+    model, _ = mock_model()
+    apredict = model.apredict
+    calls = []
+
+    async def flaky(*args):
+        calls.append(None)
+        if len(calls) == 1:
+            raise ValueError("bad row")
+        return await apredict(*args)
+
+    model.apredict = flaky
+    results = []
+    run_predictions_async(Predictor(model), text_tasks, 2, results.append)
+    assert len(results) == len(text_tasks) - 1
+
+
+def test_provider_semaphore_is_shared_per_endpoint():
+    async def semaphores():
+        return (
+            get_provider_semaphore("http://a/v1", 4),
+            get_provider_semaphore("http://a/v1", 8),
+            get_provider_semaphore("http://b/v1", 4),
+        )
+
+    first, same, other = asyncio.run(semaphores())
+    assert first is same
+    assert first is not other
+
+
+def test_process_pool_scores_like_inline_scoring(mock_model, text_tasks):
+    model, _ = mock_model()
+    predictor = Predictor(model)
+    inline, threaded, awaited = [], [], []
+    run_predictions_threaded(predictor, text_tasks, 4, inline.append)
+    run_predictions_threaded(
+        predictor,
+        text_tasks,
+        4,
+        threaded.append,
+        postprocess_workers=2,
+    )
+    run_predictions_async(
+        predictor,
+        text_tasks,
+        4,
+        awaited.append,
+        postprocess_workers=2,
+    )
+    assert len(threaded) == len(awaited) == len(text_tasks)
+    assert _outcomes(threaded) == _outcomes(inline)
+    assert _outcomes(awaited) == _outcomes(inline)
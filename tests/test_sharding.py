@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from nnautobench.utils.common_utils import get_shard_index
+from nnautobench.utils.common_utils import iter_data
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK = os.path.join(ROOT, "tools", "benchmark.py")
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    # sample rows under distinct paths, text models never open the image
+    with open(os.path.join(ROOT, "sample_data.jsonl"), encoding="utf-8") as f:
+        samples = [json.loads(line) for line in f if line.strip()]
+    path = tmp_path / "data.jsonl"
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(60):
+            row = dict(samples[i % len(samples)])
+            row["image_path"] = f"docs/{i}/{os.path.basename(row['image_path'])}"
+            f.write(json.dumps(row) + "\n")
+    return str(path)
+
+
+def _paths(rows):
+    return [row["image_path"] for row in rows]
+
+
+def test_shard_index_is_stable():
+    # sha1 of the row, not hash(), which changes with every python process
+    row = {"image_path": "docs/0/page.png", "Queried_labels": "['Total']"}
+    assert get_shard_index(row, 4) == 3
+    assert get_shard_index(row, 7) == 5
+
+
+@pytest.mark.parametrize("num_shards", [1, 2, 3, 8])
+def test_shards_partition_the_dataset(dataset, num_shards):
+    rows = _paths(iter_data(dataset))
+    shards = [
+        _paths(iter_data(dataset, shard=(index, num_shards)))
+        for index in range(num_shards)
+    ]
+    assert sorted(path for shard in shards for path in shard) == sorted(rows)
+    assert len({path for shard in shards for path in shard}) == len(rows)
+    # same split on every read
+    assert shards == [
+        _paths(iter_data(dataset, shard=(index, num_shards)))
+        for index in range(num_shards)
+    ]
+
+
+@pytest.mark.parametrize("offset,limit", [(0, 5), (3, None), (4, 6), (100, 5)])
+def test_offset_and_limit_apply_within_the_shard(dataset, offset, limit):
+    for index in range(3):
+        rows = _paths(iter_data(dataset, shard=(index, 3)))
+        end = None if limit is None else offset + limit
+        assert (
+            _paths(iter_data(dataset, limit=limit, offset=offset, shard=(index, 3)))
+            == rows[offset:end]
+        )
+
+
+def _run(cwd, *args):
+    os.makedirs(cwd, exist_ok=True)
+    subprocess.run(
+        [sys.executable, BENCHMARK, *args],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+        env={**os.environ, "PYTHONPATH": ROOT},
+    )
+    results = os.path.join(cwd, "results")
+    if not os.path.isdir(results):
+        return []
+    return [os.path.join(results, name) for name in sorted(os.listdir(results))]
+
+
+def _rows(path):
+    with open(path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    # mock answers are random, the rows themselves are not
+    fields = ("row_key", "path", "annotation", "queried_labels", "prompt")
+    return sorted(tuple(json.dumps(row[field]) for field in fields) for row in rows)
+
+
+def test_merged_shards_equal_an_unsharded_run(dataset, tmp_path):
+    args = ["dsv3", "--input_file", dataset, "--mock"]
+    (unsharded,) = _run(tmp_path / "unsharded", *args)
+    shard_files = [
+        path
+        for index in range(3)
+        for path in _run(tmp_path / f"shard{index}", *args, "--shard", f"{index}/3")
+    ]
+    merged = str(tmp_path / "merged.jsonl")
+    _run(tmp_path / "merge", "merge", *shard_files, "--output_file", merged)
+    assert len(_rows(unsharded)) == 60
+    assert _rows(merged) == _rows(unsharded)
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from nnautobench.inference.predictor import Predictor
+from nnautobench.utils.streaming import consume_stream
+from nnautobench.utils.streaming import StreamingStats
+
+
+def _streamed(mock_model, **mock_kwargs):
+    model, responder = mock_model(**mock_kwargs)
+    model.streaming_stats = StreamingStats(model.model_name)
+    return model, responder
+
+
+def test_streamed_answers_match_plain_ones(mock_model, text_tasks):
+    plain, _ = mock_model()
+    streamed, responder = _streamed(mock_model)
+    for task in text_tasks[:3]:
+        expected = Predictor(plain, "logprob").process_single_image(**task)
+        result = Predictor(streamed, "logprob").process_single_image(**task)
+        for key in ("pred", "file_accuracy"):
+            assert result[key] == expected[key]
+        # the mock prices the prompt by its bytes, the stream options included
+        assert result["usage"]["completion_tokens"] == (
+            expected["usage"]["completion_tokens"]
+        )
+        assert result["predicted_field_conf_scores"].keys() == (
+            expected["predicted_field_conf_scores"].keys()
+        )
+        (stream,) = result["streams"]
+        assert stream["output_tokens"] == result["usage"]["completion_tokens"]
+    assert responder.requests == 3
+
+
+def test_decode_speed_is_measured(mock_model, text_tasks):
+    model, _ = _streamed(mock_model, tokens_per_second=1000)
+    Predictor(model, "logprob").process_single_image(**text_tasks[0])
+    summary = model.streaming_stats.summary()
+    assert summary["streamed_requests"] == 1
+    assert summary["itl_p50"] >= 0.001
+    assert 0 < summary["output_tokens_per_second_p50"] <= 1000
+
+
+def test_async_streaming_matches(mock_model, text_tasks):
+    model, _ = _streamed(mock_model)
+    predictor = Predictor(model)
+    result = asyncio.run(predictor.aprocess_single_image(**text_tasks[0]))
+    assert result["file_accuracy"] == 1.0
+    # the confidence follow-up is streamed too
+    assert [stream["phase"] for stream in result["streams"]] == [
+        "network",
+        "conf_call",
+    ]
+
+
+class _BrokenStream:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __iter__(self):
+        yield from self.chunks
+        request = httpx.Request("POST", "http://mock/v1/chat/completions")
+        raise httpx.RemoteProtocolError("peer closed connection", request=request)
+
+
+def test_dropped_stream_is_a_retryable_connection_error():
+    with pytest.raises(openai.APIConnectionError):
+        consume_stream(_BrokenStream([]), 0.0)
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import csv
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from nnautobench.inference.shared_prompts import SharedPromptCache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_prompt_is_built_once_per_family_and_then_dropped():
+    cache = SharedPromptCache({"a": 2})
+    builds = []
+
+    def build():
+        builds.append(None)
+        return "messages"
+
+    assert cache.get_or_build("a", "row", build) == "messages"
+    assert cache.get_or_build("a", "row", build) == "messages"
+    assert len(builds) == 1
+    assert cache.summary() == {"hits": 1, "misses": 1}
+    # taken by both models, a third call builds it again
+    cache.get_or_build("a", "row", build)
+    assert len(builds) == 2
+    # families are cached on their own
+    cache.get_or_build("b", "row", build)
+    assert len(builds) == 3
+
+
+def test_concurrent_models_wait_for_the_builder():
+    cache = SharedPromptCache({"a": 3})
+    started = threading.Event()
+    release = threading.Event()
+    results = []
+
+    def slow_build():
+        started.set()
+        release.wait()
+        return "messages"
+
+    owner = threading.Thread(
+        target=lambda: results.append(cache.get_or_build("a", "row", slow_build)),
+    )
+    owner.start()
+    started.wait()
+    waiters = [
+        threading.Thread(
+            target=lambda: results.append(
+                cache.get_or_build("a", "row", lambda: "rebuilt"),
+            ),
+        )
+        for _ in range(2)
+    ]
+    for thread in waiters:
+        thread.start()
+    release.set()
+    for thread in [owner, *waiters]:
+        thread.join()
+    assert results == ["messages"] * 3
+
+
+def test_failed_build_is_retried_by_every_model():
+    cache = SharedPromptCache({"a": 2})
+
+    def broken():
+        raise ValueError("bad row")
+
+    with pytest.raises(ValueError):
+        cache.get_or_build("a", "row", broken)
+    assert cache.get_or_build("a", "row", lambda: "messages") == "messages"
+
+
+def _run(cwd, *models):
+    subprocess.run(
+        [
+            sys.executable,
+            os.path.join(ROOT, "tools", "benchmark.py"),
+            *models,
+            "--input_file",
+            os.path.join(ROOT, "sample_data.jsonl"),
+            "--mock",
+        ],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+        env={**os.environ, "PYTHONPATH": ROOT},
+    )
+    return sorted((cwd / "results").iterdir())
+
+
+def _outcomes(path):
+    with open(path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return sorted((row["row_key"], row["file_accuracy"]) for row in rows)
+
+
+def test_sweep_matches_separate_runs(tmp_path):
+    (tmp_path / "single").mkdir()
+    (tmp_path / "sweep").mkdir()
+    (single,) = _run(tmp_path / "single", "dsv3")
+    files = _run(tmp_path / "sweep", "dsv3", "gpt4o")
+    (summary,) = [path for path in files if path.name.startswith("sweep_summary")]
+    with open(summary, encoding="utf-8") as f:
+        assert sorted(row["model"] for row in csv.DictReader(f)) == ["dsv3", "gpt4o"]
+    results = {
+        model: path
+        for path in files
+        for model in ("dsv3", "gpt4o")
+        if path.name.startswith(f"benchmark_results_{model}_")
+    }
+    assert _outcomes(results["dsv3"]) == _outcomes(single)
+    assert _outcomes(results["gpt4o"]) == _outcomes(single)
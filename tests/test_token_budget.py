@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+from nnautobench.inference.predictor import Predictor
+from nnautobench.utils.token_budget import DEFAULT_IMAGE_TOKENS
+from nnautobench.utils.token_budget import estimate_image_tokens
+from nnautobench.utils.token_budget import estimate_prompt_tokens
+from nnautobench.utils.token_budget import estimate_text_tokens
+from nnautobench.utils.token_budget import MESSAGE_OVERHEAD_TOKENS
+from nnautobench.utils.token_budget import TokenBudget
+
+
+def _data_url(width, height):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height)).save(buffer, format="PNG")
+    return f"data:image/png;base64,{base64.b64encode(buffer.getvalue()).decode()}"
+
+
+def test_text_estimate_counts_punctuation_separately():
+    assert estimate_text_tokens("") == 0
+    assert estimate_text_tokens("hello world") == 4
+    # every symbol of OCR noise is a token of its own
+    assert estimate_text_tokens("< < < <") == 4
+
+
+@pytest.mark.parametrize(
+    "size,tokens",
+    [((512, 512), 255), ((1024, 1024), 765), ((4096, 2048), 1105)],
+)
+def test_image_estimate_follows_tile_pricing(size, tokens):
+    assert estimate_image_tokens(*size) == tokens
+
+
+def test_prompt_estimate_reads_image_sizes():
+    messages = [
+        {"role": "system", "content": "hello world"},
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": "hello world"},
+                {"type": "image_url", "image_url": {"url": _data_url(512, 512)}},
+                {"type": "image_url", "image_url": {"url": "https://x/a.png"}},
+            ],
+        },
+    ]
+    assert estimate_prompt_tokens(messages) == (
+        2 * MESSAGE_OVERHEAD_TOKENS + 2 * 4 + 255 + DEFAULT_IMAGE_TOKENS
+    )
+
+
+def test_spend_is_counted_with_prices(mock_model, text_tasks):
+    model, _ = mock_model()
+    model.token_budget = TokenBudget(
+        model.model_name,
+        prices={"input": 1.0, "output": 2.0},
+    )
+    result = Predictor(model, "logprob").process_single_image(**text_tasks[0])
+    summary = model.token_budget.summary()
+    usage = result["usage"]
+    assert summary["requests"] == 1
+    assert summary["prompt_tokens"] == usage["prompt_tokens"]
+    assert result["billed_tokens"] == usage["total_tokens"]
+    assert result["cost_usd"] == pytest.approx(
+        (usage["prompt_tokens"] + 2 * usage["completion_tokens"]) / 1e6,
+    )
+
+
+def test_guard_stops_scheduling_rows_at_the_limit(mock_model, text_tasks):
+    model, responder = mock_model()
+    predictor = Predictor(model, "logprob")
+    per_row = predictor.process_single_image(**text_tasks[0])["usage"]["total_tokens"]
+    model.token_budget = TokenBudget(model.model_name, max_tokens=3.5 * per_row)
+    started = 0
+    for task in model.token_budget.guard(text_tasks):
+        started += 1
+        model.token_budget.row_finished(predictor.process_single_image(**task))
+    # a fourth row would be expected to go over
+    assert started == 3
+    summary = model.token_budget.summary()
+    assert summary["prompt_tokens"] + summary["completion_tokens"] <= 3.5 * per_row
+    assert responder.requests == 4
+
+
+def test_requests_in_flight_count_against_the_limit():
+    budget = TokenBudget("m", max_tokens=100)
+    reservation = budget.reserve({"n": 1}, 60)
+    assert not budget.exhausted()
+    budget.reserve({"n": 1}, 40)
+    assert budget.exhausted()
+    budget.settle(reservation, None)
+    assert not budget.exhausted()
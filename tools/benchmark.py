@@ -2,19 +2,57 @@ from __future__ import annotations
 
 import argparse
 import concurrent.futures
+import json
 import logging
 import os
+import sys
 import time
+from collections import Counter
 from datetime import datetime
+from functools import partial
 
 import pandas as pd
 from dotenv import load_dotenv
-from tqdm import tqdm
 
+from nnautobench.config.config import HTTP_CLIENT_CONFIG
 from nnautobench.config.config import MODEL_CONFIGS
+from nnautobench.inference.async_runner import run_predictions_async
+from nnautobench.inference.batch import export_batch_requests
+from nnautobench.inference.batch import ingest_batch_results
+from nnautobench.inference.batch import load_batch_results
+from nnautobench.inference.batch import UNBATCHABLE_CONF_SCORE_METHODS
+from nnautobench.inference.batch import write_fake_batch_results
+from nnautobench.inference.dry_run import run_dry_run
 from nnautobench.inference.predictor import Predictor
+from nnautobench.inference.shared_prompts import prompt_family
+from nnautobench.inference.shared_prompts import SharedPromptCache
+from nnautobench.inference.thread_runner import run_predictions_threaded
+from nnautobench.models import available_models
 from nnautobench.models import get_model
-from nnautobench.utils.common_utils import load_data
+from nnautobench.utils.common_utils import get_row_key
+from nnautobench.utils.common_utils import iter_data
+from nnautobench.utils.concurrency import get_concurrency_limiter
+from nnautobench.utils.concurrency import log_concurrency_summary
+from nnautobench.utils.hedging import RequestHedger
+from nnautobench.utils.http_client import configure_http_client
+from nnautobench.utils.http_client import log_http_client_summary
+from nnautobench.utils.image_utils import image_cache
+from nnautobench.utils.image_utils import image_preprocessing
+from nnautobench.utils.live_metrics import get_live_metrics
+from nnautobench.utils.live_metrics import start_live_metrics_exporter
+from nnautobench.utils.live_metrics import stop_live_metrics_exporter
+from nnautobench.utils.load_balancer import BALANCING_POLICIES
+from nnautobench.utils.load_balancer import log_load_balancer_summary
+from nnautobench.utils.mock_transport import create_mock_clients
+from nnautobench.utils.mock_transport import MockChatCompletions
+from nnautobench.utils.rate_limiter import get_rate_limiter
+from nnautobench.utils.rate_limiter import log_rate_limit_summary
+from nnautobench.utils.response_cache import ResponseCache
+from nnautobench.utils.results_writer import load_completed_row_keys
+from nnautobench.utils.results_writer import ResultsWriter
+from nnautobench.utils.retry_policy import RetryPolicy
+from nnautobench.utils.streaming import StreamingStats
+from nnautobench.utils.token_budget import TokenBudget
 
 load_dotenv()  # Load environment variables at the start of benchmark.py
 
@@ -26,6 +64,75 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def build_task(row, few_shot, layout):
+    return dict(
+        image_path=row["image_path"],
+        annotation=row["accepted"],
+        few_shot=few_shot,
+        ctx=(
+            []
+            if few_shot == 0
+            else [
+                {
+                    "text": row[f"ctx_{i}"],
+                    # if i!=1 else row[f'annotated_image_path'] ,
+                    "image_path": row[f"ctx_{i}_image_path"],
+                    "accepted": row[f"ctx_{i}_accepted"],
+                }
+                for i in range(1, few_shot + 1)
+            ]
+        ),
+        input_text=row["content"],  # change this
+        keys=row["Queried_labels"],
+        layout=layout,
+    )
+
+
+def summarize_results(df_results):
+    """Log and return the accuracy metrics of a results dataframe."""
+    avg_accuracy = df_results.file_accuracy.mean()
+    parsing_accuracy = df_results.parsing_accuracy.mean()
+
+    correct_approved = df_results["correct_approved"].sum()
+    incorrect_approved = df_results["incorrect_approved"].sum()
+    total_fields = df_results["total_fields"].sum()
+    approval_accuracy = correct_approved / (correct_approved + incorrect_approved)
+    approval_rate = (correct_approved + incorrect_approved) / total_fields
+    logger.info(
+        f"Approval Accuracy: {approval_accuracy:.4f}, Approval Rate: {approval_rate:.4f}",
+    )
+    logger.info(f"Parsing Accuracy: {parsing_accuracy:.4f}")
+    logger.info(f"Average Accuracy: {avg_accuracy:.4f}")
+    return {
+        "rows": len(df_results),
+        "average_accuracy": avg_accuracy,
+        "parsing_accuracy": parsing_accuracy,
+        "approval_accuracy": approval_accuracy,
+        "approval_rate": approval_rate,
+    }
+
+
+def log_phase_timings(timings):
+    """Log p50/p95/p99 of the seconds spent in each phase of a row."""
+    # rows appended by a run before phases were recorded have none
+    df_timings = pd.DataFrame(timings.dropna().tolist())
+    if df_timings.empty:
+        return
+    logger.info("Phase timings per document (p50 / p95 / p99):")
+    for phase in df_timings.columns:
+        p50, p95, p99 = df_timings[phase].quantile([0.5, 0.95, 0.99]) * 1000
+        logger.info(
+            f"  {phase:<12} {p50:9.1f}ms {p95:9.1f}ms {p99:9.1f}ms",
+        )
+
+
+def _write_result(writer, model, result):
+    writer.write(result)
+    model.token_budget.row_finished(result)
+    if model.live_metrics is not None:
+        model.live_metrics.document_finished(result)
+
+
 def run_benchmark(
     model_name,
     input_file=None,
@@ -34,6 +141,49 @@ def run_benchmark(
     layout="default",
     conf_score_method="prob",
     limit=None,
+    offset=0,
+    engine="thread",
+    adaptive_concurrency=False,
+    initial_concurrency=8,
+    use_cache=False,
+    cache_path="cache/responses.sqlite",
+    cache_max_size_mb=2048,
+    cache_max_age_days=30,
+    resume=None,
+    image_cache_mb=512,
+    image_max_long_edge=None,
+    image_format=None,
+    image_quality=85,
+    image_grayscale=False,
+    consistency_batch_size=2,
+    batch_export=None,
+    batch_fake_results=None,
+    batch_ingest=None,
+    dry_run=False,
+    mock=False,
+    mock_latency="const:0",
+    mock_error_rate=0.0,
+    mock_rate_limit_rate=0.0,
+    mock_field_error_rate=0.0,
+    mock_tokens_per_second=None,
+    stream=False,
+    max_tokens_budget=None,
+    max_cost=None,
+    metrics_port=None,
+    status_file=None,
+    status_interval=10.0,
+    hedge=False,
+    hedge_quantile=0.95,
+    max_retries=10,
+    retry_base_delay=1.0,
+    retry_max_delay=60.0,
+    request_timeout=None,
+    run_timeout=None,
+    load_balancing="least_outstanding",
+    shard=None,
+    postprocess_workers=0,
+    tasks=None,
+    prompt_cache=None,
 ):
     start_time = datetime.now()
     logger.info(f"Starting benchmark for model: {model_name}")
@@ -41,6 +191,11 @@ def run_benchmark(
     logger.info(f"Max workers: {max_workers}")
     logger.info(f"Num of fewshot examples: {few_shot}")
     logger.info(f"Layout: {layout}")
+    logger.info(f"Engine: {engine}")
+    logger.info(f"Adaptive concurrency: {adaptive_concurrency}")
+    if shard:
+        logger.info(f"Shard: {shard[0]} of {shard[1]}")
+    logger.info(f"Response cache: {cache_path if use_cache else 'disabled'}")
     try:
         model_config = MODEL_CONFIGS[model_name]
         model_class = get_model(model_name)
@@ -49,104 +204,305 @@ def run_benchmark(
             raise ValueError(f"Unknown model: {model_name}")
 
         logger.info(f"Initializing {model_name} model")
+        api_base = model_config["api_base"]
+        replicas = None
+        if isinstance(api_base, (list, tuple)):
+            # requests go to the first URL and are rerouted across all of them
+            replicas = list(api_base)
+            api_base = replicas[0]
+            logger.info(
+                f"Load balancing ({load_balancing}) across {len(replicas)} replicas",
+            )
+        configure_http_client(
+            api_base,
+            # one pooled connection per worker unless configured otherwise
+            **{
+                "max_connections": max_workers,
+                "replicas": replicas,
+                "load_balancing": load_balancing,
+                **HTTP_CLIENT_CONFIG,
+                **model_config.get("http_client", {}),
+            },
+        )
+        mock_responder = None
+        clients = {}
+        if dry_run:
+            # offline clients: no API key needed and nothing can reach the network
+            clients = dict(
+                zip(
+                    ("client", "aclient"),
+                    create_mock_clients(MockChatCompletions()),
+                ),
+            )
+            use_cache = False
+        if mock:
+            mock_responder = MockChatCompletions(
+                latency=mock_latency,
+                error_rate=mock_error_rate,
+                rate_limit_rate=mock_rate_limit_rate,
+                field_error_rate=mock_field_error_rate,
+                tokens_per_second=mock_tokens_per_second,
+            )
+            clients = dict(
+                zip(("client", "aclient"), create_mock_clients(mock_responder)),
+            )
+            # mock answers must never end up in the response cache
+            use_cache = False
+            logger.info(f"Mock transport: latency {mock_latency}")
         model = model_class(
             model_config["model_name"],
-            model_config["api_base"],
+            api_base,
+            **clients,
         )
-        predictor = Predictor(model, conf_score_method)
+        model.consistency_batch_size = consistency_batch_size
+        model.retry_policy = RetryPolicy(
+            max_retries=max_retries,
+            base_delay=retry_base_delay,
+            max_delay=retry_max_delay,
+            request_timeout=request_timeout,
+            run_deadline=time.monotonic() + run_timeout if run_timeout else None,
+        )
+        if stream:
+            model.streaming_stats = StreamingStats(model.model_name)
+        model.token_budget = TokenBudget(
+            model_name,
+            prices=model_config.get("prices"),
+            max_tokens=max_tokens_budget,
+            max_cost=max_cost,
+        )
+        if max_cost is not None and not model.token_budget.prices:
+            logger.warning(
+                f"No prices configured for {model_name}, --max_cost is not enforced",
+            )
+        live_metrics = metrics_port is not None or status_file is not None
+        if live_metrics:
+            model.live_metrics = get_live_metrics(model_name)
+        if hedge:
+            model.hedger = RequestHedger(
+                model.model_name,
+                quantile=hedge_quantile,
+                max_workers=max_workers,
+            )
+        if adaptive_concurrency:
+            # max_workers only caps the pool, the limiter decides what is in flight
+            model.concurrency_limiter = get_concurrency_limiter(
+                model.api_base,
+                initial_limit=min(initial_concurrency, max_workers),
+                max_limit=max_workers,
+            )
+        # shared by every model sending the same provider model name to api_base
+        model.rate_limiter = get_rate_limiter(
+            f"{model.model_name}@{model.api_base}",
+            **model_config.get("rate_limits", {}),
+        )
+        if use_cache:
+            model.response_cache = ResponseCache(
+                cache_path,
+                max_size_bytes=cache_max_size_mb * 1024**2,
+                max_age_seconds=cache_max_age_days * 24 * 3600,
+            )
+        image_cache.resize(image_cache_mb * 1024**2)
+        image_preprocessing.configure(
+            max_long_edge=image_max_long_edge,
+            image_format=image_format,
+            quality=image_quality,
+            grayscale=image_grayscale,
+        )
+        if image_preprocessing.enabled:
+            logger.info(f"Image preprocessing: {image_preprocessing.signature}")
+        predictor = Predictor(model, conf_score_method, prompt_cache)
 
         logger.info("Loading and filtering data")
-        dataset_name = ""
-        if input_file:
-            df = load_data(input_file)
-            if limit is None:
-                df_filtered = df
-            elif limit > len(df):
-                logger.warning(
-                    f"{limit} is greater than the number of samples in the dataset. Using the entire dataset",
-                )
-                df_filtered = df
-            else:
-                df_filtered = df.head(limit)
+        if not input_file:
+            raise ValueError("Either input_file or model_id must be provided")
+        dataset_name = os.path.basename(input_file).split(".")[0]
+        assert few_shot == 1, "Only oneshot dataset is supported for now!"
+        if tasks is None:
+            # rows are parsed lazily, only as the executor asks for more work
+            rows = iter_data(input_file, limit=limit, offset=offset, shard=shard)
+            tasks = (build_task(row, few_shot, layout) for row in rows)
+        else:
+            # already loaded by run_sweep and shared with the other models
+            limit = len(tasks)
+            tasks = iter(tasks)
+        if resume:
+            output_file = resume
+            completed = load_completed_row_keys(resume)
+            tasks = (
+                task
+                for task in tasks
+                if get_row_key(task["image_path"], task["keys"], task["ctx"])
+                not in completed
+            )
+            logger.info(f"Resuming {resume}: skipping {len(completed)} finished rows")
+        else:
+            current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
+            shard_suffix = f"_shard{shard[0]}of{shard[1]}" if shard else ""
+            output_file = f"results/benchmark_results_{model_name}_{dataset_name}_{'field'}_{current_time}{shard_suffix}.jsonl"
 
-            dataset_name = os.path.basename(input_file).split(".")[0]
+        if dry_run:
+            return {
+                "model": model_name,
+                **run_dry_run(
+                    predictor,
+                    tasks,
+                    total=None if resume else limit,
+                    prices=model_config.get("prices"),
+                ),
+            }
 
-        else:
-            raise ValueError("Either input_file or model_id must be provided")
-        logger.info(f"Filtered data shape: {df_filtered.shape}")
+        if batch_export:
+            num_requests = export_batch_requests(predictor, tasks, batch_export)
+            logger.info(f"Wrote {num_requests} batch requests to {batch_export}")
+            if batch_fake_results:
+                rows = iter_data(input_file, limit=limit, offset=offset, shard=shard)
+                num_results = write_fake_batch_results(
+                    batch_export,
+                    (build_task(row, few_shot, layout) for row in rows),
+                    batch_fake_results,
+                )
+                logger.info(
+                    f"Wrote {num_results} fake batch results to {batch_fake_results}",
+                )
+            return
+
+        # rows are only started while the spend is within the budget
+        tasks = model.token_budget.guard(tasks)
+        writer = ResultsWriter(output_file)
+        on_result = partial(_write_result, writer, model)
+        if live_metrics:
+            start_live_metrics_exporter(metrics_port, status_file, status_interval)
 
-        results = []
         logger.info(f"Starting prediction with {max_workers} workers")
         pred_start_time = time.perf_counter()
-        assert few_shot == 1, "Only oneshot dataset is supported for now!"
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {
-                executor.submit(
-                    predictor.process_single_image,
-                    row["image_path"],
-                    row["accepted"],
-                    few_shot,
-                    (
-                        []
-                        if few_shot == 0
-                        else [
-                            {
-                                "text": row[f"ctx_{i}"],
-                                # if i!=1 else row[f'annotated_image_path'] ,
-                                "image_path": row[f"ctx_{i}_image_path"],
-                                "accepted": row[f"ctx_{i}_accepted"],
-                            }
-                            for i in range(1, few_shot + 1)
-                        ]
-                    ),
-                    row["content"],  # change this
-                    row["Queried_labels"],
-                    layout,
-                ): i
-                for i, (_, row) in enumerate(df_filtered.iterrows())
-            }
-
-            for future in tqdm(
-                concurrent.futures.as_completed(futures),
-                total=len(df_filtered),
-                desc="Processing images",
-            ):
-                try:
-                    result = future.result()
-                    results.append(result)
-                except Exception as exc:
-                    logger.error(
-                        f"Image generated an exception: {exc}",
-                        exc_info=True,
-                    )
+        try:
+            if batch_ingest:
+                ingest_batch_results(
+                    predictor,
+                    tasks,
+                    load_batch_results(batch_ingest),
+                    on_result,
+                )
+            elif engine == "async":
+                run_predictions_async(
+                    predictor,
+                    tasks,
+                    max_workers,
+                    on_result,
+                    total=None if resume else limit,
+                    postprocess_workers=postprocess_workers,
+                )
+            else:
+                run_predictions_threaded(
+                    predictor,
+                    tasks,
+                    max_workers,
+                    on_result,
+                    total=None if resume else limit,
+                    postprocess_workers=postprocess_workers,
+                )
+        finally:
+            writer.close()
+            logger.info(f"{writer.rows_written} new rows appended to {output_file}")
+            if model.hedger is not None:
+                model.hedger.close()
+            if live_metrics:
+                stop_live_metrics_exporter()
 
         pred_end_time = time.perf_counter()
         logger.info(
             f"Prediction completed in {pred_end_time - pred_start_time:.2f} seconds",
         )
+        if mock_responder is not None:
+            mock_summary = mock_responder.summary()
+            logger.info(
+                f"Mock transport: {mock_summary['requests']} requests "
+                f"({mock_summary['requests'] / (pred_end_time - pred_start_time):.1f}/s), "
+                f"{mock_summary['errors']} errors, "
+                f"{mock_summary['rate_limited']} rate limited",
+            )
+        if adaptive_concurrency:
+            log_concurrency_summary()
+        log_rate_limit_summary()
+        log_http_client_summary()
+        log_load_balancer_summary()
+        retry_summary = model.retry_policy.summary()
+        if retry_summary["retries"] or retry_summary["gave_up"]:
+            logger.info(
+                f"Retries: {retry_summary['retries']}, "
+                f"{retry_summary['backoff_seconds']:.1f}s spent in backoff, "
+                f"gave up on {retry_summary['gave_up']} requests",
+            )
+        if model.hedger is not None:
+            model.hedger.log_summary()
+        if model.streaming_stats is not None:
+            model.streaming_stats.log_summary()
+        model.token_budget.log_summary()
+        if model.response_cache is not None:
+            cache_summary = model.response_cache.summary()
+            logger.info(
+                f"Response cache: {cache_summary['hits']} hits, "
+                f"{cache_summary['misses']} misses "
+                f"(hit rate {cache_summary['hit_rate']:.2%})",
+            )
+            model.response_cache.close()
+        image_cache_summary = image_cache.summary()
+        if image_cache_summary["hits"] + image_cache_summary["misses"]:
+            logger.info(
+                f"Image cache: {image_cache_summary['hits']} hits, "
+                f"{image_cache_summary['misses']} misses "
+                f"(hit rate {image_cache_summary['hit_rate']:.2%}), "
+                f"{image_cache_summary['evictions']} evictions",
+            )
 
-        logger.info("Saving results to DataFrame")
-        df_results = pd.DataFrame(results)
-
-        current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_file = f"results/benchmark_results_{model_name}_{dataset_name}_{'field'}_{current_time}.jsonl"
-        df_results.to_json(output_file, orient="records", lines=True)
+        logger.info("Loading results into DataFrame")
+        df_results = pd.read_json(output_file, orient="records", lines=True)
         logger.info(
             f"Results saved to {output_file} of shape {df_results.shape}",
         )
 
-        logger.info(f"Results for {model_name}:")
-        avg_accuracy = df_results.file_accuracy.mean()
-        parsing_accuracy = df_results.parsing_accuracy.mean()
+        if df_results["image_bytes_sent"].sum():
+            original_bytes = df_results["image_bytes_original"].sum()
+            sent_bytes = df_results["image_bytes_sent"].sum()
+            logger.info(
+                f"Image bytes: {original_bytes} original, {sent_bytes} sent "
+                f"({sent_bytes / original_bytes:.2%})",
+            )
 
-        correct_approved = df_results["correct_approved"].sum()
-        incorrect_approved = df_results["incorrect_approved"].sum()
-        total_fields = df_results["total_fields"].sum()
-        logger.info(
-            f"Approval Accuracy: {correct_approved/(correct_approved+incorrect_approved):.4f}, Approval Rate: {(correct_approved + incorrect_approved)/total_fields:.4f}",
+        if "hedged_requests" in df_results:
+            logger.info(
+                f"Rows with a hedged request: "
+                f"{df_results['hedged_requests'].notna().sum()} of {len(df_results)}",
+            )
+        if "consistency_requests" in df_results:
+            prompt_tokens = df_results["usage"].map(
+                lambda usage: usage.get("prompt_tokens", 0)
+                if isinstance(usage, dict)
+                else 0,
+            )
+            logger.info(
+                f"Consistency per document: "
+                f"{df_results['consistency_samples'].mean():.2f} samples, "
+                f"{df_results['consistency_requests'].mean():.2f} requests, "
+                f"{prompt_tokens.mean():.0f} prompt tokens",
+            )
+
+        # cached rows did not wait on the model
+        cached = (
+            df_results["cached"].fillna(False).astype(bool)
+            if "cached" in df_results
+            else pd.Series(False, index=df_results.index)
         )
-        logger.info(f"Parsing Accuracy: {parsing_accuracy:.4f}")
-        logger.info(f"Average Accuracy: {avg_accuracy:.4f}")
+        if cached.any():
+            logger.info(
+                f"Rows answered from the response cache: {cached.sum()} of "
+                f"{len(df_results)}, left out of the phase timings",
+            )
+        if "timings" in df_results:
+            log_phase_timings(df_results.loc[~cached, "timings"])
+
+        logger.info(f"Results for {model_name}:")
+        metrics = summarize_results(df_results)
 
     finally:
         pass
@@ -154,16 +510,238 @@ def run_benchmark(
     end_time = datetime.now()
     duration = end_time - start_time
     logger.info(f"Benchmark completed in {duration}")
+    return {
+        "model": model_name,
+        **metrics,
+        "prediction_seconds": pred_end_time - pred_start_time,
+        **(model.streaming_stats.summary() if model.streaming_stats else {}),
+        **{
+            key: value
+            for key, value in model.token_budget.summary().items()
+            if key in ("prompt_tokens", "completion_tokens", "cost_usd")
+        },
+        "output_file": output_file,
+    }
+
+
+def run_sweep(
+    model_names,
+    input_file,
+    few_shot=1,
+    layout="default",
+    limit=None,
+    offset=0,
+    shard=None,
+    **kwargs,
+):
+    """Benchmark several models concurrently on a dataset loaded once.
+
+    Every model runs with its own workers and limits; models of the same
+    prompt family share the messages built for each row. Writes one results
+    file per model and a combined summary.
+    """
+    start_time = datetime.now()
+    logger.info(f"Starting sweep over {', '.join(model_names)}")
+    tasks = [
+        build_task(row, few_shot, layout)
+        for row in iter_data(input_file, limit=limit, offset=offset, shard=shard)
+    ]
+    logger.info(f"Loaded {len(tasks)} rows from {input_file}")
+    prompt_cache = SharedPromptCache(
+        Counter(prompt_family(get_model(model_name)) for model_name in model_names),
+    )
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=len(model_names),
+    ) as executor:
+        futures = {
+            model_name: executor.submit(
+                run_benchmark,
+                model_name,
+                input_file=input_file,
+                few_shot=few_shot,
+                layout=layout,
+                shard=shard,
+                tasks=tasks,
+                prompt_cache=prompt_cache,
+                **kwargs,
+            )
+            for model_name in model_names
+        }
+    summaries = []
+    for model_name, future in futures.items():
+        try:
+            summaries.append(future.result())
+        except Exception:
+            logger.exception(f"Benchmark of {model_name} failed")
+
+    prompt_summary = prompt_cache.summary()
+    logger.info(
+        f"Shared prompts: {prompt_summary['misses']} built, "
+        f"{prompt_summary['hits']} reused",
+    )
+    if not summaries:
+        return None
+    df_summary = pd.DataFrame(summaries)
+    dataset_name = os.path.basename(input_file).split(".")[0]
+    current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
+    summary_file = f"results/sweep_summary_{dataset_name}_{current_time}.csv"
+    df_summary.to_csv(summary_file, index=False)
+    logger.info(f"Sweep summary saved to {summary_file}:\n{df_summary.to_string()}")
+    logger.info(f"Sweep completed in {datetime.now() - start_time}")
+    return df_summary
+
+
+def merge_results(
+    result_files,
+    output_file,
+    input_file=None,
+    num_shards=None,
+    few_shot=1,
+    layout="default",
+    limit=None,
+    offset=0,
+):
+    """Combine the result files of shards into ``output_file``.
+
+    Rows are identified by ``row_key``; a row found in several files is only
+    kept once. When ``input_file`` is given with the ``num_shards``,
+    ``limit`` and ``offset`` the shards were run with, rows of the dataset
+    missing from every file are reported as gaps.
+    """
+    if os.path.exists(output_file):
+        # ResultsWriter appends, which would mix in an earlier merge
+        raise FileExistsError(f"{output_file} already exists")
+    seen = set()
+    duplicates = 0
+    writer = ResultsWriter(output_file)
+    try:
+        for path in result_files:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    row = json.loads(line)
+                    if row["row_key"] in seen:
+                        duplicates += 1
+                        continue
+                    seen.add(row["row_key"])
+                    writer.write(row)
+    finally:
+        writer.close()
+    logger.info(
+        f"Merged {len(seen)} rows from {len(result_files)} files into {output_file}",
+    )
+    if duplicates:
+        logger.warning(f"Dropped {duplicates} duplicate rows")
+
+    if input_file:
+        expected = {}
+        for index in range(num_shards or 1):
+            shard = (index, num_shards) if num_shards else None
+            for row in iter_data(input_file, limit=limit, offset=offset, shard=shard):
+                task = build_task(row, few_shot, layout)
+                row_key = get_row_key(task["image_path"], task["keys"], task["ctx"])
+                expected[row_key] = task["image_path"]
+        missing = [key for key in expected if key not in seen]
+        unexpected = len(seen - expected.keys())
+        if missing:
+            logger.warning(
+                f"{len(missing)} of {len(expected)} rows are missing, e.g. "
+                + ", ".join(expected[key] for key in missing[:5]),
+            )
+        else:
+            logger.info(f"All {len(expected)} rows of {input_file} are present")
+        if unexpected:
+            logger.warning(f"{unexpected} rows are not part of {input_file}")
+
+    df_results = pd.read_json(output_file, orient="records", lines=True)
+    logger.info("Results for the merged shards:")
+    return {**summarize_results(df_results), "duplicates": duplicates}
+
+
+def parse_shard(value):
+    # "i/N", e.g. --shard 0/4 for the first of four shards
+    try:
+        index, num_shards = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected i/N, got {value}")
+    if not 0 <= index < num_shards:
+        raise argparse.ArgumentTypeError(f"Shard index must be in [0, {num_shards})")
+    return index, num_shards
+
+
+def merge_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="benchmark.py merge",
+        description="Merge the result files of sharded runs",
+    )
+    parser.add_argument("result_files", nargs="+", help="Shard result JSONL files")
+    parser.add_argument(
+        "--output_file",
+        required=True,
+        help="Path of the merged results JSONL file",
+    )
+    parser.add_argument(
+        "--input_file",
+        help="Dataset the shards were run on, to check for missing rows",
+    )
+    parser.add_argument(
+        "--num_shards",
+        type=int,
+        default=None,
+        help="Number of shards N the dataset was split into",
+    )
+    parser.add_argument(
+        "--few_shot",
+        type=int,
+        default=1,
+        help="Number of fewshot examples the shards were run with (default: 1)",
+    )
+    parser.add_argument(
+        "--layout",
+        default="default",
+        help="Layout the shards were run with (default: default)",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=None,
+        help="--limit the shards were run with, applied per shard",
+    )
+    parser.add_argument(
+        "--offset",
+        type=int,
+        default=0,
+        help="--offset the shards were run with, applied per shard",
+    )
+    args = parser.parse_args(argv)
+    merge_results(
+        args.result_files,
+        args.output_file,
+        input_file=args.input_file,
+        num_shards=args.num_shards,
+        few_shot=args.few_shot,
+        layout=args.layout,
+        limit=args.limit,
+        offset=args.offset,
+    )
 
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["merge"]:
+        merge_main(sys.argv[2:])
+        sys.exit()
+
     parser = argparse.ArgumentParser(
         description="Run benchmark for a specific model",
     )
     parser.add_argument(
         "model_name",
-        choices=MODEL_CONFIGS.keys(),
-        help="Name of the model to benchmark",
+        nargs="+",
+        choices=[*MODEL_CONFIGS.keys(), "all"],
+        help="Name of the model to benchmark; several names (or 'all') run a "
+        "concurrent sweep that loads the dataset and builds shared prompts once",
     )
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument("--input_file", help="Path to the input JSONL file")
@@ -171,7 +749,83 @@ if __name__ == "__main__":
         "--max_workers",
         type=int,
         default=16,
-        help="Maximum number of worker threads (default: 16)",
+        help="Maximum number of worker threads, or rows in flight per provider with --engine async (default: 16)",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["thread", "async"],
+        default="thread",
+        help="Execution engine: thread pool or asyncio event loop (default: thread)",
+    )
+    parser.add_argument(
+        "--adaptive_concurrency",
+        action="store_true",
+        help="Adapt requests in flight per api_base to latency, 429s and 5xx responses, up to --max_workers",
+    )
+    parser.add_argument(
+        "--initial_concurrency",
+        type=int,
+        default=8,
+        help="Starting concurrency for --adaptive_concurrency (default: 8)",
+    )
+    parser.add_argument(
+        "--resume",
+        type=str,
+        default=None,
+        help="Append to this results file, skipping rows it already contains",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Reuse responses from the on-disk response cache; rows answered "
+        "from it are flagged and left out of latency and throughput figures",
+    )
+    parser.add_argument(
+        "--cache_path",
+        type=str,
+        default="cache/responses.sqlite",
+        help="SQLite file of the response cache (default: cache/responses.sqlite)",
+    )
+    parser.add_argument(
+        "--cache_max_size_mb",
+        type=int,
+        default=2048,
+        help="Evict least recently used responses above this size (default: 2048)",
+    )
+    parser.add_argument(
+        "--cache_max_age_days",
+        type=float,
+        default=30,
+        help="Evict responses older than this many days (default: 30)",
+    )
+    parser.add_argument(
+        "--image_cache_mb",
+        type=int,
+        default=512,
+        help="Memory budget of the in-process cache of base64 encoded images (default: 512)",
+    )
+    parser.add_argument(
+        "--image_max_long_edge",
+        type=int,
+        default=None,
+        help="Downscale images so their longest side is at most this many pixels",
+    )
+    parser.add_argument(
+        "--image_format",
+        choices=["jpeg", "webp", "png"],
+        default=None,
+        help="Re-encode images to this format before sending (default: keep original)",
+    )
+    parser.add_argument(
+        "--image_quality",
+        type=int,
+        default=85,
+        help="JPEG/WebP quality used when re-encoding images (default: 85)",
+    )
+    parser.add_argument(
+        "--image_grayscale",
+        action="store_true",
+        help="Convert images to grayscale before sending",
     )
     parser.add_argument(
         "--few_shot",
@@ -189,7 +843,185 @@ if __name__ == "__main__":
         "--conf_score_method",
         type=str,
         default="prob",
-        help="Confidence score method (default: prob, yes_no, nanonets, consistency)",
+        help="Confidence score method (default: prob, yes_no, nanonets, consistency, logprob)",
+    )
+    parser.add_argument(
+        "--consistency_batch_size",
+        type=int,
+        default=2,
+        help="Consistency samples drawn before checking whether the rest are "
+        "needed, which then come in one more request; 5 draws them all at once "
+        "(default: 2)",
+    )
+    parser.add_argument(
+        "--batch_export",
+        type=str,
+        default=None,
+        help="Write every prediction request to this provider batch JSONL file "
+        "instead of calling the model",
+    )
+    parser.add_argument(
+        "--batch_fake_results",
+        type=str,
+        default=None,
+        help="With --batch_export, also write an offline batch result file "
+        "answered from the annotations",
+    )
+    parser.add_argument(
+        "--batch_ingest",
+        type=str,
+        default=None,
+        help="Score the responses of a provider batch result file instead of "
+        "calling the model",
+    )
+    parser.add_argument(
+        "--dry_run",
+        action="store_true",
+        help="Build the prompt of every row and report estimated tokens, payload "
+        "bytes, prompts/sec and peak memory, without calling the model",
+    )
+    parser.add_argument(
+        "--mock",
+        action="store_true",
+        help="Answer requests from the annotations with an in-process mock "
+        "instead of the model, to measure the harness' own throughput",
+    )
+    parser.add_argument(
+        "--mock_latency",
+        type=str,
+        default="const:0",
+        help="Mock latency distribution in seconds: const:S, uniform:LOW:HIGH, "
+        "exp:MEAN or lognormal:MEDIAN:SIGMA (default: const:0)",
+    )
+    parser.add_argument(
+        "--mock_error_rate",
+        type=float,
+        default=0.0,
+        help="Fraction of mock requests failing with HTTP 500 (default: 0)",
+    )
+    parser.add_argument(
+        "--mock_rate_limit_rate",
+        type=float,
+        default=0.0,
+        help="Fraction of mock requests failing with HTTP 429 (default: 0)",
+    )
+    parser.add_argument(
+        "--mock_field_error_rate",
+        type=float,
+        default=0.0,
+        help="Fraction of mock answer fields that differ from the annotation "
+        "(default: 0)",
+    )
+    parser.add_argument(
+        "--mock_tokens_per_second",
+        type=float,
+        default=None,
+        help="Decode speed of streamed mock responses (default: unlimited)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream responses to measure time to first token, inter-token "
+        "latency and output tokens/sec",
+    )
+    parser.add_argument(
+        "--max_tokens_budget",
+        type=int,
+        default=None,
+        help="Stop starting new rows once this many prompt + completion tokens "
+        "are spent or in flight, per model (default: unlimited)",
+    )
+    parser.add_argument(
+        "--max_cost",
+        type=float,
+        default=None,
+        help="Stop starting new rows once this many USD are spent or in flight, "
+        "per model, from the prices in MODEL_CONFIGS (default: unlimited)",
+    )
+    parser.add_argument(
+        "--metrics_port",
+        type=int,
+        default=None,
+        help="Serve live Prometheus metrics of the run on this port (/metrics)",
+    )
+    parser.add_argument(
+        "--status_file",
+        type=str,
+        default=None,
+        help="Periodically rewrite a JSON file with the live metrics of the run",
+    )
+    parser.add_argument(
+        "--status_interval",
+        type=float,
+        default=10.0,
+        help="Seconds between rewrites of --status_file (default: 10)",
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="Send a duplicate of requests outstanding longer than the running "
+        "--hedge_quantile latency of the model; the first response wins",
+    )
+    parser.add_argument(
+        "--hedge_quantile",
+        type=float,
+        default=0.95,
+        help="Latency quantile after which a request is hedged (default: 0.95)",
+    )
+    parser.add_argument(
+        "--max_retries",
+        type=int,
+        default=10,
+        help="Retries of a request on 429, 5xx, timeout or connection errors "
+        "(default: 10)",
+    )
+    parser.add_argument(
+        "--retry_base_delay",
+        type=float,
+        default=1.0,
+        help="Base of the jittered exponential backoff in seconds (default: 1)",
+    )
+    parser.add_argument(
+        "--retry_max_delay",
+        type=float,
+        default=60.0,
+        help="Upper bound of the backoff in seconds; Retry-After is always "
+        "honored (default: 60)",
+    )
+    parser.add_argument(
+        "--request_timeout",
+        type=float,
+        default=None,
+        help="Time budget of a request in seconds, retries included "
+        "(default: unbounded)",
+    )
+    parser.add_argument(
+        "--run_timeout",
+        type=float,
+        default=None,
+        help="Seconds after which no request is sent or retried; unfinished "
+        "rows can be completed with --resume (default: unbounded)",
+    )
+    parser.add_argument(
+        "--postprocess_workers",
+        type=int,
+        default=0,
+        help="Parse and score answers in this many worker processes instead of "
+        "on the threads or event loop waiting on the API (default: 0)",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=None,
+        help="Only run shard i of N, e.g. 0/4; rows are assigned by hashing their "
+        "image path and queried labels, so every host gets the same split",
+    )
+    parser.add_argument(
+        "--load_balancing",
+        choices=BALANCING_POLICIES,
+        default="least_outstanding",
+        help="Routing across the replicas of an api_base given as a list of URLs "
+        "(default: least_outstanding)",
     )
     parser.add_argument(
         "--limit",
@@ -197,20 +1029,86 @@ if __name__ == "__main__":
         default=None,
         help="Number of samples to process",
     )
+    parser.add_argument(
+        "--offset",
+        type=int,
+        default=0,
+        help="Number of samples to skip from the start of the input file (default: 0)",
+    )
     args = parser.parse_args()
+    model_names = (
+        [name for name in MODEL_CONFIGS if name in available_models]
+        if "all" in args.model_name
+        else list(dict.fromkeys(args.model_name))
+    )
+    if len(model_names) > 1 and (args.resume or args.batch_export or args.batch_ingest):
+        parser.error("--resume and the batch options take a single model")
+    if (
+        args.batch_export or args.batch_ingest
+    ) and args.conf_score_method in UNBATCHABLE_CONF_SCORE_METHODS:
+        parser.error(
+            f"--conf_score_method {args.conf_score_method} needs a second request "
+            "per row and cannot be batched, pass --conf_score_method consistency "
+            "or logprob with --batch_export and --batch_ingest",
+        )
 
     logger.info("Starting benchmark script")
     logger.info(f"Arguments: {args}")
 
     try:
-        run_benchmark(
-            args.model_name,
+        run = (
+            partial(run_benchmark, model_names[0])
+            if len(model_names) == 1
+            else partial(run_sweep, model_names)
+        )
+        run(
             input_file=args.input_file,
             max_workers=args.max_workers,
             few_shot=args.few_shot,
             layout=args.layout,
             conf_score_method=args.conf_score_method,
             limit=args.limit,
+            offset=args.offset,
+            engine=args.engine,
+            adaptive_concurrency=args.adaptive_concurrency,
+            initial_concurrency=args.initial_concurrency,
+            use_cache=args.cache,
+            cache_path=args.cache_path,
+            cache_max_size_mb=args.cache_max_size_mb,
+            cache_max_age_days=args.cache_max_age_days,
+            resume=args.resume,
+            image_cache_mb=args.image_cache_mb,
+            image_max_long_edge=args.image_max_long_edge,
+            image_format=args.image_format,
+            image_quality=args.image_quality,
+            image_grayscale=args.image_grayscale,
+            consistency_batch_size=args.consistency_batch_size,
+            batch_export=args.batch_export,
+            batch_fake_results=args.batch_fake_results,
+            batch_ingest=args.batch_ingest,
+            dry_run=args.dry_run,
+            mock=args.mock,
+            mock_latency=args.mock_latency,
+            mock_error_rate=args.mock_error_rate,
+            mock_rate_limit_rate=args.mock_rate_limit_rate,
+            mock_field_error_rate=args.mock_field_error_rate,
+            mock_tokens_per_second=args.mock_tokens_per_second,
+            stream=args.stream,
+            max_tokens_budget=args.max_tokens_budget,
+            max_cost=args.max_cost,
+            metrics_port=args.metrics_port,
+            status_file=args.status_file,
+            status_interval=args.status_interval,
+            hedge=args.hedge,
+            hedge_quantile=args.hedge_quantile,
+            max_retries=args.max_retries,
+            retry_base_delay=args.retry_base_delay,
+            retry_max_delay=args.retry_max_delay,
+            request_timeout=args.request_timeout,
+            run_timeout=args.run_timeout,
+            load_balancing=args.load_balancing,
+            shard=args.shard,
+            postprocess_workers=args.postprocess_workers,
         )
     except Exception as e:
         logger.exception("An error occurred during benchmark execution")